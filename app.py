@@ -1,7 +1,7 @@
 # %%
 # app.py - Main Dashboard Application
 import dash
-from dash import dcc, html, Input, Output, callback
+from dash import dcc, html, Input, Output, State, Patch, callback, clientside_callback
 import traceback
 import plotly.graph_objects as go
 import sys
@@ -9,37 +9,106 @@ import sys
 # Try to import custom modules with error handling
 import dash_bootstrap_components as dbc
 import dataloader
+import figure_encoding
 import gen_graph
+import geometry
+from slice_index import SliceIndex
+from olap_cube import AggregationCube
+from joinpoint import JoinpointEngine
+from rank_engine import RankTable
+from figure_cache import disk_cache, figure_cache, make_figure_key, load_bundle
+from figure_pool import FigurePool
+from jobs import JobQueue, JobStore
 import base64
+import functools
+import threading
+from types import SimpleNamespace
 import os
 import pandas as pd
 
 
 # %%
-#load data
-asr1=dataloader.load_thai_asr_data()
-asr2= dataloader.load_thai_asr_age_data()
-asr3=dataloader.load_region_data()
-surv= dataloader.load_survival_data()
-prov_hr=dataloader.load_prov_data()
+_data_lock = threading.Lock()
 
-#load filter options
-fig1_option = dataloader.get_dropdown_options(asr1)
-fig1_option.pop('years', None)
 
-fig2_option = dataloader.get_dropdown_options(asr2)
-fig2_option.pop('years', None)
-fig2_option.pop('age_groups', None)
-fig2_option.pop('sex_options', None)
+def get_data():
+    """
+    Load every dataset and build the structures the figures are served from
 
-fig3_option = dataloader.get_dropdown_options(asr1)
-fig3_option.pop('sex_options', None)
-fig3_option.pop('cancer_types', None)
+    Runs once per process on first use (first request, prerender.py or a
+    preloading server) instead of at import time. Thread-safe: concurrent
+    first requests wait for a single load. The result is shared and read-only;
+    per-user state lives in the browser (dcc.Store), not here.
 
-fig4_option = dataloader.get_dropdown_options(asr3)
-fig4_option.pop('health_regions', None)
+    Returns:
+        types.SimpleNamespace: Datasets, slice indexes, aggregation cubes,
+        trend models, dataset version, prerendered bundle and filter options
+    """
+    with _data_lock:
+        return _load_data()
+
+
+@functools.lru_cache(maxsize=None)
+def _load_data():
+    #load data
+    asr1=dataloader.load_thai_asr_data()
+    asr2= dataloader.load_thai_asr_age_data()
+    asr3=dataloader.load_region_data()
+    surv= dataloader.load_survival_data()
+    prov_hr=dataloader.load_prov_data()
+    prov_region_index = dataloader.province_region_index(prov_hr)
+
+    #build slice indexes used by the graph functions
+    asr1_index = SliceIndex(asr1, [('Site',), ('Site', 'Sex'), ('Year', 'Sex')])
+    asr2_index = SliceIndex(asr2, [('Site',)])
+    asr3_index = SliceIndex(asr3, [('Site',), ('Site', 'Sex')])
+    surv_index = SliceIndex(surv, [('cancer', 'region', 'stage')])
+
+    #build aggregation cubes (roll-ups over sex, region and age group)
+    asr1_cube = AggregationCube(asr1, ['Site', 'Sex', 'Year'], 'ASR World', agg='sum')
+    asr2_cube = AggregationCube(asr2, ['Site', 'Sex', 'Year', 'Age_Group'], 'ASR', agg='mean')
+    asr3_cube = AggregationCube(asr3, ['Site', 'Sex', 'healthregion'], 'ASR World', agg='sum')
+
+    #rank every site by year and sex for the top-N view
+    asr1_ranks = RankTable(asr1)
+
+    #dataset version, part of every figure cache key
+    dataset_version = dataloader.dataset_version()
+
+    #joinpoint (APC/AAPC) models for every site/sex and site/sex/age-group series, cached per dataset version
+    asr_joinpoints = JoinpointEngine.build(asr1, dataset_version, age_df=asr2)
+
+    #prerendered figures for this dataset version (built by prerender.py), if any
+    prerendered = load_bundle(dataset_version)
+
+    #load filter options
+    fig1_option = dataloader.get_dropdown_options(asr1)
+    fig1_option.pop('years', None)
+
+    fig2_option = dataloader.get_dropdown_options(asr2)
+    fig2_option.pop('years', None)
+    fig2_option.pop('age_groups', None)
+    fig2_option.pop('sex_options', None)
+
+    fig3_option = dataloader.get_dropdown_options(asr1)
+    fig3_option.pop('sex_options', None)
+    fig3_option.pop('cancer_types', None)
+
+    fig4_option = dataloader.get_dropdown_options(asr3)
+    fig4_option.pop('health_regions', None)
+
+    fig5_option = dataloader.get_dropdown_options2(surv)
+
+    return SimpleNamespace(
+        asr1=asr1, asr2=asr2, asr3=asr3, surv=surv, prov_hr=prov_hr, prov_region_index=prov_region_index,
+        asr1_index=asr1_index, asr2_index=asr2_index, asr3_index=asr3_index, surv_index=surv_index,
+        asr1_cube=asr1_cube,
+        asr2_cube=asr2_cube, asr3_cube=asr3_cube, asr1_ranks=asr1_ranks,
+        dataset_version=dataset_version, asr_joinpoints=asr_joinpoints, prerendered=prerendered,
+        fig1_option=fig1_option, fig2_option=fig2_option, fig3_option=fig3_option,
+        fig4_option=fig4_option, fig5_option=fig5_option
+    )
 
-fig5_option = dataloader.get_dropdown_options2(surv)
 
 # %%
 def encode_image(image_path):
@@ -78,518 +147,570 @@ app.title = "Thailand Cancer Data Visualization"
 server = app.server
 
 # Define the layout for the uppermost part with responsive images
-app.layout = dbc.Container([
-    # Header section with images and title
-    dbc.Row([
-        # Left column for image1
-        dbc.Col([
-            html.Img(
-                src=image1_base64,
-                style={
-                    'width': '80%',
-                    'height': 'auto',
-                    'max-height': '150px',
-                    'max-width': '200px',
-                    'object-fit': 'contain',
-                    'border-radius': '8px',
-                    'box-shadow': '0 4px 8px rgba(0,0,0,0.1)',
-                    'margin': '0',
-                    'display': 'block'
-                },
-                className="img-fluid"
-            )
-        ], 
-        xs=12, sm=12, md=3, lg=3, xl=3,
-        className="mb-3 mb-md-0 text-center"
-        ),
+def build_layout(fig1_option, fig5_option):
+    """
+    Build the page layout
+
+    Args:
+        fig1_option (dict): Site and sex options for the sidebar filters
+        fig5_option (dict): Health region and stage options for the survival filters
+
+    Returns:
+        dash_bootstrap_components.Container: Page layout
+    """
+    return dbc.Container([
+        # Header section with images and title
+        dbc.Row([
+            # Left column for image1
+            dbc.Col([
+                html.Img(
+                    src=image1_base64,
+                    style={
+                        'width': '80%',
+                        'height': 'auto',
+                        'max-height': '150px',
+                        'max-width': '200px',
+                        'object-fit': 'contain',
+                        'border-radius': '8px',
+                        'box-shadow': '0 4px 8px rgba(0,0,0,0.1)',
+                        'margin': '0',
+                        'display': 'block'
+                    },
+                    className="img-fluid"
+                )
+            ], 
+            xs=12, sm=12, md=3, lg=3, xl=3,
+            className="mb-3 mb-md-0 text-center"
+            ),
         
-        # Center column for title
-        dbc.Col([
-            html.Div([
-                html.H3("Thailand Cancer Incidence Data Visualization Dashboard", 
-                       className="text-center mb-2",
-                       style={
-                           'font-weight': 'bold',
-                           'color': "#071625",
-                           'font-size': '2.2rem'
-                       }),
-                html.P("National Cancer Institute - Statistical Analysis and Reporting System V1.0", 
-                      className="text-center text-muted mb-0",
-                      style={'font-size': '1rem'})
-            ])
-        ], 
-        xs=12, sm=12, md=6, lg=6, xl=6,
-        className="mb-3 mb-md-0 d-flex align-items-center justify-content-center"
-        ),
+            # Center column for title
+            dbc.Col([
+                html.Div([
+                    html.H3("Thailand Cancer Incidence Data Visualization Dashboard", 
+                           className="text-center mb-2",
+                           style={
+                               'font-weight': 'bold',
+                               'color': "#071625",
+                               'font-size': '2.2rem'
+                           }),
+                    html.P("National Cancer Institute - Statistical Analysis and Reporting System V1.0", 
+                          className="text-center text-muted mb-0",
+                          style={'font-size': '1rem'})
+                ])
+            ], 
+            xs=12, sm=12, md=6, lg=6, xl=6,
+            className="mb-3 mb-md-0 d-flex align-items-center justify-content-center"
+            ),
         
-        # Right column for image2
-        dbc.Col([
-            html.Img(
-                src=image2_base64,
-                style={
-                    'width': '100%',
-                    'height': 'auto',
-                    'max-height': '250px',
-                    'max-width': '300px',
-                    'object-fit': 'contain',
-                    'border-radius': '8px',
-                    'box-shadow': '0 4px 8px rgba(0,0,0,0.1)',
-                    'margin': '0 0 0 auto',
-                    'display': 'block'
-                },
-                className="img-fluid"
+            # Right column for image2
+            dbc.Col([
+                html.Img(
+                    src=image2_base64,
+                    style={
+                        'width': '100%',
+                        'height': 'auto',
+                        'max-height': '250px',
+                        'max-width': '300px',
+                        'object-fit': 'contain',
+                        'border-radius': '8px',
+                        'box-shadow': '0 4px 8px rgba(0,0,0,0.1)',
+                        'margin': '0 0 0 auto',
+                        'display': 'block'
+                    },
+                    className="img-fluid"
+                )
+            ], 
+            xs=12, sm=12, md=3, lg=3, xl=3,
+            className="mb-3",
+            style={'text-align': 'right'} 
             )
         ], 
-        xs=12, sm=12, md=3, lg=3, xl=3,
-        className="mb-3",
-        style={'text-align': 'right'} 
-        )
-    ], 
-    className="g-3",
-    justify="center",
-    align="center"
-    ),
+        className="g-3",
+        justify="center",
+        align="center"
+        ),
+    
+        # Long horizontal bar across the page under images
+        dbc.Row([
+            dbc.Col([
+                html.Div(
+                    style={
+                        'width': '100%',
+                        'height': '4px',
+                        'background': 'linear-gradient(90deg, #007bff, #0056b3)',
+                        'margin': '20px 0',
+                        'border-radius': '2px',
+                        'box-shadow': '0 2px 4px rgba(0,123,255,0.2)'
+                    }
+                )
+            ], width=12)
+        ], className="mb-3"),
     
-    # Long horizontal bar across the page under images
-    dbc.Row([
-        dbc.Col([
-            html.Div(
+        # Horizontal Visualization Selection Buttons at top
+        dbc.Row([
+            dbc.Col([
+                html.Div([
+                    html.H5("Select Visualization", 
+                           className="text-center mb-3",
+                           style={
+                               'color': '#005eaa',
+                               'font-weight': '600',
+                               'border-bottom': '3px solid #005eaa',
+                               'padding-bottom': '10px'
+                           }),
+                
+                    # 6 Beautiful Horizontal Selection Buttons
+                    dbc.Row([
+                        dbc.Col([
+                            dbc.Button([
+                                html.Div([
+                                    html.I(className="fas fa-chart-line", style={'font-size': '1.5rem', 'color': '#007bff'}),
+                                    html.Br(),
+                                    html.Span("Cancer Trends", style={'font-size': '0.9rem', 'font-weight': '600'})
+                                ])
+                            ],
+                                id="btn-trend",
+                                color="light",
+                                className="w-100 shadow-sm",
+                                style={
+                                    'height': '85px',
+                                    'border': '2px solid #007bff',
+                                    'border-radius': '12px',
+                                    'background': 'linear-gradient(145deg, #ffffff 0%, #f8f9fa 100%)',
+                                    'transition': 'all 0.3s ease',
+                                    'display': 'flex',
+                                    'align-items': 'center',
+                                    'justify-content': 'center'
+                                }
+                            )
+                        ], xs=12, sm=6, md=4, lg=2, xl=2),
+                        dbc.Col([
+                            dbc.Button([
+                                html.Div([
+                                    html.I(className="fas fa-users", style={'font-size': '1.5rem', 'color': '#28a745'}),
+                                    html.Br(),
+                                    html.Span("Age Distribution", style={'font-size': '0.9rem', 'font-weight': '600'})
+                                ])
+                            ],
+                                id="btn-age",
+                                color="light",
+                                className="w-100 shadow-sm",
+                                style={
+                                    'height': '85px',
+                                    'border': '2px solid #28a745',
+                                    'border-radius': '12px',
+                                    'background': 'linear-gradient(145deg, #ffffff 0%, #f8f9fa 100%)',
+                                    'transition': 'all 0.3s ease',
+                                    'display': 'flex',
+                                    'align-items': 'center',
+                                    'justify-content': 'center'
+                                }
+                            )
+                        ], xs=12, sm=6, md=4, lg=2, xl=2),
+                        dbc.Col([
+                            dbc.Button([
+                                html.Div([
+                                    html.I(className="fas fa-trophy", style={'font-size': '1.5rem', 'color': '#ffc107'}),
+                                    html.Br(),
+                                    html.Span("Top 10 Cancers", style={'font-size': '0.9rem', 'font-weight': '600'})
+                                ])
+                            ],
+                                id="btn-top10",
+                                color="light",
+                                className="w-100 shadow-sm",
+                                style={
+                                    'height': '85px',
+                                    'border': '2px solid #ffc107',
+                                    'border-radius': '12px',
+                                    'background': 'linear-gradient(145deg, #ffffff 0%, #f8f9fa 100%)',
+                                    'transition': 'all 0.3s ease',
+                                    'display': 'flex',
+                                    'align-items': 'center',
+                                    'justify-content': 'center'
+                                }
+                            )
+                        ], xs=12, sm=6, md=4, lg=2, xl=2),
+                        dbc.Col([
+                            dbc.Button([
+                                html.Div([
+                                    html.I(className="fas fa-sort-amount-up", style={'font-size': '1.5rem', 'color': '#fd7e14'}),
+                                    html.Br(),
+                                    html.Span("Rank Over Time", style={'font-size': '0.9rem', 'font-weight': '600'})
+                                ])
+                            ],
+                                id="btn-rank",
+                                color="light",
+                                className="w-100 shadow-sm",
+                                style={
+                                    'height': '85px',
+                                    'border': '2px solid #fd7e14',
+                                    'border-radius': '12px',
+                                    'background': 'linear-gradient(145deg, #ffffff 0%, #f8f9fa 100%)',
+                                    'transition': 'all 0.3s ease',
+                                    'display': 'flex',
+                                    'align-items': 'center',
+                                    'justify-content': 'center'
+                                }
+                            )
+                        ], xs=12, sm=6, md=4, lg=2, xl=2),
+                        dbc.Col([
+                            dbc.Button([
+                                html.Div([
+                                    html.I(className="fas fa-map-marked-alt", style={'font-size': '1.5rem', 'color': '#17a2b8'}),
+                                    html.Br(),
+                                    html.Span("Health Regions", style={'font-size': '0.9rem', 'font-weight': '600'})
+                                ])
+                            ],
+                                id="btn-map",
+                                color="light",
+                                className="w-100 shadow-sm",
+                                style={
+                                    'height': '85px',
+                                    'border': '2px solid #17a2b8',
+                                    'border-radius': '12px',
+                                    'background': 'linear-gradient(145deg, #ffffff 0%, #f8f9fa 100%)',
+                                    'transition': 'all 0.3s ease',
+                                    'display': 'flex',
+                                    'align-items': 'center',
+                                    'justify-content': 'center'
+                                }
+                            )
+                        ], xs=12, sm=6, md=4, lg=2, xl=2),
+                        dbc.Col([
+                            dbc.Button([
+                                html.Div([
+                                    html.I(className="fas fa-heart-pulse", style={'font-size': '1.5rem', 'color': '#dc3545'}),
+                                    html.Br(),
+                                    html.Span("Survival", style={'font-size': '0.9rem', 'font-weight': '600'})
+                                ])
+                            ],
+                                id="btn-stats",
+                                color="light",
+                                className="w-100 shadow-sm",
+                                style={
+                                    'height': '85px',
+                                    'border': '2px solid #dc3545',
+                                    'border-radius': '12px',
+                                    'background': 'linear-gradient(145deg, #ffffff 0%, #f8f9fa 100%)',
+                                    'transition': 'all 0.3s ease',
+                                    'display': 'flex',
+                                    'align-items': 'center',
+                                    'justify-content': 'center'
+                                }
+                            )
+                        ], xs=12, sm=6, md=4, lg=2, xl=2),
+                        dbc.Col([
+                            dbc.Button([
+                                html.Div([
+                                    html.I(className="fas fa-skull", style={'font-size': '1.5rem', 'color': '#6f42c1'}),
+                                    html.Br(),
+                                    html.Span("Mortality", style={'font-size': '0.9rem', 'font-weight': '600'})
+                                ])
+                            ],
+                                id="btn-table",
+                                color="light",
+                                className="w-100 shadow-sm",
+                                style={
+                                    'height': '85px',
+                                    'border': '2px solid #6f42c1',
+                                    'border-radius': '12px',
+                                    'background': 'linear-gradient(145deg, #ffffff 0%, #f8f9fa 100%)',
+                                    'transition': 'all 0.3s ease',
+                                    'display': 'flex',
+                                    'align-items': 'center',
+                                    'justify-content': 'center'
+                                }
+                            )
+                        ], xs=12, sm=6, md=4, lg=2, xl=2)
+                    ], className="g-3")
+                ], 
                 style={
-                    'width': '100%',
-                    'height': '4px',
-                    'background': 'linear-gradient(90deg, #007bff, #0056b3)',
-                    'margin': '20px 0',
-                    'border-radius': '2px',
-                    'box-shadow': '0 2px 4px rgba(0,123,255,0.2)'
-                }
-            )
-        ], width=12)
-    ], className="mb-3"),
+                    'background': 'linear-gradient(145deg, #e7f2f8 0%, #d4e9f7 100%)',
+                    'padding': '2rem',
+                    'border-radius': '8px',
+                    'border': '1px solid #b3d9f2',
+                    'box-shadow': '0 2px 8px rgba(0,94,170,0.1)'
+                })
+            ], width=12)
+        ], className="mb-4"),
     
-    # Horizontal Visualization Selection Buttons at top
-    dbc.Row([
-        dbc.Col([
-            html.Div([
-                html.H5("Select Visualization", 
-                       className="text-center mb-3",
-                       style={
-                           'color': '#005eaa',
-                           'font-weight': '600',
-                           'border-bottom': '3px solid #005eaa',
-                           'padding-bottom': '10px'
-                       }),
+        # Main Visualization Section: Sidebar (20%) + Content (80%)
+        dbc.Row([
+            # Left Sidebar - 20% width with Filters
+            dbc.Col([
+                html.Div([
+                    # Filter Section
+                    html.H6("Filters", 
+                           className="text-center mb-3",
+                           style={
+                               'color': '#005eaa',
+                               'font-weight': '600',
+                               'font-size': '1rem',
+                               'border-bottom': '2px solid #005eaa',
+                               'padding-bottom': '8px'
+                           }),
                 
-                # 6 Beautiful Horizontal Selection Buttons
-                dbc.Row([
-                    dbc.Col([
-                        dbc.Button([
-                            html.Div([
-                                html.I(className="fas fa-chart-line", style={'font-size': '1.5rem', 'color': '#007bff'}),
-                                html.Br(),
-                                html.Span("Cancer Trends", style={'font-size': '0.9rem', 'font-weight': '600'})
-                            ])
-                        ],
-                            id="btn-trend",
-                            color="light",
-                            className="w-100 shadow-sm",
+                    # Filter 1 - Year
+                    html.Div(id='year-filter-container', children=[
+                        html.Label("Year:", 
+                                  style={
+                                      'font-weight': '600',
+                                      'font-size': '1rem',
+                                      'color': '#333',
+                                      'margin-bottom': '8px',
+                                      'display': 'block'
+                                  }),
+                        dcc.Dropdown(
+                            id='filter-year',
+                            options=[
+                                {'label': 'All Years', 'value': 'all'},
+                                {'label': '2020', 'value': 2020},
+                                {'label': '2019', 'value': 2019},
+                                {'label': '2018', 'value': 2018}
+                            ],
+                            value='all',
+                            clearable=False,
                             style={
-                                'height': '85px',
-                                'border': '2px solid #007bff',
-                                'border-radius': '12px',
-                                'background': 'linear-gradient(145deg, #ffffff 0%, #f8f9fa 100%)',
-                                'transition': 'all 0.3s ease',
-                                'display': 'flex',
-                                'align-items': 'center',
-                                'justify-content': 'center'
-                            }
+                                'fontSize': '16px',
+                                'minHeight': '50px'
+                            },
+                            className='custom-dropdown',
+                            optionHeight=48
                         )
-                    ], xs=12, sm=6, md=4, lg=2, xl=2),
-                    dbc.Col([
-                        dbc.Button([
-                            html.Div([
-                                html.I(className="fas fa-users", style={'font-size': '1.5rem', 'color': '#28a745'}),
-                                html.Br(),
-                                html.Span("Age Distribution", style={'font-size': '0.9rem', 'font-weight': '600'})
-                            ])
-                        ],
-                            id="btn-age",
-                            color="light",
-                            className="w-100 shadow-sm",
+                    ], className="mb-3"),
+                
+                    # Filter 2 - Cancer Site
+                    html.Div(id='site-filter-container', children=[
+                        html.Label("Cancer Site:", 
+                                  style={
+                                      'font-weight': '600',
+                                      'font-size': '1rem',
+                                      'color': '#333',
+                                      'margin-bottom': '8px',
+                                      'display': 'block'
+                                  }),
+                        dcc.Dropdown(
+                            id='filter-site',
+                            options=[
+                                {
+                                    'label': cancer_type if len(cancer_type) <= 25 else cancer_type[:22] + '...',
+                                    'value': cancer_type,
+                                    'title': cancer_type  # Full name on hover
+                                } 
+                                for cancer_type in fig1_option.get('cancer_types', [])
+                            ],
+                            value='Breast',
+                            clearable=False,
                             style={
-                                'height': '85px',
-                                'border': '2px solid #28a745',
-                                'border-radius': '12px',
-                                'background': 'linear-gradient(145deg, #ffffff 0%, #f8f9fa 100%)',
-                                'transition': 'all 0.3s ease',
-                                'display': 'flex',
-                                'align-items': 'center',
-                                'justify-content': 'center'
-                            }
+                                'fontSize': '16px',
+                                'minHeight': '50px'
+                            },
+                            className='custom-dropdown',
+                            optionHeight=48,
+                            maxHeight=280
                         )
-                    ], xs=12, sm=6, md=4, lg=2, xl=2),
-                    dbc.Col([
-                        dbc.Button([
-                            html.Div([
-                                html.I(className="fas fa-trophy", style={'font-size': '1.5rem', 'color': '#ffc107'}),
-                                html.Br(),
-                                html.Span("Top 10 Cancers", style={'font-size': '0.9rem', 'font-weight': '600'})
-                            ])
-                        ],
-                            id="btn-top10",
-                            color="light",
-                            className="w-100 shadow-sm",
+                    ], className="mb-3"),
+                
+                    # Filter 3 - Sex
+                    html.Div(id='sex-filter-container', children=[
+                        html.Label("Sex:", 
+                                  style={
+                                      'font-weight': '600',
+                                      'font-size': '1rem',
+                                      'color': '#333',
+                                      'margin-bottom': '8px',
+                                      'display': 'block'
+                                  }),
+                        dcc.Dropdown(
+                            id='filter-sex',
+                            options=[{'label': 'Both Sexes', 'value': 'Both'}] + [{'label': sex_opt, 'value': sex_opt} for sex_opt in fig1_option.get('sex_options', [])],
+                            value='Both',
+                            clearable=False,
                             style={
-                                'height': '85px',
-                                'border': '2px solid #ffc107',
-                                'border-radius': '12px',
-                                'background': 'linear-gradient(145deg, #ffffff 0%, #f8f9fa 100%)',
-                                'transition': 'all 0.3s ease',
-                                'display': 'flex',
-                                'align-items': 'center',
-                                'justify-content': 'center'
-                            }
+                                'fontSize': '15px',
+                                'minHeight': '44px'
+                            },
+                            className='custom-dropdown',
+                            optionHeight=42
                         )
-                    ], xs=12, sm=6, md=4, lg=2, xl=2),
-                    dbc.Col([
-                        dbc.Button([
-                            html.Div([
-                                html.I(className="fas fa-map-marked-alt", style={'font-size': '1.5rem', 'color': '#17a2b8'}),
-                                html.Br(),
-                                html.Span("Health Regions", style={'font-size': '0.9rem', 'font-weight': '600'})
-                            ])
-                        ],
-                            id="btn-map",
-                            color="light",
-                            className="w-100 shadow-sm",
+                    ], className="mb-3"),
+                
+                    # Filter 4 - Health Regions (for survival data)
+                    html.Div(id='region-filter-container', children=[
+                        html.Label("Health Regions:", 
+                                  style={
+                                      'font-weight': '600',
+                                      'font-size': '1rem',
+                                      'color': '#333',
+                                      'margin-bottom': '8px',
+                                      'display': 'block'
+                                  }),
+                        dcc.Dropdown(
+                            id='filter-region',
+                            options=[{'label': f'Region {region}', 'value': region} for region in fig5_option.get('health_regions', [])] + [{'label': 'All Regions', 'value': 'all'}],
+                            value=['all', '2'],
+                            multi=True,
+                            clearable=False,
+                            placeholder="Select up to 3 regions",
                             style={
-                                'height': '85px',
-                                'border': '2px solid #17a2b8',
-                                'border-radius': '12px',
-                                'background': 'linear-gradient(145deg, #ffffff 0%, #f8f9fa 100%)',
-                                'transition': 'all 0.3s ease',
-                                'display': 'flex',
-                                'align-items': 'center',
-                                'justify-content': 'center'
-                            }
+                                'fontSize': '15px',
+                                'minHeight': '44px'
+                            },
+                            className='custom-dropdown',
+                            optionHeight=42
                         )
-                    ], xs=12, sm=6, md=4, lg=2, xl=2),
-                    dbc.Col([
-                        dbc.Button([
-                            html.Div([
-                                html.I(className="fas fa-heart-pulse", style={'font-size': '1.5rem', 'color': '#dc3545'}),
-                                html.Br(),
-                                html.Span("Survival", style={'font-size': '0.9rem', 'font-weight': '600'})
-                            ])
-                        ],
-                            id="btn-stats",
-                            color="light",
-                            className="w-100 shadow-sm",
+                    ], className="mb-3"),
+                
+                    # Filter 5 - Cancer Stages (for survival data)
+                    html.Div(id='stage-filter-container', children=[
+                        html.Label("Cancer Stages:", 
+                                  style={
+                                      'font-weight': '600',
+                                      'font-size': '1rem',
+                                      'color': '#333',
+                                      'margin-bottom': '8px',
+                                      'display': 'block'
+                                  }),
+                        dcc.Dropdown(
+                            id='filter-stage',
+                            options=[{'label': stage.title(), 'value': stage} for stage in fig5_option.get('stages', [])],
+                            value=['stage1', 'stage2', 'stage3', 'stage4'],
+                            multi=True,
+                            clearable=False,
+                            placeholder="Select up to 4 stages",
                             style={
-                                'height': '85px',
-                                'border': '2px solid #dc3545',
-                                'border-radius': '12px',
-                                'background': 'linear-gradient(145deg, #ffffff 0%, #f8f9fa 100%)',
-                                'transition': 'all 0.3s ease',
-                                'display': 'flex',
-                                'align-items': 'center',
-                                'justify-content': 'center'
-                            }
+                                'fontSize': '15px',
+                                'minHeight': '44px'
+                            },
+                            className='custom-dropdown',
+                            optionHeight=42
                         )
-                    ], xs=12, sm=6, md=4, lg=2, xl=2),
-                    dbc.Col([
-                        dbc.Button([
-                            html.Div([
-                                html.I(className="fas fa-skull", style={'font-size': '1.5rem', 'color': '#6f42c1'}),
-                                html.Br(),
-                                html.Span("Mortality", style={'font-size': '0.9rem', 'font-weight': '600'})
-                            ])
-                        ],
-                            id="btn-table",
-                            color="light",
-                            className="w-100 shadow-sm",
+                    ], className="mb-3"),
+                
+                    # Apply Button
+                    html.Div([
+                        dbc.Button(
+                            "Apply Filters",
+                            id="btn-apply-filters",
+                            color="success",
+                            className="w-100",
                             style={
-                                'height': '85px',
-                                'border': '2px solid #6f42c1',
-                                'border-radius': '12px',
-                                'background': 'linear-gradient(145deg, #ffffff 0%, #f8f9fa 100%)',
-                                'transition': 'all 0.3s ease',
-                                'display': 'flex',
-                                'align-items': 'center',
-                                'justify-content': 'center'
+                                'font-weight': '600',
+                                'font-size': '0.95rem',
+                                'padding': '12px',
+                                'margin-top': '10px'
                             }
                         )
-                    ], xs=12, sm=6, md=4, lg=2, xl=2)
-                ], className="g-3")
-            ], 
-            style={
-                'background': 'linear-gradient(145deg, #e7f2f8 0%, #d4e9f7 100%)',
-                'padding': '2rem',
-                'border-radius': '8px',
-                'border': '1px solid #b3d9f2',
-                'box-shadow': '0 2px 8px rgba(0,94,170,0.1)'
-            })
-        ], width=12)
-    ], className="mb-4"),
-    
-    # Main Visualization Section: Sidebar (20%) + Content (80%)
-    dbc.Row([
-        # Left Sidebar - 20% width with Filters
-        dbc.Col([
-            html.Div([
-                # Filter Section
-                html.H6("Filters", 
-                       className="text-center mb-3",
-                       style={
-                           'color': '#005eaa',
-                           'font-weight': '600',
-                           'font-size': '1rem',
-                           'border-bottom': '2px solid #005eaa',
-                           'padding-bottom': '8px'
-                       }),
+                    ], className="mb-3")
                 
-                # Filter 1 - Year
-                html.Div(id='year-filter-container', children=[
-                    html.Label("Year:", 
-                              style={
-                                  'font-weight': '600',
-                                  'font-size': '1rem',
-                                  'color': '#333',
-                                  'margin-bottom': '8px',
-                                  'display': 'block'
-                              }),
-                    dcc.Dropdown(
-                        id='filter-year',
-                        options=[
-                            {'label': 'All Years', 'value': 'all'},
-                            {'label': '2020', 'value': 2020},
-                            {'label': '2019', 'value': 2019},
-                            {'label': '2018', 'value': 2018}
-                        ],
-                        value='all',
-                        clearable=False,
-                        style={
-                            'fontSize': '16px',
-                            'minHeight': '50px'
-                        },
-                        className='custom-dropdown',
-                        optionHeight=48
-                    )
-                ], className="mb-3"),
-                
-                # Filter 2 - Cancer Site
-                html.Div(id='site-filter-container', children=[
-                    html.Label("Cancer Site:", 
-                              style={
-                                  'font-weight': '600',
-                                  'font-size': '1rem',
-                                  'color': '#333',
-                                  'margin-bottom': '8px',
-                                  'display': 'block'
-                              }),
-                    dcc.Dropdown(
-                        id='filter-site',
-                        options=[
-                            {
-                                'label': cancer_type if len(cancer_type) <= 25 else cancer_type[:22] + '...',
-                                'value': cancer_type,
-                                'title': cancer_type  # Full name on hover
-                            } 
-                            for cancer_type in fig1_option.get('cancer_types', [])
+                ], 
+                style={
+                    'background': 'linear-gradient(145deg, #e7f2f8 0%, #d4e9f7 100%)',
+                    'padding': '1.5rem',
+                    'border-radius': '8px',
+                    'border': '1px solid #b3d9f2',
+                    'box-shadow': '0 2px 8px rgba(0,94,170,0.1)',
+                    'height': '100%',
+                    'min-height': '500px'
+                })
+            ], xs=12, sm=12, md=3, lg=3, xl=3, className="mb-3 mb-md-0"),
+        
+            # Right Content Area - Adjusted width for slightly wider filter column
+            dbc.Col([
+                html.Div([
+                    html.H5("Visualization Area", 
+                           className="text-center mb-3",
+                           style={
+                               'color': '#005eaa',
+                               'font-weight': '600'
+                           }),
+                    html.Div(
+                        id='content-area',
+                        children=[
+                            html.P("Select a visualization from the buttons above to display content here.",
+                                  className="text-center text-muted",
+                                  style={'padding': '3rem', 'font-size': '1.1rem'})
                         ],
-                        value='Breast',
-                        clearable=False,
-                        style={
-                            'fontSize': '16px',
-                            'minHeight': '50px'
-                        },
-                        className='custom-dropdown',
-                        optionHeight=48,
-                        maxHeight=280
-                    )
-                ], className="mb-3"),
-                
-                # Filter 3 - Sex
-                html.Div(id='sex-filter-container', children=[
-                    html.Label("Sex:", 
-                              style={
-                                  'font-weight': '600',
-                                  'font-size': '1rem',
-                                  'color': '#333',
-                                  'margin-bottom': '8px',
-                                  'display': 'block'
-                              }),
-                    dcc.Dropdown(
-                        id='filter-sex',
-                        options=[{'label': 'Both Sexes', 'value': 'Both'}] + [{'label': sex_opt, 'value': sex_opt} for sex_opt in fig1_option.get('sex_options', [])],
-                        value='Both',
-                        clearable=False,
-                        style={
-                            'fontSize': '15px',
-                            'minHeight': '44px'
-                        },
-                        className='custom-dropdown',
-                        optionHeight=42
-                    )
-                ], className="mb-3"),
-                
-                # Filter 4 - Health Regions (for survival data)
-                html.Div(id='region-filter-container', children=[
-                    html.Label("Health Regions:", 
-                              style={
-                                  'font-weight': '600',
-                                  'font-size': '1rem',
-                                  'color': '#333',
-                                  'margin-bottom': '8px',
-                                  'display': 'block'
-                              }),
-                    dcc.Dropdown(
-                        id='filter-region',
-                        options=[{'label': f'Region {region}', 'value': region} for region in fig5_option.get('health_regions', [])] + [{'label': 'All Regions', 'value': 'all'}],
-                        value=['all', '2'],
-                        multi=True,
-                        clearable=False,
-                        placeholder="Select up to 3 regions",
-                        style={
-                            'fontSize': '15px',
-                            'minHeight': '44px'
-                        },
-                        className='custom-dropdown',
-                        optionHeight=42
-                    )
-                ], className="mb-3"),
-                
-                # Filter 5 - Cancer Stages (for survival data)
-                html.Div(id='stage-filter-container', children=[
-                    html.Label("Cancer Stages:", 
-                              style={
-                                  'font-weight': '600',
-                                  'font-size': '1rem',
-                                  'color': '#333',
-                                  'margin-bottom': '8px',
-                                  'display': 'block'
-                              }),
-                    dcc.Dropdown(
-                        id='filter-stage',
-                        options=[{'label': stage.title(), 'value': stage} for stage in fig5_option.get('stages', [])],
-                        value=['stage1', 'stage2', 'stage3', 'stage4'],
-                        multi=True,
-                        clearable=False,
-                        placeholder="Select up to 4 stages",
-                        style={
-                            'fontSize': '15px',
-                            'minHeight': '44px'
-                        },
-                        className='custom-dropdown',
-                        optionHeight=42
-                    )
-                ], className="mb-3"),
-                
-                # Apply Button
+                        style={'min-height': '400px'}
+                    ),
+                    # Boundary level and filters the map view shows, kept across filter changes
+                    dcc.Store(id='map-level-store', data={'level': 'province'}),
+                    # Zoom and width of the map in this browser (picks the boundary resolution)
+                    dcc.Store(id='map-view'),
+                    # Visualization this browser tab is showing (Apply and filter changes re-render it)
+                    dcc.Store(id='view-state', data={'viz': 'btn-trend'})
+                ], 
+                style={
+                    'background': '#ffffff',
+                    'padding': '2rem',
+                    'border-radius': '8px',
+                    'border': '1px solid #dee2e6',
+                    'box-shadow': '0 2px 8px rgba(0,0,0,0.05)',
+                    'height': '100%',
+                    'min-height': '500px'
+                })
+            ], xs=12, sm=12, md=9, lg=9, xl=9)
+        ], className="mb-4"),
+    
+        # Visualization Description Section - Below the visualization area
+        dbc.Row([
+            dbc.Col([
                 html.Div([
-                    dbc.Button(
-                        "Apply Filters",
-                        id="btn-apply-filters",
-                        color="success",
-                        className="w-100",
-                        style={
-                            'font-weight': '600',
-                            'font-size': '0.95rem',
-                            'padding': '12px',
-                            'margin-top': '10px'
-                        }
+                    html.H5("Visualization Description", 
+                           className="text-center mb-3",
+                           style={
+                               'color': '#005eaa',
+                               'font-weight': '600'
+                           }),
+                    html.Div(
+                        id='figure-description',
+                        children=[
+                            html.Div([
+                                html.H6("📊 Cancer Trends", 
+                                       style={'color': '#005eaa', 'font-weight': '600', 'margin-bottom': '15px'}),
+                                html.P([
+                                    "Displays temporal trends of cancer incidence rates over multiple years. ",
+                                    "This visualization helps identify patterns, increasing or decreasing trends, ",
+                                    "and potential emerging concerns in cancer epidemiology."
+                                ], style={'line-height': '1.6', 'color': '#333'}),
+                                html.Hr(style={'margin': '20px 0'}),
+                                html.H6("Key Features:", style={'color': '#0071bc', 'font-weight': '600'}),
+                                html.Ul([
+                                    html.Li("Interactive line charts showing year-over-year changes"),
+                                    html.Li("Age-standardized rates (ASR) per 100,000 population"),
+                                    html.Li("Comparison across different cancer sites"),
+                                    html.Li("Statistical trend analysis and projections")
+                                ], style={'line-height': '1.8', 'color': '#555'})
+                            ], style={'padding': '20px'})
+                        ],
+                        style={'min-height': '250px'}
                     )
-                ], className="mb-3")
-                
-            ], 
-            style={
-                'background': 'linear-gradient(145deg, #e7f2f8 0%, #d4e9f7 100%)',
-                'padding': '1.5rem',
-                'border-radius': '8px',
-                'border': '1px solid #b3d9f2',
-                'box-shadow': '0 2px 8px rgba(0,94,170,0.1)',
-                'height': '100%',
-                'min-height': '500px'
-            })
-        ], xs=12, sm=12, md=3, lg=3, xl=3, className="mb-3 mb-md-0"),
-        
-        # Right Content Area - Adjusted width for slightly wider filter column
-        dbc.Col([
-            html.Div([
-                html.H5("Visualization Area", 
-                       className="text-center mb-3",
-                       style={
-                           'color': '#005eaa',
-                           'font-weight': '600'
-                       }),
-                html.Div(
-                    id='content-area',
-                    children=[
-                        html.P("Select a visualization from the buttons above to display content here.",
-                              className="text-center text-muted",
-                              style={'padding': '3rem', 'font-size': '1.1rem'})
-                    ],
-                    style={'min-height': '400px'}
-                )
-            ], 
-            style={
-                'background': '#ffffff',
-                'padding': '2rem',
-                'border-radius': '8px',
-                'border': '1px solid #dee2e6',
-                'box-shadow': '0 2px 8px rgba(0,0,0,0.05)',
-                'height': '100%',
-                'min-height': '500px'
-            })
-        ], xs=12, sm=12, md=9, lg=9, xl=9)
-    ], className="mb-4"),
-    
-    # Visualization Description Section - Below the visualization area
-    dbc.Row([
-        dbc.Col([
-            html.Div([
-                html.H5("Visualization Description", 
-                       className="text-center mb-3",
-                       style={
-                           'color': '#005eaa',
-                           'font-weight': '600'
-                       }),
-                html.Div(
-                    id='figure-description',
-                    children=[
-                        html.Div([
-                            html.H6("📊 Cancer Trends", 
-                                   style={'color': '#005eaa', 'font-weight': '600', 'margin-bottom': '15px'}),
-                            html.P([
-                                "Displays temporal trends of cancer incidence rates over multiple years. ",
-                                "This visualization helps identify patterns, increasing or decreasing trends, ",
-                                "and potential emerging concerns in cancer epidemiology."
-                            ], style={'line-height': '1.6', 'color': '#333'}),
-                            html.Hr(style={'margin': '20px 0'}),
-                            html.H6("Key Features:", style={'color': '#0071bc', 'font-weight': '600'}),
-                            html.Ul([
-                                html.Li("Interactive line charts showing year-over-year changes"),
-                                html.Li("Age-standardized rates (ASR) per 100,000 population"),
-                                html.Li("Comparison across different cancer sites"),
-                                html.Li("Statistical trend analysis and projections")
-                            ], style={'line-height': '1.8', 'color': '#555'})
-                        ], style={'padding': '20px'})
-                    ],
-                    style={'min-height': '250px'}
-                )
-            ], 
-            style={
-                'background': '#ffffff',
-                'padding': '2rem',
-                'border-radius': '8px',
-                'border': '1px solid #dee2e6',
-                'box-shadow': '0 2px 8px rgba(0,0,0,0.05)',
-                'height': '100%',
-                'min-height': '300px'
-            })
-        ], xs=12, sm=12, md=12, lg=12, xl=12, className="mb-3")
-    ], className="mb-4")
+                ], 
+                style={
+                    'background': '#ffffff',
+                    'padding': '2rem',
+                    'border-radius': '8px',
+                    'border': '1px solid #dee2e6',
+                    'box-shadow': '0 2px 8px rgba(0,0,0,0.05)',
+                    'height': '100%',
+                    'min-height': '300px'
+                })
+            ], xs=12, sm=12, md=12, lg=12, xl=12, className="mb-3")
+        ], className="mb-4")
     
-], fluid=True, className="px-3 py-4")
+    ], fluid=True, className="px-3 py-4")
+
+
+def serve_layout():
+    """Layout for a page load, with the filter options of the loaded datasets"""
+    data = get_data()
+    return build_layout(data.fig1_option, data.fig5_option)
+
+
+# Built per page load, so the datasets are only read once the first page is served.
+# Callback ids are validated against a skeleton without filter options instead.
+app.validation_layout = build_layout({}, {})
+app.layout = serve_layout
 
 
 # %%
@@ -943,11 +1064,12 @@ app.index_string = '''
      Input('btn-map', 'n_clicks'),
      Input('btn-age', 'n_clicks'),
      Input('btn-top10', 'n_clicks'),
+     Input('btn-rank', 'n_clicks'),
      Input('btn-stats', 'n_clicks'),
      Input('btn-table', 'n_clicks')],
     prevent_initial_call=True
 )
-def update_figure_description(btn_trend, btn_map, btn_age, btn_top10, btn_stats, btn_table):
+def update_figure_description(btn_trend, btn_map, btn_age, btn_top10, btn_rank, btn_stats, btn_table):
     """Update the figure description based on which button was clicked"""
     
     # Get which button triggered the callback
@@ -1034,6 +1156,22 @@ def update_figure_description(btn_trend, btn_map, btn_age, btn_top10, btn_stats,
             ], style={'line-height': '1.8', 'color': '#555'})
         ], style={'padding': '20px'}),
         
+        'btn-rank': html.Div([
+            html.H6("📶 Rank Over Time",
+                   style={'color': '#005eaa', 'font-weight': '600', 'margin-bottom': '15px'}),
+            html.P([
+                "Shows how each cancer site's rank by incidence rate shifted across the ",
+                "Cancer in Thailand volumes, so rising and falling sites stand out at a glance."
+            ], style={'line-height': '1.6', 'color': '#333'}),
+            html.Hr(style={'margin': '20px 0'}),
+            html.H6("Key Features:", style={'color': '#0071bc', 'font-weight': '600'}),
+            html.Ul([
+                html.Li("Bump chart of the top 10 sites in every volume"),
+                html.Li("Separate panels for male and female"),
+                html.Li("Hover for the ASR behind each rank")
+            ], style={'line-height': '1.8', 'color': '#555'})
+        ], style={'padding': '20px'}),
+        
         'btn-stats': html.Div([
             html.H6("📈 Statistical Analysis", 
                    style={'color': '#005eaa', 'font-weight': '600', 'margin-bottom': '15px'}),
@@ -1075,53 +1213,49 @@ def update_figure_description(btn_trend, btn_map, btn_age, btn_top10, btn_stats,
 
 
 # %%
-# Callback to dynamically update filter options based on button selection
-@callback(
-    [Output('filter-year', 'options'),
-     Output('filter-site', 'options'), 
-     Output('filter-sex', 'options'),
-     Output('filter-region', 'options'),
-     Output('filter-stage', 'options'),
-     Output('filter-year', 'value'),
-     Output('filter-site', 'value'),
-     Output('filter-sex', 'value'),
-     Output('filter-region', 'value'),
-     Output('filter-stage', 'value'),
-     Output('year-filter-container', 'style'),
-     Output('site-filter-container', 'style'),
-     Output('sex-filter-container', 'style'),
-     Output('region-filter-container', 'style'),
-     Output('stage-filter-container', 'style')],
-    [Input('btn-trend', 'n_clicks'),
-     Input('btn-map', 'n_clicks'),
-     Input('btn-age', 'n_clicks'),
-     Input('btn-top10', 'n_clicks'),
-     Input('btn-stats', 'n_clicks'),
-     Input('btn-table', 'n_clicks')],
-    prevent_initial_call=True
-)
-def update_filter_options(btn_trend, btn_map, btn_age, btn_top10, btn_stats, btn_table):
-    """Update filter options based on selected visualization using actual filter options"""
-    
-    # Get which button triggered the callback
-    ctx = dash.callback_context
-    
-    if not ctx.triggered:
-        button_id = 'btn-trend'
-    else:
-        button_id = ctx.triggered[0]['prop_id'].split('.')[0]
-    
-    print(f"🔄 Updating filters for: {button_id}")
+# Filter outputs set when a visualization is chosen (see filter_state)
+FILTER_OUTPUTS = [
+    Output('filter-year', 'options'),
+    Output('filter-site', 'options'),
+    Output('filter-sex', 'options'),
+    Output('filter-region', 'options'),
+    Output('filter-stage', 'options'),
+    Output('filter-year', 'value'),
+    Output('filter-site', 'value'),
+    Output('filter-sex', 'value'),
+    Output('filter-region', 'value'),
+    Output('filter-stage', 'value'),
+    Output('year-filter-container', 'style'),
+    Output('site-filter-container', 'style'),
+    Output('sex-filter-container', 'style'),
+    Output('region-filter-container', 'style'),
+    Output('stage-filter-container', 'style'),
+]
+
+
+def filter_state(button_id):
+    """
+    Filter options, default values and visibility for a visualization
+
+    Args:
+        button_id (str): Visualization button id
+
+    Returns:
+        tuple: Options of the year, site, sex, region and stage filters, then
+        their values, then the styles of their containers (15 items, in
+        FILTER_OUTPUTS order)
+    """
+    data = get_data()
     
     # Define filter configurations for each visualization type using your final filter options
     if button_id == 'btn-trend':
         # Cancer Trends - uses fig1_option: ['cancer_types', 'sex_options'] - NO YEAR FILTER
         year_options = []  # No year filter for trends (shows all years by default)
         site_options = [{'label': cancer_type, 'value': cancer_type} 
-                       for cancer_type in fig1_option.get('cancer_types', [])]
+                       for cancer_type in data.fig1_option.get('cancer_types', [])]
         sex_options = [{'label': 'Both Sexes', 'value': 'Both'}] + \
                      [{'label': sex_opt, 'value': sex_opt} 
-                      for sex_opt in fig1_option.get('sex_options', [])]
+                      for sex_opt in data.fig1_option.get('sex_options', [])]
         region_options = []  # No region filter for Cancer Trends
         stage_options = []   # No stage filter for Cancer Trends
         
@@ -1134,10 +1268,10 @@ def update_filter_options(btn_trend, btn_map, btn_age, btn_top10, btn_stats, btn
         # Regional Map - uses fig4_option: ['cancer_types', 'sex_options', 'years']
         year_options = []  # No year filter for map (shows all years by default)
         site_options = [{'label': cancer_type, 'value': cancer_type} 
-                       for cancer_type in fig1_option.get('cancer_types', [])]
+                       for cancer_type in data.fig1_option.get('cancer_types', [])]
         sex_options = [{'label': 'Both Sexes', 'value': 'Both'}] + \
                      [{'label': sex_opt, 'value': sex_opt} 
-                      for sex_opt in fig1_option.get('sex_options', [])]
+                      for sex_opt in data.fig1_option.get('sex_options', [])]
         region_options = []  # No region filter for map
         stage_options = []   # No stage filter for map
         
@@ -1151,7 +1285,7 @@ def update_filter_options(btn_trend, btn_map, btn_age, btn_top10, btn_stats, btn
         # Age Distribution - uses fig2_option: ['cancer_types'] only - NO YEAR OR SEX FILTER
         year_options = []  # No year filter for age animation (animation shows progression over years)
         site_options = [{'label': cancer_type, 'value': cancer_type} 
-                       for cancer_type in fig2_option.get('cancer_types', [])]
+                       for cancer_type in data.fig2_option.get('cancer_types', [])]
         sex_options = []  # No sex filter for age distribution
         region_options = []  # No region filter for age distribution
         stage_options = []   # No stage filter for age distribution
@@ -1163,24 +1297,32 @@ def update_filter_options(btn_trend, btn_map, btn_age, btn_top10, btn_stats, btn
     elif button_id == 'btn-top10':
         # Top 10 - uses fig3_option: ['years'] only (sex and cancer_types removed)
         year_options = [{'label': str(year), 'value': int(year)} 
-                       for year in fig3_option.get('years', [])]
+                       for year in data.fig3_option.get('years', [])]
         site_options = []  # No cancer site filter for Top 10 (shows all sites)
         sex_options = []   # No sex filter for Top 10 
         
         default_year = year_options[0]['value'] if year_options else 2020
-        return (year_options, site_options, sex_options, default_year, 'all', 'Both', {'display': 'block'}, {'display': 'none'}, {'display': 'none'})
+        return (year_options, site_options, sex_options, [], [],
+                default_year, None, None, [], [],
+                {'display': 'block'}, {'display': 'none'}, {'display': 'none'}, {'display': 'none'}, {'display': 'none'})
+    
+    elif button_id == 'btn-rank':
+        # Rank Over Time - all years and both sexes in one figure, no filters
+        return ([], [], [], [], [],
+                None, None, None, [], [],
+                {'display': 'none'}, {'display': 'none'}, {'display': 'none'}, {'display': 'none'}, {'display': 'none'})
     
     elif button_id == 'btn-stats':
         # Survival Analysis - uses fig5_option: ['cancer_types', 'health_regions', 'stages']
         year_options = []  # No year filter for survival data
         site_options = [{'label': cancer_type.title(), 'value': cancer_type} 
-                       for cancer_type in fig5_option.get('cancer_types', [])]
+                       for cancer_type in data.fig5_option.get('cancer_types', [])]
         sex_options = []   # No sex filter for survival data
         region_options = [{'label': f'Region {region}', 'value': region} 
-                         for region in fig5_option.get('health_regions', [])] + \
+                         for region in data.fig5_option.get('health_regions', [])] + \
                         [{'label': 'All Regions', 'value': 'all'}]
         stage_options = [{'label': stage.title(), 'value': stage} 
-                        for stage in fig5_option.get('stages', [])]
+                        for stage in data.fig5_option.get('stages', [])]
         
         # Show cancer site, region, and stage filters for survival data
         return (year_options, site_options, sex_options, region_options, stage_options,
@@ -1193,26 +1335,29 @@ def update_filter_options(btn_trend, btn_map, btn_age, btn_top10, btn_stats, btn
                        {'label': '2019', 'value': 2019}, 
                        {'label': '2018', 'value': 2018}]
         site_options = [{'label': cancer_type, 'value': cancer_type} 
-                       for cancer_type in fig1_option.get('cancer_types', [])]
+                       for cancer_type in data.fig1_option.get('cancer_types', [])]
         sex_options = [{'label': 'Both Sexes', 'value': 'Both'}] + \
                      [{'label': sex_opt, 'value': sex_opt} 
-                      for sex_opt in fig1_option.get('sex_options', [])]
+                      for sex_opt in data.fig1_option.get('sex_options', [])]
         
-        return (year_options, site_options, sex_options, 2020, 'Breast', 'Both', {'display': 'block'}, {'display': 'block'}, {'display': 'block'})
+        return (year_options, site_options, sex_options, [], [],
+                2020, 'Breast', 'Both', [], [],
+                {'display': 'block'}, {'display': 'block'}, {'display': 'block'}, {'display': 'none'}, {'display': 'none'})
     
     # Default fallback (Cancer Trends)
     year_options = [{'label': 'All Years', 'value': 'all'}]
     site_options = [{'label': cancer_type, 'value': cancer_type} 
-                   for cancer_type in fig1_option.get('cancer_types', [])]
+                   for cancer_type in data.fig1_option.get('cancer_types', [])]
     sex_options = [{'label': 'Both Sexes', 'value': 'Both'}] + \
                  [{'label': sex_opt, 'value': sex_opt} 
-                  for sex_opt in fig1_option.get('sex_options', [])]
+                  for sex_opt in data.fig1_option.get('sex_options', [])]
     
-    return (year_options, site_options, sex_options, 'all', 'Breast', 'Both', {'display': 'block'}, {'display': 'block'}, {'display': 'block'})
+    return (year_options, site_options, sex_options, [], [],
+            'all', 'Breast', 'Both', [], [],
+            {'display': 'block'}, {'display': 'block'}, {'display': 'block'}, {'display': 'none'}, {'display': 'none'})
 
 # %%
 # Simplified responsive callback - shorter version
-_last_selected_viz = 'btn-trend'
 
 # Enhanced responsive config for better web responsiveness
 RESPONSIVE_CONFIG = {
@@ -1260,133 +1405,437 @@ RESPONSIVE_LAYOUT = {
     }
 }
 
-@callback(
-    Output('content-area', 'children'),
-    [Input('btn-trend', 'n_clicks'),
-     Input('btn-map', 'n_clicks'),
-     Input('btn-age', 'n_clicks'),
-     Input('btn-top10', 'n_clicks'),
-     Input('btn-stats', 'n_clicks'),
-     Input('btn-table', 'n_clicks'),
-     Input('btn-apply-filters', 'n_clicks'),
-     Input('filter-year', 'value'),
-     Input('filter-site', 'value'),
-     Input('filter-sex', 'value'),
-     Input('filter-region', 'value'),
-     Input('filter-stage', 'value')],
-    prevent_initial_call=True
-)
-def update_content(btn_trend, btn_map, btn_age, btn_top10, btn_stats, btn_table, btn_apply, year, site, sex, regions, stages):
-    global _last_selected_viz
-    ctx = dash.callback_context
-    
-    if not ctx.triggered:
-        button_id = 'btn-trend'
-    else:
-        button_id = ctx.triggered[0]['prop_id'].split('.')[0]
-    
-    if button_id in ['btn-trend', 'btn-map', 'btn-age', 'btn-top10', 'btn-stats', 'btn-table']:
-        _last_selected_viz = button_id
-    elif button_id == 'btn-apply-filters':
-        button_id = _last_selected_viz
-    
-    print(f"Button: {button_id}, Site: {site}, Sex: {sex}")
-    
-    # Simple responsive graphs for each visualization
+def render_figure(button_id, year, site, sex, regions, stages, resolution=None):
+    """
+    Build the figure for a visualization and filter state
+
+    Args:
+        button_id (str): Visualization button id
+        year, site, sex, regions, stages: Filter values from the sidebar
+        resolution (str): Boundary resolution of the maps, defaults to map_resolution()
+
+    Returns:
+        plotly.graph_objects.Figure: Figure with the responsive layout applied
+    """
+    data = get_data()
     if button_id == 'btn-trend':
-        try:
-            fig = gen_graph.create_trend_graph_with_future_prediction(asr1, selected_sex=sex, selected_cancer=site, future_years=[2023, 2026, 2030])
-            # Apply responsive layout
-            fig.update_layout(**RESPONSIVE_LAYOUT)
-            return html.Div([
-                html.H4("📊 Cancer Trends", style={'color': '#005eaa'}),
-                dcc.Graph(
-                    figure=fig, 
-                    config=RESPONSIVE_CONFIG, 
-                    style=RESPONSIVE_STYLE,
-                    responsive=True
-                )
-            ])
-        except Exception as e:
-            return html.Div([html.H4("Error", style={'color': '#dc3545'}), html.P(str(e))])
-    
-    elif button_id == 'btn-map':
-        try:
-            fig = gen_graph.create_map_healthregion(asr3, prov_hr, site=site, sex=sex)
-            # Apply responsive layout with map-specific settings
-            map_layout = RESPONSIVE_LAYOUT.copy()
-            map_layout.update({
-                'geo': {
-                    'projection': {'type': 'mercator'},
-                    'showframe': False,
-                    'showcoastlines': True
-                }
-            })
-            fig.update_layout(**map_layout)
-            return html.Div([
-                html.H4("🗺️ Regional Map", style={'color': '#005eaa'}),
-                dcc.Graph(
-                    figure=fig, 
-                    config=RESPONSIVE_CONFIG, 
-                    style=RESPONSIVE_STYLE,
-                    responsive=True
-                )
-            ])
-        except Exception as e:
-            return html.Div([html.H4("Error", style={'color': '#dc3545'}), html.P(str(e))])
-    
+        fig = gen_graph.create_trend_graph_with_future_prediction(data.asr1, selected_sex=sex, selected_cancer=site, future_years=[2023, 2026, 2030], index=data.asr1_index, cube=data.asr1_cube, joinpoints=data.asr_joinpoints)
+        # Apply responsive layout
+        fig.update_layout(**RESPONSIVE_LAYOUT)
+    elif button_id in ('btn-map', 'map-region'):
+        resolution = resolution or map_resolution()
+        if button_id == 'map-region':
+            level, geojson = 'region', geometry.load_region_geometry(resolution)
+        else:
+            level, geojson = 'province', geometry.load_geometry(resolution)
+        fig = gen_graph.create_map_healthregion(data.asr3, data.prov_hr, site=site, sex=sex, index=data.asr3_index, cube=data.asr3_cube, region_index=data.prov_region_index,
+                                                geojson=geojson, level=level)
+        # Apply responsive layout with map-specific settings
+        map_layout = RESPONSIVE_LAYOUT.copy()
+        map_layout.update({
+            # Redrawn maps (other layer or resolution) keep the user's zoom and centre
+            'uirevision': 'map',
+            'geo': {
+                'projection': {'type': 'mercator'},
+                'showframe': False,
+                'showcoastlines': True
+            }
+        })
+        fig.update_layout(**map_layout)
     elif button_id == 'btn-age':
-        try:
-            fig = gen_graph.create_animated_age_distribution_graph(asr2, selected_cancer=site)
-            # Apply responsive layout
-            fig.update_layout(**RESPONSIVE_LAYOUT)
-            return html.Div([
-                html.H4("👥 Age Distribution", style={'color': '#005eaa'}),
-                dcc.Graph(
-                    figure=fig, 
-                    config=RESPONSIVE_CONFIG, 
-                    style=RESPONSIVE_STYLE,
-                    responsive=True
-                )
-            ])
-        except Exception as e:
-            return html.Div([html.H4("Error", style={'color': '#dc3545'}), html.P(str(e))])
-    
+        fig = gen_graph.create_animated_age_distribution_graph(data.asr2, selected_cancer=site, index=data.asr2_index, cube=data.asr2_cube, joinpoints=data.asr_joinpoints)
+        # Apply responsive layout
+        fig.update_layout(**RESPONSIVE_LAYOUT)
     elif button_id == 'btn-top10':
-        try:
-            fig = gen_graph.create_top10_cancer_bar_graph(asr1, selected_year=year)
-            # Apply responsive layout
-            fig.update_layout(**RESPONSIVE_LAYOUT)
-            return html.Div([
-                html.H4("🏆 Top 10 Cancers", style={'color': '#005eaa'}),
-                dcc.Graph(
-                    figure=fig, 
-                    config=RESPONSIVE_CONFIG, 
-                    style=RESPONSIVE_STYLE,
-                    responsive=True
-                )
-            ])
-        except Exception as e:
-            return html.Div([html.H4("Error", style={'color': '#dc3545'}), html.P(str(e))])
-    
+        fig = gen_graph.create_top10_cancer_bar_graph(data.asr1, selected_year=year, index=data.asr1_index, ranks=data.asr1_ranks)
+        # Apply responsive layout
+        fig.update_layout(**RESPONSIVE_LAYOUT)
+    elif button_id == 'btn-rank':
+        fig = gen_graph.create_rank_bump_chart(data.asr1_ranks, top_n=10)
+        # Apply responsive layout, keeping room for the site labels on the right
+        rank_layout = RESPONSIVE_LAYOUT.copy()
+        rank_layout['margin'] = dict(l=50, r=150, t=80, b=80)
+        fig.update_layout(**rank_layout)
     elif button_id == 'btn-stats':
+        fig = gen_graph.create_survival_line_plot(df=data.surv, selected_regions=regions, selected_cancer=site, selected_stages=stages, index=data.surv_index)
+        # Apply responsive layout
+        fig.update_layout(**RESPONSIVE_LAYOUT)
+    else:
+        raise ValueError(f"Unknown visualization: {button_id}")
+    return fig
+
+
+def render_figure_json(button_id, year, site, sex, regions, stages, resolution=None):
+    """Build a figure and serialize it (what the render pool workers run)"""
+    return figure_encoding.figure_to_json(render_figure(button_id, year, site, sex, regions, stages, resolution))
+
+
+# Renders run on a pool of NCIVIZ_FIGURE_PROCESSES forked worker processes
+# ('auto' = one per core, 0 = in the server process) with at most
+# NCIVIZ_FIGURE_QUEUE renders queued or running (default 4 per process). The
+# pool is started before serving: gunicorn.conf.py's post_fork, or __main__.
+def _figure_pool_from_env():
+    processes = os.environ.get('NCIVIZ_FIGURE_PROCESSES', '0')
+    processes = (os.cpu_count() or 1) if processes == 'auto' else int(processes)
+    if processes <= 0:
+        return None
+    return FigurePool(render_figure_json, processes, int(os.environ.get('NCIVIZ_FIGURE_QUEUE', '0')) or None,
+                      prepare=get_data)
+
+
+figure_pool = _figure_pool_from_env()
+
+
+class BuildCounter:
+    """
+    Counts of user actions, figure requests and actual figure renders
+
+    Every callback that answers a user action records one action; get_figure
+    records a request and, on a cache miss, a render. With one dispatcher per
+    action, requests never exceed actions. Served at /_build-stats.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {'actions': 0, 'requests': 0, 'renders': 0}
+
+    def record(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+build_counter = BuildCounter()
+
+
+def get_figure_json(button_id, year, site, sex, regions, stages, progress=None, resolution=None):
+    """
+    Return the figure JSON for a visualization, served from the figure cache when possible
+
+    Args:
+        button_id (str): Visualization button id
+        year, site, sex, regions, stages: Filter values from the sidebar
+        progress (callable): Optional ``progress(fraction, message)`` hook (background jobs)
+        resolution (str): Boundary resolution of the maps, defaults to map_resolution()
+
+    Returns:
+        str: Figure JSON
+    """
+    data = get_data()
+    build_counter.record('requests')
+    resolution = (resolution or map_resolution()) if button_id in MAP_LEVELS.values() else None
+    key = make_figure_key(button_id, data.dataset_version, year=year, site=site, sex=sex, regions=regions, stages=stages,
+                          resolution=resolution)
+
+    def build():
+        figure_json = data.prerendered.get(key) if data.prerendered is not None else None
+        if figure_json is None:
+            build_counter.record('renders')
+            if progress:
+                progress(0.1, 'Rendering figure')
+            if figure_pool is not None:
+                figure_json = figure_pool.render(button_id, year, site, sex, regions, stages, resolution=resolution)
+            else:
+                fig = render_figure(button_id, year, site, sex, regions, stages, resolution)
+                if progress:
+                    progress(0.8, 'Serializing figure')
+                figure_json = figure_encoding.figure_to_json(fig)
+        return figure_json
+
+    return figure_cache.get_or_build(key, build)
+
+
+def get_figure(button_id, year, site, sex, regions, stages, resolution=None):
+    """
+    Return the figure for a visualization, served from the figure cache when possible
+
+    Returns:
+        dict: Plotly figure as parsed JSON
+    """
+    return figure_encoding.loads(get_figure_json(button_id, year, site, sex, regions, stages, resolution=resolution))
+
+
+def cached_figure_json(button_id, year, site, sex, regions, stages, resolution=None):
+    """Return the figure JSON if it is cached or prerendered, without building it"""
+    data = get_data()
+    resolution = (resolution or map_resolution()) if button_id in MAP_LEVELS.values() else None
+    key = make_figure_key(button_id, data.dataset_version, year=year, site=site, sex=sex, regions=regions, stages=stages,
+                          resolution=resolution)
+    figure_json = figure_cache.get(key)
+    if figure_json is None and data.prerendered is not None:
+        figure_json = data.prerendered.get(key)
+    return figure_json
+
+
+# Headings shown above each cached figure
+VIZ_TITLES = {
+    'btn-trend': "📊 Cancer Trends",
+    'btn-map': "🗺️ Regional Map",
+    'btn-age': "👥 Age Distribution",
+    'btn-top10': "🏆 Top 10 Cancers",
+    'btn-rank': "📶 Rank Over Time",
+    'btn-stats': "📈 Survival Analysis",
+}
+
+# Age animations with at least this many years are streamed: the page gets the
+# latest year only and further years are fetched in batches as the slider moves
+# or the animation plays (every site with the full 2005-2020 series today)
+STREAM_MIN_FRAMES = int(os.environ.get('NCIVIZ_STREAM_MIN_FRAMES', '6'))
+STREAM_BATCH_SIZE = int(os.environ.get('NCIVIZ_STREAM_BATCH', '3'))
+# Time per year while a streamed animation plays (the animated figure's frame duration)
+STREAM_FRAME_MS = int(os.environ.get('NCIVIZ_STREAM_FRAME_MS', '3000'))
+
+# Boundaries sent with the map: the coarsest simplified layer that stays under
+# a pixel at the zoom and width the map has in the browser (the map-view store),
+# or one fixed layer when NCIVIZ_MAP_RESOLUTION is set
+MAP_RESOLUTION = os.environ.get('NCIVIZ_MAP_RESOLUTION') or None
+# Zoom the map figures open at (gen_graph.create_map_healthregion)
+MAP_ZOOM = 5
+
+
+def map_resolution(view=None):
+    """
+    Boundary resolution for a map view
+
+    Args:
+        view (dict): Contents of the map-view store: ``zoom`` and ``width`` in
+            pixels of the map shown in the browser (None before it is drawn)
+
+    Returns:
+        str: Resolution name (geometry.RESOLUTIONS)
+    """
+    if MAP_RESOLUTION:
+        return MAP_RESOLUTION
+    view = view or {}
+    return geometry.pick_resolution(view.get('zoom') or MAP_ZOOM, view.get('width'))
+
+
+def split_animation(figure, frame_name=None):
+    """
+    Turn an animated figure into a static figure showing a single frame
+
+    Args:
+        figure (dict): Plotly figure with frames (parsed JSON)
+        frame_name (str): Frame to show, defaults to the last one
+
+    Returns:
+        tuple: (figure without frames, dict of frame name -> frame)
+    """
+    frames = {frame['name']: frame for frame in figure.get('frames', [])}
+    frame_name = frame_name or list(frames)[-1]
+    layout = {k: v for k, v in figure['layout'].items() if k not in ('sliders', 'updatemenus')}
+    static = {'data': figure['data'], 'layout': layout}
+    return apply_frame(static, frames[frame_name]), frames
+
+
+def apply_frame(figure, frame):
+    """
+    Return ``figure`` with the data and annotations of an animation frame
+
+    The frame's ``traces`` list says which base trace each of its traces
+    updates; base traces it leaves out (a sex without rows that year) are shown
+    empty rather than with another year's data.
+    """
+    updates = dict(zip(frame.get('traces', range(len(frame['data']))), frame['data']))
+    data = [dict(trace, x=updates.get(i, {}).get('x', []), y=updates.get(i, {}).get('y', []))
+            for i, trace in enumerate(figure['data'])]
+    layout = dict(figure['layout'], annotations=frame.get('layout', {}).get('annotations', []))
+    return {'data': data, 'layout': layout}
+
+
+def age_stream_components(site, years, frames, figure=None):
+    """
+    Graph, animation controls, year slider and frame stores of a streamed age animation
+
+    split_animation drops the figure's own Play/Pause/Reset buttons and
+    slider (they need every frame in the browser); the same controls are
+    rebuilt here as Dash components driving the year slider.
+
+    Args:
+        site (str): Selected cancer type
+        years (list): Frame names in slider order
+        frames (dict): Frames already sent to the browser
+        figure (dict): Initial figure
+
+    Returns:
+        list: Dash components
+    """
+    button_style = {'margin-right': '8px'}
+    return [
+        html.Div([
+            dbc.Button('▶️ Play Animation', id='age-stream-play', size='sm', color='info', style=button_style),
+            dbc.Button('⏸️ Pause', id='age-stream-pause', size='sm', color='info', style=button_style),
+            dbc.Button('⏮️ Reset', id='age-stream-reset', size='sm', color='info', style=button_style),
+        ], style={'margin-bottom': '8px'}),
+        dcc.Graph(id='age-stream-graph', figure=figure or {}, config=RESPONSIVE_CONFIG,
+                  style=RESPONSIVE_STYLE, responsive=True),
+        html.Div("📅 Year:", style={'font-weight': 'bold', 'margin-top': '8px'}),
+        dcc.Slider(id='age-stream-year', min=0, max=max(len(years) - 1, 0), step=None,
+                   value=max(len(years) - 1, 0), marks={i: year for i, year in enumerate(years)}),
+        dcc.Interval(id='age-stream-timer', interval=STREAM_FRAME_MS, disabled=True),
+        dcc.Store(id='age-stream-frames', data=frames),
+        dcc.Store(id='age-stream-index', data={'site': site, 'years': years, 'loaded': list(frames)}),
+    ]
+
+
+def stream_batch(years, position, loaded, size=STREAM_BATCH_SIZE):
+    """Frames to fetch for a slider position: the selected year and its nearest unloaded neighbours"""
+    order = sorted(range(len(years)), key=lambda i: (abs(i - position), i))
+    return [years[i] for i in order if years[i] not in loaded][:size]
+
+
+def stream_controls(trigger, position, last):
+    """
+    Slider position and timer state after an animation control event
+
+    Args:
+        trigger (str): 'age-stream-play', 'age-stream-pause', 'age-stream-reset'
+            or 'age-stream-timer' (one tick while playing)
+        position (int): Current slider position
+        last (int): Last slider position
+
+    Returns:
+        tuple: (new position, whether the timer is disabled)
+    """
+    if trigger == 'age-stream-play':
+        # Like the figure's Play button, but a finished animation starts over
+        position = 0 if position >= last else position + 1
+        return position, position >= last
+    if trigger == 'age-stream-reset':
+        return 0, True
+    if trigger == 'age-stream-timer' and position < last:
+        return position + 1, position + 1 >= last
+    return position, True
+
+
+# Map boundary levels: provinces shaded by their region's value, or the
+# dissolved health-region shapes (13 features instead of 77)
+MAP_LEVELS = {'province': 'btn-map', 'region': 'map-region'}
+
+
+def map_components(level, figure=None):
+    """Boundary level selector and graph of the regional map"""
+    return [
+        dcc.RadioItems(
+            id='map-level',
+            options=[{'label': ' Provinces', 'value': 'province'},
+                     {'label': ' Health regions', 'value': 'region'}],
+            value=level,
+            inline=True,
+            inputStyle={'margin-left': '12px'},
+            style={'margin-bottom': '8px'}
+        ),
+        dcc.Graph(id='map-graph', figure=figure or {}, config=RESPONSIVE_CONFIG,
+                  style=RESPONSIVE_STYLE, responsive=True),
+    ]
+
+
+def map_patch(figure):
+    """
+    Partial update carrying only what changes between maps of one level
+
+    The boundaries stay in the browser; only the shaded values, hover data,
+    colour range and title are sent.
+
+    Args:
+        figure (dict): Map figure for the new filters (parsed JSON)
+
+    Returns:
+        dash.Patch
+    """
+    trace = figure['data'][0]
+    coloraxis = figure['layout'].get('coloraxis', {})
+    patch = Patch()
+    for name in ('locations', 'z', 'customdata'):
+        patch['data'][0][name] = trace.get(name)
+    patch['layout']['coloraxis']['cmin'] = coloraxis.get('cmin')
+    patch['layout']['coloraxis']['cmax'] = coloraxis.get('cmax')
+    patch['layout']['title']['text'] = figure['layout'].get('title', {}).get('text')
+    return patch
+
+VIZ_BUTTONS = ['btn-trend', 'btn-map', 'btn-age', 'btn-top10', 'btn-rank', 'btn-stats', 'btn-table']
+
+# Slow visualizations built as background jobs when they are not cached yet
+# (opt-in, e.g. NCIVIZ_BACKGROUND_VIZ=btn-age,btn-stats); the page shows a
+# progress bar and polls until the figure is ready. Under several worker
+# processes set NCIVIZ_DISK_CACHE too, so job records are shared and a poll
+# or cancellation can reach any worker, and NCIVIZ_FIGURE_PROCESSES, so the
+# build runs in the render pool instead of on the worker's own GIL.
+BACKGROUND_VIZ = [viz for viz in os.environ.get('NCIVIZ_BACKGROUND_VIZ', '').split(',') if viz]
+JOB_POLL_MS = int(os.environ.get('NCIVIZ_JOB_POLL_MS', '500'))
+job_queue = JobQueue(max_workers=int(os.environ.get('NCIVIZ_BACKGROUND_WORKERS', '2')),
+                     store=JobStore(disk_cache) if disk_cache is not None else None)
+
+
+def figure_filters(button_id, year, site, sex, regions, stages):
+    """Filter values a visualization is rendered with (survival selections are capped and defaulted)"""
+    if button_id == 'btn-stats':
+        regions = regions[:3] if regions and len(regions) > 3 else (regions or ['all', '2'])
+        stages = stages[:4] if stages and len(stages) > 4 else (stages or ['stage1', 'stage2', 'stage3', 'stage4'])
+    return year, site, sex, regions, stages
+
+
+def job_components(button_id, job_id, filters):
+    """Progress bar, poll timer and job store shown while a background job runs"""
+    return [
+        html.H4(VIZ_TITLES[button_id], style={'color': '#005eaa'}),
+        dbc.Progress(id='job-progress', value=0, label='Queued', striped=True, animated=True,
+                     style={'height': '24px', 'margin': '2rem 0'}),
+        dcc.Interval(id='job-poll', interval=JOB_POLL_MS),
+        dcc.Store(id='job-state', data={'id': job_id, 'viz': button_id, 'filters': list(filters)}),
+    ]
+
+
+def render_content(button_id, year, site, sex, regions, stages, map_state=None, figure=None, map_view=None):
+    """
+    Build the content area for a visualization and filter state
+
+    Args:
+        button_id (str): Visualization button id
+        year, site, sex, regions, stages: Filter values from the sidebar
+        map_state (dict): Contents of the map-level-store (map view only)
+        figure (dict): Figure already built (e.g. by a background job, at the
+            default map resolution)
+        map_view (dict): Contents of the map-view store (map view only)
+
+    Returns:
+        tuple: (content component, new map-level-store data or no_update)
+    """
+    print(f"Button: {button_id}, Site: {site}, Sex: {sex}")
+    
+    # Simple responsive graphs for each visualization
+    if button_id in VIZ_TITLES:
+        year, site, sex, regions, stages = figure_filters(button_id, year, site, sex, regions, stages)
         try:
-            selected_regions = regions[:3] if regions and len(regions) > 3 else (regions or ['all', '2'])
-            selected_stages = stages[:4] if stages and len(stages) > 4 else (stages or ['stage1', 'stage2', 'stage3', 'stage4'])
-            fig = gen_graph.create_survival_line_plot(df=surv, selected_regions=selected_regions, selected_cancer=site, selected_stages=selected_stages)
-            # Apply responsive layout
-            fig.update_layout(**RESPONSIVE_LAYOUT)
+            if button_id == 'btn-map':
+                level = (map_state or {}).get('level')
+                level = level if level in MAP_LEVELS else 'province'
+                resolution = map_resolution(None if figure else map_view)
+                figure = figure or get_figure(MAP_LEVELS[level], year, site, sex, regions, stages, resolution)
+                return (html.Div([html.H4(VIZ_TITLES[button_id], style={'color': '#005eaa'})] +
+                                 map_components(level, figure)),
+                        {'level': level, 'site': site, 'sex': sex, 'resolution': resolution})
+            figure = figure or get_figure(button_id, year, site, sex, regions, stages)
+            if button_id == 'btn-age' and len(figure.get('frames', [])) >= STREAM_MIN_FRAMES:
+                initial, frames = split_animation(figure)
+                years = list(frames)
+                return (html.Div([html.H4(VIZ_TITLES[button_id], style={'color': '#005eaa'})] +
+                                 age_stream_components(site, years, {years[-1]: frames[years[-1]]}, initial)),
+                        dash.no_update)
             return html.Div([
-                html.H4("📈 Survival Analysis", style={'color': '#005eaa'}),
+                html.H4(VIZ_TITLES[button_id], style={'color': '#005eaa'}),
                 dcc.Graph(
-                    figure=fig, 
+                    figure=figure, 
                     config=RESPONSIVE_CONFIG, 
                     style=RESPONSIVE_STYLE,
                     responsive=True
                 )
-            ])
+            ]), dash.no_update
         except Exception as e:
-            return html.Div([html.H4("Error", style={'color': '#dc3545'}), html.P(str(e))])
+            return html.Div([html.H4("Error", style={'color': '#dc3545'}), html.P(str(e))]), dash.no_update
     
     elif button_id == 'btn-table':
         return html.Div([
@@ -1398,9 +1847,255 @@ def update_content(btn_trend, btn_map, btn_age, btn_top10, btn_stats, btn_table,
                     html.Tr([html.Td("Chiang Mai"), html.Td("567"), html.Td("28.5")])
                 ])
             ], bordered=True, responsive=True)
-        ])
+        ]), dash.no_update
+    
+    return html.Div([html.P("Select a visualization", className="text-center text-muted")]), dash.no_update
+
+
+# One dispatcher per user action: a button click sets the filters and renders
+# the figure in the same round-trip (its own filter outputs do not re-trigger
+# it), a filter change or Apply re-renders the current visualization
+@callback(
+    FILTER_OUTPUTS + [
+        Output('content-area', 'children'),
+        Output('map-level-store', 'data'),
+        Output('view-state', 'data'),
+    ],
+    [Input(button, 'n_clicks') for button in VIZ_BUTTONS] + [
+        Input('btn-apply-filters', 'n_clicks'),
+        Input('filter-year', 'value'),
+        Input('filter-site', 'value'),
+        Input('filter-sex', 'value'),
+        Input('filter-region', 'value'),
+        Input('filter-stage', 'value'),
+    ],
+    State('map-level-store', 'data'),
+    State('view-state', 'data'),
+    State('map-view', 'data'),
+    prevent_initial_call=True
+)
+def dispatch(btn_trend, btn_map, btn_age, btn_top10, btn_rank, btn_stats, btn_table, btn_apply, year, site, sex, regions, stages, map_state, view_state, map_view=None):
+    # Stateless: the current view comes from this tab's view-state store
+    ctx = dash.callback_context
+    view_state = view_state or {}
     
-    return html.Div([html.P("Select a visualization", className="text-center text-muted")])
+    triggered = {item['prop_id'].split('.')[0] for item in ctx.triggered}
+    clicked = [button for button in VIZ_BUTTONS if button in triggered]
+    if clicked:
+        button_id = ctx.triggered_id if ctx.triggered_id in clicked else clicked[0]
+        print(f"🔄 Updating filters for: {button_id}")
+        filters = filter_state(button_id)
+        year, site, sex, regions, stages = filters[5:10]
+    else:
+        button_id = view_state.get('viz', 'btn-trend')
+        filters = (dash.no_update,) * len(FILTER_OUTPUTS)
+        if button_id == 'btn-map' and triggered <= {'filter-site', 'filter-sex'}:
+            # The map recolours itself in place (update_map), keeping its geometry
+            return filters + (dash.no_update, dash.no_update, dash.no_update)
+    build_counter.record('actions')
+    
+    # A job still running for this tab has been superseded
+    if view_state.get('job'):
+        job_queue.cancel(view_state['job'])
+    view_state = {'viz': button_id}
+    
+    if button_id in BACKGROUND_VIZ:
+        args = figure_filters(button_id, year, site, sex, regions, stages)
+        if cached_figure_json(button_id, *args) is None:
+            job_id = job_queue.submit(lambda progress: get_figure_json(button_id, *args, progress=progress))
+            view_state['job'] = job_id
+            return filters + (html.Div(job_components(button_id, job_id, args)), dash.no_update, view_state)
+    
+    content, map_state = render_content(button_id, year, site, sex, regions, stages, map_state, map_view=map_view)
+    return filters + (content, map_state, view_state)
+
+
+# Background jobs: poll the job of this tab and swap in the figure when ready
+@callback(
+    Output('content-area', 'children', allow_duplicate=True),
+    Output('map-level-store', 'data', allow_duplicate=True),
+    Output('view-state', 'data', allow_duplicate=True),
+    Output('job-progress', 'value'),
+    Output('job-progress', 'label'),
+    Output('job-poll', 'disabled'),
+    Input('job-poll', 'n_intervals'),
+    State('job-state', 'data'),
+    State('view-state', 'data'),
+    State('map-level-store', 'data'),
+    prevent_initial_call=True
+)
+def poll_job(n_intervals, job, view_state, map_state):
+    if not job or (view_state or {}).get('job') != job['id']:
+        # Superseded by a newer action
+        return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, True
+    button_id, filters = job['viz'], job['filters']
+    status = job_queue.status(job['id'])
+    if status is None:
+        # Unknown here and not in the shared job store (none configured, or the
+        # record expired): show the figure if it reached the cache, never rebuild
+        figure_json = cached_figure_json(button_id, *filters)
+        if figure_json is None:
+            content = html.Div([
+                html.H4(VIZ_TITLES[button_id], style={'color': '#005eaa'}),
+                html.P("This figure's background job is unknown or has expired. "
+                       "Select the visualization again to rebuild it.", className="text-muted"),
+            ])
+            return content, dash.no_update, {'viz': button_id}, dash.no_update, 'Expired', True
+        status = {'status': 'done', 'progress': 1.0, 'message': 'Done', 'result': figure_json}
+    
+    if status['status'] == 'running':
+        percent = round(100 * status['progress'])
+        return dash.no_update, dash.no_update, dash.no_update, percent, status['message'], False
+    if status['status'] == 'done':
+        content, map_state = render_content(button_id, *filters, map_state=map_state,
+                                            figure=figure_encoding.loads(status['result']))
+    elif status['status'] == 'error':
+        content = html.Div([html.H4("Error", style={'color': '#dc3545'}), html.P(status['error'])])
+        map_state = dash.no_update
+    else:
+        return dash.no_update, dash.no_update, dash.no_update, dash.no_update, status['message'], True
+    return content, map_state, {'viz': button_id}, 100, status['message'], True
+
+
+# Streamed age animation: the server sends missing frames in batches into the
+# frame store (as a Patch, so loaded frames are never re-sent) ...
+@callback(
+    Output('age-stream-frames', 'data'),
+    Output('age-stream-index', 'data'),
+    Input('age-stream-year', 'value'),
+    State('age-stream-index', 'data'),
+    prevent_initial_call=True
+)
+def stream_age_frames(position, index):
+    batch = stream_batch(index['years'], position, set(index['loaded']))
+    if not batch:
+        raise dash.exceptions.PreventUpdate
+    _, frames = split_animation(get_figure('btn-age', None, index['site'], None, None, None))
+    frames_patch = Patch()
+    for name in batch:
+        frames_patch[name] = frames[name]
+    index['loaded'] = index['loaded'] + batch
+    return frames_patch, index
+
+
+# Play/Pause/Reset move the year slider; while playing a timer advances it one
+# year per tick (the slider change then streams and shows that year)
+@callback(
+    Output('age-stream-year', 'value'),
+    Output('age-stream-timer', 'disabled'),
+    Input('age-stream-play', 'n_clicks'),
+    Input('age-stream-pause', 'n_clicks'),
+    Input('age-stream-reset', 'n_clicks'),
+    Input('age-stream-timer', 'n_intervals'),
+    State('age-stream-year', 'value'),
+    State('age-stream-index', 'data'),
+    prevent_initial_call=True
+)
+def control_age_stream(play, pause, reset, ticks, position, index):
+    return stream_controls(dash.callback_context.triggered_id, position or 0, len(index['years']) - 1)
+
+
+# ... and the browser swaps the selected frame into the graph
+clientside_callback(
+    """
+    function(position, frames, index, figure) {
+        var frame = frames && index && frames[index.years[position]];
+        if (!frame || !figure) {
+            return window.dash_clientside.no_update;
+        }
+        var traces = frame.traces || frame.data.map(function(update, k) { return k; });
+        var data = figure.data.map(function(trace, i) {
+            var k = traces.indexOf(i);
+            var update = k >= 0 ? frame.data[k] : {x: [], y: [], customdata: []};
+            var points = {x: update.x, y: update.y};
+            if (update.customdata) {
+                points.customdata = update.customdata;
+            }
+            return Object.assign({}, trace, points);
+        });
+        var annotations = (frame.layout && frame.layout.annotations) || [];
+        return Object.assign({}, figure, {data: data, layout: Object.assign({}, figure.layout, {annotations: annotations})});
+    }
+    """,
+    Output('age-stream-graph', 'figure'),
+    Input('age-stream-year', 'value'),
+    Input('age-stream-frames', 'data'),
+    State('age-stream-index', 'data'),
+    State('age-stream-graph', 'figure'),
+    prevent_initial_call=True
+)
+
+# The browser reports the map's zoom and width whenever the user zooms or the
+# graph is resized ...
+clientside_callback(
+    """
+    function(relayout, view) {
+        var graph = document.getElementById('map-graph');
+        var plot = graph && graph.querySelector('.js-plotly-plot');
+        var zoom = (relayout && relayout['map.zoom']) ||
+                   (plot && plot.layout && plot.layout.map && plot.layout.map.zoom);
+        var next = {
+            zoom: zoom ? Math.round(zoom * 10) / 10 : null,
+            width: graph ? Math.round(graph.getBoundingClientRect().width) : null
+        };
+        if (view && view.zoom === next.zoom && view.width === next.width) {
+            return window.dash_clientside.no_update;
+        }
+        return next;
+    }
+    """,
+    Output('map-view', 'data'),
+    Input('map-graph', 'relayoutData'),
+    State('map-view', 'data')
+)
+
+# ... and switching the map's boundary level, or a zoom that needs another
+# boundary resolution, redraws the map with the current filters (keeping the
+# user's zoom); a site or sex change only patches the colours of the map
+# already shown. The store records what the map shows, so the filter values
+# the dispatcher sets together with a freshly rendered map do not trigger a
+# second build here.
+@callback(
+    Output('map-graph', 'figure'),
+    Output('map-level-store', 'data', allow_duplicate=True),
+    Input('map-level', 'value'),
+    Input('filter-site', 'value'),
+    Input('filter-sex', 'value'),
+    Input('map-view', 'data'),
+    State('map-level-store', 'data'),
+    prevent_initial_call=True
+)
+def update_map(level, site, sex, view, shown):
+    shown = shown or {}
+    if level not in MAP_LEVELS or not site or not sex:
+        raise dash.exceptions.PreventUpdate
+    resolution = map_resolution(view)
+    state = {'level': level, 'site': site, 'sex': sex, 'resolution': resolution}
+    if state == {name: shown.get(name) for name in state}:
+        raise dash.exceptions.PreventUpdate
+    build_counter.record('actions')
+    figure = get_figure(MAP_LEVELS[level], None, site, sex, None, None, resolution)
+    if (level, resolution) != (shown.get('level'), shown.get('resolution')):
+        return figure, state
+    return map_patch(figure), state
+
+
+# The streaming, map and job components only exist inside content-area
+app.validation_layout = html.Div([app.validation_layout] + age_stream_components('', [], {}) + map_components('province')
+                                  + job_components('btn-age', '', []))
+
+
+# Figure cache counters for monitoring
+@server.route('/_figure-cache')
+def figure_cache_stats():
+    return figure_cache.stats()
+
+
+# User actions vs figure requests and renders (see BuildCounter)
+@server.route('/_build-stats')
+def build_stats():
+    return dict(build_counter.stats(), jobs=job_queue.stats(),
+                pool=figure_pool.stats() if figure_pool is not None else None)
 
 #add datetime 
 import datetime
@@ -1414,6 +2109,12 @@ app.index_string = app.index_string.replace('</body>', '<div style="text-align:c
 # %%
 # Run the app
 if __name__ == '__main__':
+    # Load before serving, so no request thread pays for (or forks during) the build
+    get_data()
+    # Fork the render pool from the loaded data (in the serving process, not
+    # the reloader's watcher)
+    if figure_pool is not None and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        figure_pool.start()
     # Check if running in Jupyter notebook
     try:
         # Use a different port to avoid conflicts
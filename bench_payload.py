@@ -0,0 +1,85 @@
+# %%
+# bench_payload.py - Payload size and serialization time of figure responses
+#
+# Usage: python bench_payload.py [--repeat N]
+#
+# Renders one figure per visualization and serializes it with the standard
+# json engine, without and with typed arrays for numeric lists, and with
+# orjson plus typed arrays (the response path; orjson is pinned in
+# requirements.txt, and the row is left out if it is missing).
+import argparse
+import time
+
+import app
+import figure_encoding
+
+# One representative filter state per visualization
+CASES = [
+    ('btn-trend', dict(year=None, site='Breast', sex='Both', regions=None, stages=None)),
+    ('btn-map', dict(year=None, site='Breast', sex='Both', regions=None, stages=None)),
+    ('map-region', dict(year=None, site='Breast', sex='Both', regions=None, stages=None)),
+    ('btn-age', dict(year=None, site='Breast', sex=None, regions=None, stages=None)),
+    ('btn-top10', dict(year=2020, site=None, sex=None, regions=None, stages=None)),
+    ('btn-rank', dict(year=None, site=None, sex=None, regions=None, stages=None)),
+    ('btn-stats', dict(year=None, site='breast', sex=None, regions=['all', '2'],
+                       stages=['stage1', 'stage2', 'stage3', 'stage4'])),
+]
+
+
+# %%
+def _best_time(func, repeat):
+    """Best wall time of ``repeat`` calls, and the last result"""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark(repeat=5):
+    """
+    Measure every case
+
+    Args:
+        repeat (int): Timing repetitions (the best is kept)
+
+    Returns:
+        list: dicts with viz, method, bytes and ms
+    """
+    methods = {
+        'json': lambda fig: figure_encoding.figure_to_json(fig, typed_arrays=False, engine='json'),
+        'json+typed': lambda fig: figure_encoding.figure_to_json(fig, engine='json'),
+    }
+    if figure_encoding.orjson is not None:
+        methods['orjson+typed'] = lambda fig: figure_encoding.figure_to_json(fig, engine='orjson')
+    else:
+        print("orjson is not installed: only the json engine is measured (pip install -r requirements.txt)")
+    rows = []
+    for button_id, filters in CASES:
+        try:
+            fig = app.render_figure(button_id, **filters)
+        except Exception as e:
+            print(f"Error rendering {button_id}: {e}")
+            continue
+        for method, serialize in methods.items():
+            seconds, text = _best_time(lambda: serialize(fig), repeat)
+            rows.append({'viz': button_id, 'method': method, 'bytes': len(text), 'ms': seconds * 1000})
+    return rows
+
+
+def report(rows):
+    """Print the benchmark table, with sizes and times relative to plain json"""
+    baseline = {row['viz']: row for row in rows if row['method'] == 'json'}
+    print(f"{'visualization':<12} {'method':<14} {'bytes':>10} {'size':>6} {'ms':>8} {'speed':>6}")
+    for row in rows:
+        base = baseline[row['viz']]
+        print(f"{row['viz']:<12} {row['method']:<14} {row['bytes']:>10} {row['bytes'] / base['bytes']:>5.0%} "
+              f"{row['ms']:>8.2f} {base['ms'] / row['ms']:>5.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark figure serialization")
+    parser.add_argument('--repeat', type=int, default=5, help="timing repetitions per method")
+    args = parser.parse_args()
+    report(benchmark(args.repeat))
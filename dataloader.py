@@ -3,6 +3,9 @@
 import pandas as pd
 import numpy as np
 import os
+import json
+import hashlib
+import functools
 
 #folder_path = 'data/'
 #os.chdir(folder_path)
@@ -10,6 +13,226 @@ asr_file='asr_th_vol6_11.xlsx'
 asr_age_file='asr_th_vol6_11_agegroup.xlsx'
 asr_region='all_region.xlsx'
 surv_hr='surv_table_hr.xlsx'
+prov_file='provice_healthregion.xlsx'
+geojson_file='provinces.geojson'
+region_geojson_file='provinces_with_healthregion.geojson'
+
+# Columnar cache for the Excel workbooks (set NCIVIZ_CACHE_DIR='' to disable)
+cache_dir=os.environ.get('NCIVIZ_CACHE_DIR', '.cache')
+
+# Files whose content determines every figure (see dataset_version)
+dataset_files=[asr_file, asr_age_file, asr_region, surv_hr, prov_file, geojson_file, region_geojson_file]
+_signatures = {}
+
+# Shared label vocabularies. Every frame stores these columns as categoricals
+# drawn from the same vocabulary, so a label has the same integer code in all
+# datasets. Categories are only ever appended, never reordered.
+SEX_CATEGORIES = ['Female', 'Male']
+AGE_GROUPS = ['0-', '5-', '10-', '15-', '20-', '25-', '30-', '35-', '40-', '45-',
+              '50-', '55-', '60-', '65-', '70-', '75+']
+HEALTH_REGIONS = ['all'] + [str(i) for i in range(1, 14)]
+STAGES = ['stage1', 'stage2', 'stage3', 'stage4']
+
+_vocabularies = {
+    'sex': pd.CategoricalDtype(SEX_CATEGORIES),
+    'age_group': pd.CategoricalDtype(AGE_GROUPS, ordered=True),
+    'health_region': pd.CategoricalDtype(HEALTH_REGIONS),
+    'stage': pd.CategoricalDtype(STAGES),
+    'site': pd.CategoricalDtype([]),
+    'cancer': pd.CategoricalDtype([]),
+    'population': pd.CategoricalDtype([]),
+}
+
+# %%
+def _file_sha256(file_path):
+    """Return the sha256 hex digest of a file"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _source_signature(file_path, known=None):
+    """
+    Describe the current state of a source workbook
+
+    The hash is only recomputed when mtime or size differ from ``known``,
+    so an unchanged file costs a single ``stat`` call.
+
+    Args:
+        file_path (str): Path to the source file
+        known (dict): Previously stored signature, if any
+
+    Returns:
+        dict: mtime_ns, size and sha256 of the file
+    """
+    st = os.stat(file_path)
+    signature = {'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+    if known and known.get('mtime_ns') == st.st_mtime_ns and known.get('size') == st.st_size:
+        signature['sha256'] = known['sha256']
+    else:
+        signature['sha256'] = _file_sha256(file_path)
+    _signatures[os.path.abspath(file_path)] = signature
+    return signature
+
+
+def dataset_version(files=None):
+    """
+    Return a short identifier for the current content of the data files
+
+    Figures and aggregates cached under one version stay valid until any of
+    the source files changes content.
+
+    Args:
+        files (list): Files to include, defaults to ``dataset_files``
+
+    Returns:
+        str: 12 character hex digest
+    """
+    digest = hashlib.sha256()
+    for file_path in files or dataset_files:
+        known = _signatures.get(os.path.abspath(file_path))
+        digest.update(_source_signature(file_path, known)['sha256'].encode('ascii'))
+    return digest.hexdigest()[:12]
+
+
+def _cache_paths(file_path):
+    """Return the (parquet, metadata) cache paths for a source file"""
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    tag = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:8]
+    base = os.path.join(cache_dir, f'{stem}-{tag}')
+    return base + '.parquet', base + '.meta.json'
+
+
+def _write_atomic(path, write):
+    """Write a file through a temporary sibling and rename it into place"""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _dump_json(obj, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f)
+
+
+def read_columnar(file_path, columns=None):
+    """
+    Read an Excel workbook through the columnar on-disk cache
+
+    On first use the whole workbook is converted to Parquet next to a small
+    metadata file recording the source mtime, size and sha256. Later calls
+    read only ``columns`` from the Parquet file for as long as the source
+    content is unchanged. Falls back to ``pd.read_excel`` when caching is
+    disabled or pyarrow is not installed.
+
+    Args:
+        file_path (str): Path to the Excel file
+        columns (list): Columns to read, or None for all columns
+
+    Returns:
+        pandas.DataFrame: Workbook contents
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        pyarrow = None
+    if not cache_dir or pyarrow is None:
+        df = pd.read_excel(file_path, usecols=columns)
+        return df[columns] if columns is not None else df
+
+    parquet_path, meta_path = _cache_paths(file_path)
+    known = None
+    if os.path.exists(parquet_path) and os.path.exists(meta_path):
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                known = json.load(f)
+        except (OSError, ValueError):
+            known = None
+
+    signature = _source_signature(file_path, known)
+    if known and known.get('sha256') == signature['sha256']:
+        if known.get('mtime_ns') != signature['mtime_ns']:
+            # Touched but identical content: refresh metadata, keep the data
+            try:
+                _write_atomic(meta_path, lambda p: _dump_json(signature, p))
+            except OSError as e:
+                print(f"Error writing cache for {file_path}: {e}")
+        return pd.read_parquet(parquet_path, columns=columns)
+
+    df = pd.read_excel(file_path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        _write_atomic(parquet_path, lambda p: df.to_parquet(p, index=False))
+        _write_atomic(meta_path, lambda p: _dump_json(signature, p))
+    except Exception as e:
+        # Includes pyarrow conversion errors on mixed-type columns; the cache
+        # is an optimisation, so loading carries on from the Excel frame
+        print(f"Error writing cache for {file_path}: {e}")
+    return df[columns] if columns is not None else df
+
+
+def get_vocabulary(name):
+    """Return the shared categorical dtype for a label vocabulary"""
+    return _vocabularies[name]
+
+
+def _as_category(series, vocabulary):
+    """
+    Encode a label column with a shared vocabulary
+
+    Labels not yet in the vocabulary are appended to it, which keeps the codes
+    of existing labels (and of frames loaded earlier) unchanged.
+
+    Args:
+        series (pandas.Series): Label column
+        vocabulary (str): Name of the shared vocabulary
+
+    Returns:
+        pandas.Series: Categorical column using the shared dtype
+    """
+    dtype = _vocabularies[vocabulary]
+    labels = series.astype(str).str.strip()
+    unseen = [label for label in pd.unique(labels) if label not in dtype.categories]
+    if unseen:
+        dtype = pd.CategoricalDtype(list(dtype.categories) + unseen, ordered=dtype.ordered)
+        _vocabularies[vocabulary] = dtype
+    return labels.astype(dtype)
+
+
+def normalize_schema(df, categories=None, years=None, rates=None, integers=None):
+    """
+    Convert a loaded frame to the compact in-memory schema
+
+    Labels become categoricals from the shared vocabularies, years become
+    int16 and rates float32.
+
+    Args:
+        df (pandas.DataFrame): Input dataframe
+        categories (dict): Column name -> vocabulary name
+        years (list): Year columns
+        rates (list): Rate columns
+        integers (list): Other small integer columns
+
+    Returns:
+        pandas.DataFrame: Normalized dataframe with a fresh RangeIndex
+    """
+    df = df.reset_index(drop=True)
+    for column, vocabulary in (categories or {}).items():
+        df[column] = _as_category(df[column], vocabulary)
+    for column in years or []:
+        df[column] = df[column].astype('int16')
+    for column in rates or []:
+        df[column] = df[column].astype('float32')
+    for column in integers or []:
+        df[column] = df[column].astype('int16')
+    return df
+
 
 # %%
 def load_thai_asr_data(file_path=asr_file):
@@ -23,10 +246,11 @@ def load_thai_asr_data(file_path=asr_file):
         pandas.DataFrame: Loaded and processed dataframe
     """
     try:
-        df = pd.read_excel(file_path)
-        df=df[['Population', 'Sex', 'Site', 'Year', 'ASR World']]
+        df = read_columnar(file_path, columns=['Population', 'Sex', 'Site', 'Year', 'ASR World'])
         df=df[df['Population']=='Thailand']
-        df['Year'] = df['Year'].astype(str)
+        df = normalize_schema(df,
+                              categories={'Population': 'population', 'Sex': 'sex', 'Site': 'site'},
+                              years=['Year'], rates=['ASR World'])
         return df
         
     except Exception as e:
@@ -43,8 +267,10 @@ def load_thai_asr_age_data(file_path=asr_age_file):
         pandas.DataFrame: Loaded and processed dataframe
     """
     try:
-        df = pd.read_excel(file_path)
-        df['Year'] = df['Year'].astype(str)
+        df = read_columnar(file_path, columns=['Sex', 'Year', 'Site', 'Age_Group', 'ASR'])
+        df = normalize_schema(df,
+                              categories={'Sex': 'sex', 'Site': 'site', 'Age_Group': 'age_group'},
+                              years=['Year'], rates=['ASR'])
         return df
     except Exception as e:
         print(f"Error loading data: {e}")
@@ -118,19 +344,48 @@ def load_region_data(file_path=asr_region):
         pandas.DataFrame: Loaded and processed dataframe
     """
     try:
-        df = pd.read_excel(file_path)
-        df=df[['healthregion', 'Sex', 'Site', 'ASR World']]
-        df['healthregion'] = df['healthregion'].astype(str)
+        df = read_columnar(file_path, columns=['healthregion', 'Sex', 'Site', 'ASR World'])
+        df = normalize_schema(df,
+                              categories={'healthregion': 'health_region', 'Sex': 'sex', 'Site': 'site'},
+                              rates=['ASR World'])
         return df
     except Exception as e:
         print(f"Error loading data: {e}")
 
-def load_prov_data(file_path='provice_healthregion.xlsx'):
-    prov_hr=pd.read_excel(file_path)
+def load_prov_data(file_path=prov_file):
+    prov_hr=read_columnar(file_path, columns=['provine_code', 'province', 'health_region'])
     prov_hr['provine_code']=prov_hr['provine_code'].astype(str)
-    prov_hr['health_region']=prov_hr['health_region'].astype(str)       
+    prov_hr = normalize_schema(prov_hr, categories={'health_region': 'health_region'})
     return prov_hr
 
+def province_region_index(prov_hr):
+    """
+    Map every province to the position of its health region in the shared vocabulary
+    
+    Args:
+        prov_hr (pandas.DataFrame): Frame from load_prov_data
+    Returns:
+        numpy.ndarray: One integer per province row (in row order) indexing
+        get_vocabulary('health_region').categories; -1 where the region is unknown
+    """
+    regions = prov_hr['health_region']
+    if regions.dtype != get_vocabulary('health_region'):
+        regions = _as_category(regions.dropna(), 'health_region').reindex(regions.index)
+    return regions.cat.codes.to_numpy(dtype='int16')
+
+@functools.lru_cache(maxsize=None)
+def load_geojson(file_path=geojson_file):
+    """
+    Load the province boundaries, parsed on first use and memoized
+
+    Args:
+        file_path (str): Path to the GeoJSON file
+    Returns:
+        dict: GeoJSON FeatureCollection (shared; do not modify)
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
 def load_survival_data(file_path=surv_hr):
     """
     Load survival data from Excel file
@@ -142,9 +397,11 @@ def load_survival_data(file_path=surv_hr):
         pandas.DataFrame: Loaded and processed dataframe
     """
     try:
-        df = pd.read_excel(file_path)
+        df = read_columnar(file_path, columns=['time', 'region', 'cancer', 'stage', 'surv_time'])
         #df=df[['healthregion', 'Site', 'Survival Rate']]
-        df['region'] = df['region'].astype(str)
+        df = normalize_schema(df,
+                              categories={'region': 'health_region', 'cancer': 'cancer', 'stage': 'stage'},
+                              rates=['surv_time'], integers=['time'])
         return df
     except Exception as e:
         print(f"Error loading data: {e}")
@@ -0,0 +1,490 @@
+# %%
+# figure_cache.py
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Filters each visualization depends on; the others are left out of its key
+VIZ_FILTERS = {
+    'btn-trend': ('site', 'sex'),
+    'btn-map': ('site', 'sex', 'resolution'),
+    'map-region': ('site', 'sex', 'resolution'),
+    'btn-age': ('site',),
+    'btn-top10': ('year',),
+    'btn-rank': (),
+    'btn-stats': ('site', 'regions', 'stages'),
+}
+
+
+# %%
+def make_figure_key(button_id, version, year=None, site=None, sex=None, regions=None, stages=None, resolution=None):
+    """
+    Build a hashable cache key for a visualization and its filter state
+
+    Args:
+        button_id (str): Visualization button id
+        version (str): Dataset version the figure was built from
+        year, site, sex, regions, stages: Filter values from the sidebar
+        resolution (str): Boundary resolution of the maps (geometry.RESOLUTIONS)
+
+    Returns:
+        tuple: Cache key
+    """
+    filters = {'year': year, 'site': site, 'sex': sex,
+               'regions': tuple(regions) if regions else None,
+               'stages': tuple(stages) if stages else None, 'resolution': resolution}
+    used = VIZ_FILTERS.get(button_id, tuple(filters))
+    return (button_id, version) + tuple(filters[name] if name in used else None for name in filters)
+
+
+def key_filename(key):
+    """Return a stable file name for a figure cache key"""
+    return hashlib.sha1(json.dumps(list(key), default=str).encode('utf-8')).hexdigest() + '.json'
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one
+
+    The first caller for a key runs the function; callers arriving while it
+    runs wait for and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, func):
+        """Return ``func()``, shared with any concurrent call for ``key``"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class FigureCache:
+    """
+    Bounded LRU cache of serialized figure JSON
+
+    Entries are evicted least-recently-used first once the total UTF-8 size
+    of the cached JSON exceeds ``max_bytes``. Hit, miss and eviction counters are
+    kept for monitoring. Safe to share between threads. Concurrent misses for
+    the same key are built once: in-process callers share one build, and with
+    a disk level workers on the node take a per-key file lock so one builds
+    while the others wait and read its result.
+
+    Args:
+        max_bytes (int): Upper bound on the total size of cached JSON
+        disk (DiskCache): Optional second level shared by all workers on the node
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk=None):
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._flight = SingleFlight()
+
+    def get(self, key):
+        """Return the cached JSON for ``key`` or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        value = None
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self._store(key, value)
+        return value
+
+    def put(self, key, value):
+        """Store figure JSON under ``key``, evicting old entries as needed"""
+        self._store(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def _store(self, key, value):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_build(self, key, build):
+        """
+        Return the cached JSON for ``key``, building and storing it on a miss
+
+        Args:
+            key (tuple): Cache key from make_figure_key
+            build (callable): Returns the figure JSON string
+
+        Returns:
+            str: Figure JSON
+        """
+        value = self.get(key)
+        if value is None:
+            value = self._flight.do(key, lambda: self._build(key, build))
+        return value
+
+    def _build(self, key, build):
+        if self.disk is None:
+            value = build()
+            self.put(key, value)
+            return value
+        with self.disk.lock(key):
+            # Another worker may have built it while this one waited for the lock
+            value = self.disk.get(key)
+            if value is not None:
+                self._store(key, value)
+                return value
+            value = build()
+            self.put(key, value)
+            return value
+
+    def clear(self):
+        """Drop every entry (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Return the cache counters and current size"""
+        with self._lock:
+            stats = {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'coalesced': self._flight.coalesced,
+            }
+        if self.disk is not None:
+            stats['disk'] = self.disk.stats()
+        return stats
+
+
+class DiskCache:
+    """
+    SQLite-backed cache shared by every worker process on a node
+
+    Values are strings, stored UTF-8 encoded, under a namespace prefix
+    (``figure`` by default) so different kinds of entries cannot collide.
+    Each write is a single transaction, so readers never see a partial entry.
+    When the stored size exceeds ``max_bytes`` the least recently used rows
+    are deleted; a hit only rewrites an entry's access time once it is older
+    than ``touch_seconds``, so reads from all workers rarely queue for
+    SQLite's write lock. The cache is optional: a database error (locked
+    past the timeout, disk full, corrupt file) is logged and counted, and the
+    read is a miss or the write is skipped. Keys should include the dataset
+    version. The gen_graph
+    aggregates are not stored here: they are precomputed in memory at load
+    (AggregationCube, RankTable), which is cheaper than a database read.
+
+    Args:
+        path (str): SQLite database file
+        max_bytes (int): Upper bound on the total size of stored values
+        touch_seconds (float): Granularity of the access times used for eviction
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, touch_seconds=60):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.touch_seconds = touch_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                'size INTEGER NOT NULL, accessed REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+
+    def _connect(self):
+        # One connection per thread and per process (connections must not cross a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _key(key, namespace):
+        return f"{namespace}:{key if isinstance(key, str) else json.dumps(list(key), default=str)}"
+
+    def get(self, key, namespace='figure'):
+        """Return the cached string for ``key`` or None (also on a database error)"""
+        db_key = self._key(key, namespace)
+        try:
+            conn = self._connect()
+            row = conn.execute('SELECT value, accessed FROM cache WHERE key = ?', (db_key,)).fetchone()
+            now = time.time()
+            if row is not None and now - row[1] > self.touch_seconds:
+                conn.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, db_key))
+        except sqlite3.Error as e:
+            self._error('reading', e)
+            return None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            return None
+        value = row[0]
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def put(self, key, value, namespace='figure'):
+        """Store a string under ``key`` (skipped on a database error)"""
+        data = value.encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                evicted = self._write(conn, self._key(key, namespace), data)
+                conn.execute('COMMIT')
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            self._error('writing', e)
+            return
+        with self._lock:
+            self.evictions += evicted
+
+    def update(self, key, function, namespace='figure'):
+        """
+        Read, change and write the string under ``key`` in one transaction
+
+        No other process can write between the read and the write, so a change
+        merged in by ``function`` cannot be lost to a concurrent update. Keep
+        ``function`` short: it runs while holding the database's write lock.
+
+        Args:
+            key: Cache key
+            function (callable): ``function(current)`` with the stored string
+                (None when absent) returns the new string, or None to leave
+                the entry as it is
+            namespace (str): Key namespace
+
+        Returns:
+            str or None: The string written; None if nothing was written
+            (including on a database error)
+        """
+        db_key = self._key(key, namespace)
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT value FROM cache WHERE key = ?', (db_key,)).fetchone()
+                current = None if row is None else row[0]
+                current = current.decode('utf-8') if isinstance(current, bytes) else current
+                value = function(current)
+                evicted = 0
+                if value is not None:
+                    data = value.encode('utf-8')
+                    if len(data) > self.max_bytes:
+                        value = None
+                    else:
+                        evicted = self._write(conn, db_key, data)
+                conn.execute('COMMIT')
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            self._error('writing', e)
+            return None
+        with self._lock:
+            self.evictions += evicted
+        return value
+
+    def _write(self, conn, db_key, data):
+        # Inside a write transaction: store the row, then evict the least
+        # recently used rows past max_bytes; returns the number evicted
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (key, value, size, accessed) VALUES (?, ?, ?, ?)',
+            (db_key, data, len(data), time.time())
+        )
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        evicted = 0
+        while total > self.max_bytes:
+            key_, size = conn.execute(
+                'SELECT key, size FROM cache ORDER BY accessed LIMIT 1').fetchone()
+            conn.execute('DELETE FROM cache WHERE key = ?', (key_,))
+            total -= size
+            evicted += 1
+        return evicted
+
+    def _error(self, action, error):
+        print(f"Error {action} disk cache {self.path}: {error}")
+        with self._lock:
+            self.errors += 1
+
+    @contextmanager
+    def lock(self, key, namespace='figure'):
+        """
+        Exclusive per-key lock shared by every process on the node
+
+        Lock files live next to the database; without fcntl (Windows) the
+        lock is a no-op and workers may build the same figure concurrently.
+        """
+        if fcntl is None:
+            yield
+            return
+        directory = f'{self.path}.locks'
+        os.makedirs(directory, exist_ok=True)
+        name = hashlib.sha1(self._key(key, namespace).encode('utf-8')).hexdigest()
+        with open(os.path.join(directory, f'{name}.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def stats(self):
+        """Return this process's counters and the shared store size (None if unreadable)"""
+        try:
+            entries, size = self._connect().execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache').fetchone()
+        except sqlite3.Error as e:
+            self._error('reading', e)
+            entries = size = None
+        with self._lock:
+            return {
+                'path': self.path,
+                'entries': entries,
+                'bytes': size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'errors': self.errors,
+            }
+
+
+class PrerenderedBundle:
+    """
+    Read-only bundle of figure JSON written by ``prerender.py``
+
+    A bundle is a directory holding one JSON file per figure and a
+    ``manifest.json`` listing the dataset version and the keys it covers.
+
+    Args:
+        path (str): Bundle directory
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'manifest.json'), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.version = manifest['version']
+        self._files = set(manifest['files'])
+
+    def __len__(self):
+        return len(self._files)
+
+    def get(self, key):
+        """Return the prerendered JSON for ``key`` or None"""
+        filename = key_filename(key)
+        if filename not in self._files:
+            return None
+        with open(os.path.join(self.path, filename), 'r', encoding='utf-8') as f:
+            return f.read()
+
+
+def load_bundle(version, root=None):
+    """
+    Open the prerendered bundle for a dataset version, if one has been built
+
+    Args:
+        version (str): Dataset version the bundle must match
+        root (str): Bundle root, defaults to NCIVIZ_PRERENDER_DIR or 'prerendered'
+
+    Returns:
+        PrerenderedBundle or None
+    """
+    root = root or os.environ.get('NCIVIZ_PRERENDER_DIR', 'prerendered')
+    path = os.path.join(root, version)
+    if not os.path.exists(os.path.join(path, 'manifest.json')):
+        return None
+    try:
+        return PrerenderedBundle(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error loading prerendered bundle {path}: {e}")
+        return None
+
+
+def _disk_cache_from_env():
+    """Create the shared DiskCache when NCIVIZ_DISK_CACHE names a database file"""
+    path = os.environ.get('NCIVIZ_DISK_CACHE')
+    if not path:
+        return None
+    try:
+        return DiskCache(path, int(os.environ.get('NCIVIZ_DISK_CACHE_MB', '256')) * 1024 * 1024)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Disk cache disabled: {e}")
+        return None
+
+
+# Process-wide figure cache (size in MB from NCIVIZ_FIGURE_CACHE_MB). Set
+# NCIVIZ_DISK_CACHE to a file path to share rendered figures between workers.
+disk_cache = _disk_cache_from_env()
+figure_cache = FigureCache(int(os.environ.get('NCIVIZ_FIGURE_CACHE_MB', '64')) * 1024 * 1024, disk=disk_cache)
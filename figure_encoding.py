@@ -0,0 +1,143 @@
+# %%
+# figure_encoding.py
+#
+# Serialization of figure responses: numeric arrays go out as Plotly's
+# base64 typed-array spec ({"dtype", "bdata"}) and the JSON itself is written
+# with orjson when it is installed.
+import base64
+import json
+
+import numpy as np
+from plotly.io.json import to_json_plotly
+from plotly.utils import PlotlyJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON engine used for figure responses
+ENGINE = 'orjson' if orjson is not None else 'json'
+
+# Keys whose arrays plotly.js does not read as typed arrays
+SKIPPED_KEYS = frozenset(['geojson', 'layer', 'layers', 'range', 'coordinates'])
+
+# Plotly.js typed-array names of the dtypes that are encoded
+_DTYPES = {'int8': 'i1', 'uint8': 'u1', 'int16': 'i2', 'uint16': 'u2',
+           'int32': 'i4', 'uint32': 'u4', 'float32': 'f4', 'float64': 'f8'}
+
+
+# %%
+def typed_array(values, only_smaller=True):
+    """
+    Base64 typed-array spec of a numeric list
+
+    Integers are stored in the narrowest integer type that holds them; floats
+    as float64, so values are sent exactly.
+
+    Args:
+        values (list): Numbers (bools and None are not numeric)
+        only_smaller (bool): Keep the plain list when the encoding is not shorter
+
+    Returns:
+        dict or list: {'dtype', 'bdata'} spec, or ``values`` unchanged
+    """
+    if not values or not all(type(v) in (int, float) for v in values):
+        return values
+    array = np.asarray(values)
+    if array.dtype.kind == 'i':
+        low, high = array.min(), array.max()
+        for dtype in ('int8', 'int16', 'int32'):
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                array = array.astype(dtype)
+                break
+        else:
+            return values
+    spec = {'dtype': _DTYPES[str(array.dtype)], 'bdata': base64.b64encode(array).decode('ascii')}
+    if only_smaller and len(spec['bdata']) + 24 >= len(json.dumps(values)):
+        return values
+    return spec
+
+
+def encode_typed_arrays(obj, min_length=8, only_smaller=True):
+    """
+    Replace numeric lists in trace data with typed-array specs, in place
+
+    Args:
+        obj (dict or list): Trace, list of traces, or any nested part of one
+        min_length (int): Shorter lists are left as they are
+        only_smaller (bool): See typed_array
+
+    Returns:
+        The same object
+    """
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            if key in SKIPPED_KEYS:
+                continue
+            if isinstance(value, list) and len(value) >= min_length and not isinstance(value[0], (list, dict)):
+                obj[key] = typed_array(value, only_smaller)
+            else:
+                encode_typed_arrays(value, min_length, only_smaller)
+    elif isinstance(obj, list):
+        for value in obj:
+            encode_typed_arrays(value, min_length, only_smaller)
+    return obj
+
+
+def figure_to_json(fig, typed_arrays=True, engine=None):
+    """
+    Serialize a figure for the browser
+
+    Numpy arrays are already typed arrays in ``fig.to_dict()``; plain lists in
+    the traces and animation frames are encoded here as well.
+
+    Args:
+        fig (plotly.graph_objects.Figure): Figure
+        typed_arrays (bool): Encode numeric lists as typed arrays
+        engine (str): 'json' or 'orjson', defaults to ENGINE
+
+    Returns:
+        str: Figure JSON
+    """
+    figure = fig.to_dict()
+    if typed_arrays:
+        encode_typed_arrays(figure['data'])
+        for frame in figure.get('frames', []):
+            encode_typed_arrays(frame.get('data', []))
+    return dumps(figure, engine)
+
+
+def _default(obj):
+    """orjson fallback for values it does not serialize natively"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return PlotlyJSONEncoder().default(obj)
+
+
+def dumps(obj, engine=None):
+    """
+    Serialize a figure dict
+
+    With orjson the dict is written directly (NaN and infinity become null,
+    as with Plotly's encoder); Plotly's orjson engine first walks and copies
+    the whole figure, which costs more than it saves on large geometry.
+
+    Args:
+        obj (dict): Figure dict
+        engine (str): 'json' or 'orjson', defaults to ENGINE
+
+    Returns:
+        str: JSON text
+    """
+    if (engine or ENGINE) == 'orjson':
+        return orjson.dumps(obj, default=_default).decode('utf-8')
+    return to_json_plotly(obj, engine='json')
+
+
+def loads(text):
+    """Parse figure JSON"""
+    return orjson.loads(text) if orjson is not None else json.loads(text)
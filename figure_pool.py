@@ -0,0 +1,135 @@
+# %%
+# figure_pool.py
+#
+# Figure rendering on a pool of worker processes. gen_graph is pandas/Python
+# code that holds the GIL, so a single server process renders on one core;
+# the pool spreads renders over the cores of the node.
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+# %%
+def _warm(_):
+    """Report the worker pid (used to fork every worker up front)"""
+    return os.getpid()
+
+
+class FigurePool:
+    """
+    Pool of pre-warmed processes that render figures to JSON
+
+    The workers are forked from the server process by ``start`` after
+    ``prepare`` has run (typically app.get_data), so each starts with the
+    datasets, indexes and models already in memory, shared copy-on-write with
+    the parent. ``start`` must be called before serving (gunicorn's post_fork,
+    or app.py's __main__), never from a request thread. ``render`` is sent
+    to the workers by reference to the module it lives in, which the forked
+    workers already have loaded (``__main__`` under ``python app.py``), so
+    nothing is imported again. Calls return the serialized figure JSON. At
+    most ``max_queue`` renders are queued or running; further callers wait
+    for a slot.
+
+    Args:
+        render (callable): Module-level ``render(button_id, year, site, sex,
+            regions, stages, resolution)`` returning the figure JSON
+        processes (int): Worker processes, defaults to the number of cores
+        max_queue (int): Renders queued or running at once, defaults to 4 per process
+        prepare (callable): Run in the parent before the workers are forked
+    """
+
+    def __init__(self, render, processes=None, max_queue=None, prepare=None):
+        self.render_function = render
+        self.processes = processes or os.cpu_count() or 1
+        self.max_queue = max_queue or 4 * self.processes
+        self.prepare = prepare
+        self._executor = None
+        self._started = False
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_queue)
+        self._pending = 0
+        self.completed = 0
+        self.failures = 0
+        self.restarts = 0
+
+    def start(self):
+        """Fork the workers now (idempotent); returns the pool"""
+        with self._lock:
+            if self._executor is None:
+                if self.prepare is not None:
+                    self.prepare()
+                self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                     mp_context=multiprocessing.get_context('fork'))
+                list(self._executor.map(_warm, range(self.processes)))
+                self._started = True
+        return self
+
+    def render(self, button_id, year, site, sex, regions, stages, resolution=None, timeout=None):
+        """
+        Render a figure in a worker process
+
+        Args:
+            button_id (str): Visualization button id
+            year, site, sex, regions, stages: Filter values from the sidebar
+            resolution (str): Boundary resolution of the maps
+            timeout (float): Seconds to wait for the result
+
+        Returns:
+            str: Figure JSON
+        """
+        with self._lock:
+            started, executor = self._started, self._executor
+        if not started:
+            raise RuntimeError("FigurePool.start() must be called before rendering")
+        if executor is None:
+            # The pool broke (see _restart): fork a fresh one. This is the only
+            # fork from a serving thread, after a worker has died.
+            self.start()
+        with self._slots:
+            with self._lock:
+                self._pending += 1
+                executor = self._executor
+            try:
+                figure_json = executor.submit(self.render_function, button_id, year, site, sex, regions, stages,
+                                              resolution).result(timeout)
+                with self._lock:
+                    self.completed += 1
+                return figure_json
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); fork a fresh pool for the next call
+                self._restart(executor)
+                raise
+            finally:
+                with self._lock:
+                    self._pending -= 1
+
+    def _restart(self, broken):
+        with self._lock:
+            self.failures += 1
+            if self._executor is broken:
+                self._executor = None
+                self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        """Return the pool configuration and counters"""
+        with self._lock:
+            return {
+                'processes': self.processes,
+                'max_queue': self.max_queue,
+                'started': self._executor is not None,
+                'pending': self._pending,
+                'completed': self.completed,
+                'failures': self.failures,
+                'restarts': self.restarts,
+            }
+
+    def shutdown(self):
+        """Stop the workers"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._started = False
+        if executor is not None:
+            executor.shutdown()
@@ -1,28 +1,21 @@
 # %%
 # graph_functions.py
-import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
-from sklearn.linear_model import LogisticRegression
-from sklearn.preprocessing import StandardScaler
+import numpy as np
 from plotly.subplots import make_subplots
 import dataloader
-import json
-import nbformat
-import os 
+from slice_index import plain_value, select_rows
+import trend_engine
 
-#folder = 'data/'
-with open('provinces.geojson', 'r', encoding='utf-8') as f:
-    thai_geojson = json.load(f)
-prov_hr=pd.read_excel('provice_healthregion.xlsx')
-prov_hr['provine_code']=prov_hr['provine_code'].astype(str)
-prov_hr['health_region']=prov_hr['health_region'].astype(str)
+# plotly.express is imported inside the functions that use it; the province
+# GeoJSON is loaded on first use through dataloader.load_geojson()
 
 # %% [markdown]
 # ### Graph 1 
 
 # %%
-def create_trend_graph_with_future_prediction(df, selected_sex, selected_cancer, future_years=[2023, 2026]):
+def create_trend_graph_with_future_prediction(df, selected_sex, selected_cancer, future_years=[2023, 2026], index=None, cube=None, joinpoints=None):
     """
     Create ASR trend graph with predictions for future years
     
@@ -31,6 +24,11 @@ def create_trend_graph_with_future_prediction(df, selected_sex, selected_cancer,
         selected_sex (str): Selected sex filter
         selected_cancer (str): Selected cancer type filter
         future_years (list): List of future years to predict
+        index (SliceIndex): Optional index over df with Site and (Site, Sex) levels
+        cube (AggregationCube): Optional sum cube over df on Site, Sex and Year
+        joinpoints (JoinpointEngine): Optional precomputed joinpoint models; when the
+            series has one, the fit, projections and APC/AAPC come from it,
+            otherwise its stored linear fit is used
     
     Returns:
         plotly.graph_objects.Figure: Trend line graph with future predictions
@@ -42,24 +40,23 @@ def create_trend_graph_with_future_prediction(df, selected_sex, selected_cancer,
             x=0.5, y=0.5, xanchor='center', yanchor='middle',
             font=dict(size=16, color="gray")
         )
-    
-    df['Year'] = df['Year'].astype(int)
 
-    if selected_sex == 'Both':
+    if cube is not None:
+        # Per-year ASR straight from the cube; 'Both' rolls the sexes up
+        filters = {'Site': selected_cancer}
+        if selected_sex != 'Both':
+            filters['Sex'] = selected_sex
+        filtered_df = cube.lookup(by=('Year',), **filters).rename('ASR World').reset_index()
+    elif selected_sex == 'Both':
         # Filter data
-        filtered_df = df[
-            (df['Site'] == selected_cancer)
-        ].copy()
+        filtered_df = select_rows(df, index, Site=selected_cancer).copy()
         #we need to sum asr for both group by year, cancer type
-        filtered_df = filtered_df.groupby(['Year', 'Site']).agg({'ASR World': 'sum'}).reset_index()
+        filtered_df = filtered_df.groupby(['Year', 'Site'], observed=True).agg({'ASR World': 'sum'}).reset_index()
     else:
-        filtered_df = df[
-            (df['Sex'] == selected_sex) & 
-            (df['Site'] == selected_cancer)
-        ].copy()
+        filtered_df = select_rows(df, index, Sex=selected_sex, Site=selected_cancer).copy()
 
     #round ASR World to 2 decimal places
-    filtered_df['ASR World'] = filtered_df['ASR World'].round(3)
+    filtered_df['ASR World'] = filtered_df['ASR World'].astype(float).round(3)
 
     if filtered_df.empty:
         return go.Figure().add_annotation(
@@ -69,41 +66,38 @@ def create_trend_graph_with_future_prediction(df, selected_sex, selected_cancer,
             font=dict(size=16, color="gray")
         )
     
-    # Group by year and calculate mean ASR
-    trend_data = filtered_df.groupby('Year')['ASR World'].mean().reset_index()
+    # Group by year and calculate mean ASR (the cube already has one row per year)
+    if cube is not None:
+        trend_data = filtered_df
+    else:
+        trend_data = filtered_df.groupby('Year')['ASR World'].mean().reset_index()
     
     if len(trend_data) >= 2:  # Need at least 2 points for regression
-        from sklearn.linear_model import LinearRegression
-        from sklearn.preprocessing import StandardScaler
-        
-        # Prepare historical data for regression
-        X_historical = trend_data[['Year']].values
-        y_historical = trend_data['ASR World'].values
-        
-        # Scale the features
-        scaler = StandardScaler()
-        X_historical_scaled = scaler.fit_transform(X_historical)
-        
-        # Fit linear regression model
-        model = LinearRegression()
-        model.fit(X_historical_scaled, y_historical)
+        # Log-linear joinpoint model when one was fitted for this series (positive
+        # values only), otherwise the linear fit stored with it (fitted here
+        # only when no precomputed models are given)
+        joinpoint = joinpoints.get(selected_cancer, selected_sex) if joinpoints is not None else None
+        if joinpoint is None:
+            model = joinpoints.linear(selected_cancer, selected_sex) if joinpoints is not None else None
+            if model is None:
+                model = trend_engine.fit_series(trend_data['Year'], trend_data['ASR World'])
         
         # Generate predictions for historical data
-        trend_data['Predicted ASR World'] = model.predict(X_historical_scaled)
+        if joinpoint is not None:
+            trend_data['Predicted ASR World'] = joinpoint.fitted(trend_data['Year'])
+        else:
+            trend_data['Predicted ASR World'] = model.predict(trend_data['Year'])
         #round predicted ASR World to 2 decimal places
         trend_data['Predicted ASR World'] = trend_data['Predicted ASR World'].round(3)
         
-        # Create future data points
-        future_data = pd.DataFrame({'Year': future_years})
-        X_future = future_data[['Year']].values
-        X_future_scaled = scaler.transform(X_future)  # Use same scaler
-        future_predictions = model.predict(X_future_scaled)
+        # Predictions for future years
+        if joinpoint is not None:
+            future_predictions, lower, upper = joinpoint.predict(future_years)
+        else:
+            future_predictions = model.predict(future_years)
         #round future predictions to 2 decimal places
         future_predictions = future_predictions.round(3)
         
-        future_data['ASR World'] = future_predictions
-        future_data['Predicted ASR World'] = future_predictions
-        
         # Combine historical and future data
         all_years = list(trend_data['Year']) + future_years
         all_actual = list(trend_data['ASR World']) + [None] * len(future_years)
@@ -132,6 +126,18 @@ def create_trend_graph_with_future_prediction(df, selected_sex, selected_cancer,
             opacity=0.7
         ))
         
+        # Prediction interval of the joinpoint projection
+        if joinpoint is not None and np.isfinite(upper).all():
+            fig.add_trace(go.Scatter(
+                x=list(future_years) + list(future_years)[::-1],
+                y=list(upper.round(3)) + list(lower.round(3))[::-1],
+                fill='toself',
+                fillcolor='rgba(44,160,44,0.15)',
+                line=dict(width=0),
+                name='95% Prediction Interval',
+                hoverinfo='skip'
+            ))
+        
         # Add connection line from last historical point to first future prediction
         fig.add_trace(go.Scatter(
             x=[trend_data['Year'].iloc[-1], future_years[0]],
@@ -156,11 +162,16 @@ def create_trend_graph_with_future_prediction(df, selected_sex, selected_cancer,
         ))
         
         # Calculate R² score for model performance on historical data
-        from sklearn.metrics import r2_score
-        r2 = r2_score(y_historical, trend_data['Predicted ASR World'])
+        # R² of the displayed (rounded) fit on historical data
+        r2 = trend_engine.r_squared(trend_data['ASR World'], trend_data['Predicted ASR World'])
         
         # Create prediction summary text with R² score at the top
-        prediction_text = f"R² Score: {r2:.3f}<br><br>Future Predictions:<br>"
+        prediction_text = f"R² Score: {r2:.3f}<br><br>"
+        if joinpoint is not None:
+            for start, end, apc in joinpoint.segments:
+                prediction_text += f"APC {start}-{end}: {apc:.2f}%<br>"
+            prediction_text += f"AAPC: {joinpoint.aapc:.2f}%<br><br>"
+        prediction_text += "Future Predictions:<br>"
         for year, pred in zip(future_years, future_predictions):
             prediction_text += f"Year {year}: {round(pred, 2)}<br>"
         
@@ -175,7 +186,8 @@ def create_trend_graph_with_future_prediction(df, selected_sex, selected_cancer,
             autosize=True,
             margin=dict(l=50, r=150, t=80, b=60),  # Responsive margins
             yaxis=dict(
-                range=[0, max(max(trend_data['ASR World']), max(future_predictions)) * 1.1],
+                range=[0, max(max(trend_data['ASR World']), max(future_predictions),
+                              max(upper) if joinpoint is not None and np.isfinite(upper).all() else 0) * 1.1],
                 automargin=True
             ),
             xaxis=dict(automargin=True),
@@ -223,17 +235,54 @@ def create_trend_graph_with_future_prediction(df, selected_sex, selected_cancer,
         )
 
 
-def create_animated_age_distribution_graph(df, selected_cancer):
+def _age_group_array(df, selected_cancer, years, sexes, cube=None):
+    """
+    Mean ASR of one site as a (year x sex x age group) array
+    
+    Args:
+        df (DataFrame): Age-group rows of the selected site
+        selected_cancer (str): Selected cancer type
+        years (list): Years, in frame order
+        sexes (list): Sexes to break down by, or [None] to combine them
+        cube (AggregationCube): Optional mean cube on Site, Sex, Year and Age_Group
+    
+    Returns:
+        numpy.ndarray: Values rounded to 3 decimals, NaN where there is no data;
+        the last axis follows dataloader.AGE_GROUPS
+    """
+    by_sex = sexes != [None]
+    if cube is not None:
+        by = {'Year': years}
+        if by_sex:
+            by['Sex'] = sexes
+        by['Age_Group'] = dataloader.AGE_GROUPS
+        means = cube.lookup(by=by, Site=selected_cancer)
+    else:
+        keys = ['Year', 'Sex', 'Age_Group'] if by_sex else ['Year', 'Age_Group']
+        means = df.groupby(keys, observed=True)['ASR'].mean()
+    
+    levels = [years, sexes, dataloader.AGE_GROUPS] if by_sex else [years, dataloader.AGE_GROUPS]
+    values = means.reindex(pd.MultiIndex.from_product(levels)).to_numpy(dtype='float64')
+    return values.reshape(len(years), len(sexes), len(dataloader.AGE_GROUPS)).round(3)
+
+
+def create_animated_age_distribution_graph(df, selected_cancer, index=None, cube=None, joinpoints=None):
     """
     Create animated ASR age distribution showing changes over years
     
     Args:
         df (DataFrame): Input dataframe with Year column
         selected_cancer (str): Selected cancer type filter
+        index (SliceIndex): Optional index over df with a Site level
+        cube (AggregationCube): Optional mean cube over df on Site, Sex, Year and Age_Group
+        joinpoints (JoinpointEngine): Optional precomputed models of the age-group
+            series; their AAPC is shown when hovering each age group
     
     Returns:
         plotly.graph_objects.Figure: Animated age distribution graph
     """
+    import plotly.express as px
+
     if not selected_cancer:
         return go.Figure().add_annotation(
             text="Please select a cancer type",
@@ -243,8 +292,8 @@ def create_animated_age_distribution_graph(df, selected_cancer):
         )
     
     # Filter data for selected cancer
-    filtered_df = df[df['Site'] == selected_cancer].copy()
-    filtered_df['ASR'] = filtered_df['ASR'].round(3)
+    filtered_df = select_rows(df, index, Site=selected_cancer).copy()
+    filtered_df['ASR'] = filtered_df['ASR'].astype(float).round(3)
     
     if filtered_df.empty:
         return go.Figure().add_annotation(
@@ -256,346 +305,202 @@ def create_animated_age_distribution_graph(df, selected_cancer):
     
     # Check if we have age group data
     if 'Age_Group' in filtered_df.columns and not filtered_df['Age_Group'].isna().all():
-        # Define age group order
-        desired_order = ['0-','5-','10-','15-','20-','25-','30-','35-','40-','45-',
-                        '50-','55-','60-','65-','70-','75+']
-        
-        order_mapping = {age_group: idx for idx, age_group in enumerate(desired_order)}
-        
-        def sort_age_groups(age_group):
-            if pd.isna(age_group):
-                return 999
-            age_str = str(age_group).strip()
-            return order_mapping.get(age_str, 1000)
-        
         # Get unique years for animation
         years = sorted(filtered_df['Year'].unique())
         
-        # Check if we have both male and female data
-        if 'Sex' in filtered_df.columns and filtered_df['Sex'].nunique() > 1:
-            # Prepare animation data for both sexes
-            animation_data = []
-            
-            for year in years:
-                year_data = filtered_df[filtered_df['Year'] == year]
-                
-                # Process male data
-                male_data = year_data[year_data['Sex'] == 'Male'].groupby('Age_Group')['ASR'].mean().reset_index()
-                if len(male_data) > 0:
-                    male_data['sort_key'] = male_data['Age_Group'].apply(sort_age_groups)
-                    male_data = male_data.sort_values('sort_key').drop('sort_key', axis=1)
-                    male_data['Sex'] = 'Male'
-                    male_data['Year'] = year
-                    animation_data.append(male_data)
-                
-                # Process female data
-                female_data = year_data[year_data['Sex'] == 'Female'].groupby('Age_Group')['ASR'].mean().reset_index()
-                if len(female_data) > 0:
-                    female_data['sort_key'] = female_data['Age_Group'].apply(sort_age_groups)
-                    female_data = female_data.sort_values('sort_key').drop('sort_key', axis=1)
-                    female_data['Sex'] = 'Female'
-                    female_data['Year'] = year
-                    animation_data.append(female_data)
-            
-            if not animation_data:
-                return go.Figure().add_annotation(
-                    text="No age group data available",
-                    xref="paper", yref="paper",
-                    x=0.5, y=0.5, xanchor='center', yanchor='middle',
-                    font=dict(size=16, color="gray")
-                )
-            
-            # Combine all years data
-            final_df = pd.concat(animation_data, ignore_index=True)
-            
-            # Get all available age groups
-            all_age_groups = final_df['Age_Group'].unique()
-            ordered_age_groups = [age for age in desired_order if age in all_age_groups]
-            
-            # Calculate global max for consistent y-axis
-            global_max = final_df['ASR'].max()
-            
-            # Create animated scatter plot
-            fig = px.line(
-                final_df,
-                x='Age_Group',
-                y='ASR',
-                color='Sex',
-                animation_frame='Year',
-                color_discrete_map={
-                    'Male': 'rgba(31, 119, 180, 1)',
-                    'Female': 'rgba(255, 127, 14, 1)'
-                },
-                category_orders={'Age_Group': ordered_age_groups},
-                range_y=[0, global_max * 1.1]
-            )
-            
-            # Update traces to add fill and markers
-            for i, trace in enumerate(fig.data):
-                if trace.name == 'Male':
-                    trace.update(
-                        fill='tozeroy',
-                        fillcolor='rgba(31, 119, 180, 0.3)',
-                        line=dict(width=3, shape='spline'),
-                        mode='lines+markers',
-                        marker=dict(size=8, symbol='circle')
-                    )
-                elif trace.name == 'Female':
-                    trace.update(
-                        fill='tozeroy',
-                        fillcolor='rgba(255, 127, 14, 0.3)',
-                        line=dict(width=3, shape='spline'),
-                        mode='lines+markers',
-                        marker=dict(size=8, symbol='diamond')
-                    )
-            
-            # Update frames for consistent styling
-            for frame in fig.frames:
-                for i, trace in enumerate(frame.data):
-                    if trace.name == 'Male':
-                        trace.update(
-                            fill='tozeroy',
-                            fillcolor='rgba(31, 119, 180, 0.3)',
-                            line=dict(width=3, shape='spline'),
-                            mode='lines+markers',
-                            marker=dict(size=8, symbol='circle')
-                        )
-                    elif trace.name == 'Female':
-                        trace.update(
-                            fill='tozeroy',
-                            fillcolor='rgba(255, 127, 14, 0.3)',
-                            line=dict(width=3, shape='spline'),
-                            mode='lines+markers',
-                            marker=dict(size=8, symbol='diamond')
-                        )
-            
-            fig.update_layout(
-                title=dict(
-                    text=f'🎬 Age Distribution Animation: {selected_cancer} - Male vs Female',
-                    font=dict(size=20),
-                    x=0.5,
-                    xanchor='center'
-                ),
-                xaxis_title="Age Group",
-                yaxis_title="Age-Standardized Rate (ASR)",
-                template='plotly_white',
-                autosize=True,
-                margin=dict(l=50, r=50, t=80, b=150),  # More space for lower slider
-                hovermode='x unified',
-                showlegend=True,
-                legend=dict(
-                    orientation="h",
-                    yanchor="bottom",
-                    y=-0.15,
-                    xanchor="center",
-                    x=0.5,
-                    font=dict(size=12)
-                ),
-                # Animation controls
-                updatemenus=[{
-                    'type': 'buttons',
-                    'showactive': False,
-                    'y': 1.02,  # Moved above the plot area
-                    'x': 0.02,  # Far left position
-                    'xanchor': 'left',
-                    'yanchor': 'bottom',
-                    'bgcolor': 'lightblue',
-                    'borderwidth': 2,
-                    'font': {'size': 12, 'color': 'darkblue'},  # Slightly smaller font
-                    'buttons': [
-                        {
-                            'label': '▶️ Play Animation',
-                            'method': 'animate',
-                            'args': [None, {
-                                'frame': {'duration': 3000, 'redraw': True},
-                                'fromcurrent': True,
-                                'transition': {'duration': 1500}
-                            }]
-                        },
-                        {
-                            'label': '⏸️ Pause',
-                            'method': 'animate',
-                            'args': [[None], {
-                                'frame': {'duration': 0, 'redraw': False},
-                                'mode': 'immediate',
-                                'transition': {'duration': 0}
-                            }]
-                        },
-                        {
-                            'label': '⏮️ Reset',
-                            'method': 'animate',
-                            'args': [[str(years[0])], {
-                                'frame': {'duration': 0, 'redraw': True},
-                                'mode': 'immediate',
-                                'transition': {'duration': 0}
-                            }]
-                        }
-                    ]
-                }]
+        # Male vs Female when both are present, otherwise sexes combined
+        both_sexes = 'Sex' in filtered_df.columns and filtered_df['Sex'].nunique() > 1
+        sexes = ['Male', 'Female'] if both_sexes else [None]
+        
+        # (year x sex x age group) array of mean ASR, age groups in vocabulary order
+        values = _age_group_array(filtered_df, selected_cancer, years, sexes, cube=cube)
+        has_age_group = ~np.isnan(values).all(axis=(0, 1))
+        if not has_age_group.any():
+            return go.Figure().add_annotation(
+                text="No age group data available",
+                xref="paper", yref="paper",
+                x=0.5, y=0.5, xanchor='center', yanchor='middle',
+                font=dict(size=16, color="gray")
             )
-            
-            # Customize slider
-            fig.layout.sliders[0].currentvalue.prefix = "📅 Year: "
-            fig.layout.sliders[0].currentvalue.font.size = 16
-            fig.layout.sliders[0].currentvalue.font.color = "darkblue"
-            fig.layout.sliders[0].y = -0.35  # Move slider lower to avoid legend
-            fig.layout.sliders[0].len = 0.8  # Make slider shorter
-            fig.layout.sliders[0].x = 0.1    # Center the shorter slider
-            
-            # Add year annotations for each frame
-            for frame in fig.frames:
-                year = frame.name
-                frame.layout.annotations = [
-                    dict(
-                        text=f"📅 {year}",
-                        xref="paper", yref="paper",
-                        x=0.02, y=0.98,
-                        showarrow=False,
-                        font=dict(size=20, color="darkblue", family="Arial Black"),
-                        bgcolor="rgba(255,255,255,0.9)",
-                        bordercolor="darkblue",
-                        borderwidth=2
-                    )
-                ]
-            
+        ordered_age_groups = [age for age, keep in zip(dataloader.AGE_GROUPS, has_age_group) if keep]
+        values = values[:, :, has_age_group]
+        observed = ~np.isnan(values)
+        
+        # Calculate global max for consistent y-axis
+        global_max = np.nanmax(values)
+        
+        if both_sexes:
+            accent = 'darkblue'
+            trace_styles = [
+                dict(name='Male', legendgroup='Male',
+                     fillcolor='rgba(31, 119, 180, 0.3)',
+                     line=dict(color='rgba(31, 119, 180, 1)', width=3, shape='spline'),
+                     marker=dict(size=8, symbol='circle')),
+                dict(name='Female', legendgroup='Female',
+                     fillcolor='rgba(255, 127, 14, 0.3)',
+                     line=dict(color='rgba(255, 127, 14, 1)', width=3, shape='spline'),
+                     marker=dict(size=8, symbol='diamond')),
+            ]
+            title = f'🎬 Age Distribution Animation: {selected_cancer} - Male vs Female'
         else:
-            # Single sex or combined data animation
-            animation_data = []
-            
-            for year in years:
-                year_data = filtered_df[filtered_df['Year'] == year]
-                age_data = year_data.groupby('Age_Group')['ASR'].mean().reset_index()
-                
-                if len(age_data) > 0:
-                    age_data['sort_key'] = age_data['Age_Group'].apply(sort_age_groups)
-                    age_data = age_data.sort_values('sort_key').drop('sort_key', axis=1)
-                    age_data['Year'] = year
-                    animation_data.append(age_data)
-            
-            if not animation_data:
-                return go.Figure().add_annotation(
-                    text="No age group data available",
+            accent = 'darkgreen'
+            trace_styles = [
+                dict(fillcolor='rgba(31, 119, 180, 0.3)',
+                     line=dict(color='rgba(31, 119, 180, 1)', width=3, shape='spline'),
+                     marker=dict(size=8, color='red', symbol='circle')),
+            ]
+            title = f'🎬 Age Distribution Animation: {selected_cancer}'
+        
+        # Frames only carry the data of each year; styling lives in the base traces
+        age_labels = np.array(ordered_age_groups, dtype=object)
+        
+        # AAPC of each (sex, age group) series, shown on hover next to the point
+        aapc = None
+        if joinpoints is not None:
+            model_sexes = sexes if both_sexes else [
+                plain_value(sex) for sex in filtered_df['Sex'].dropna().unique()[:1]] or [None]
+            models = [[joinpoints.get(selected_cancer, sex, age) for age in ordered_age_groups] for sex in model_sexes]
+            aapc = np.array([[f"{model.aapc:.2f}%" if model is not None else "n/a" for model in row]
+                             for row in models], dtype=object)
+        
+        def sex_trace(i, j):
+            keep = observed[i, j]
+            x = ordered_age_groups if keep.all() else list(age_labels[keep])
+            if aapc is None:
+                return go.Scatter(x=x, y=values[i, j][keep])
+            return go.Scatter(x=x, y=values[i, j][keep], customdata=list(aapc[j][keep]))
+        
+        def frame_traces(i):
+            # Sexes without rows in a year are left out of its frame (as px did);
+            # ``traces`` maps the others onto their base traces
+            present = [j for j in range(len(sexes)) if observed[i, j].any()]
+            return [sex_trace(i, j) for j in present], present
+        
+        frames = []
+        for i, year in enumerate(years):
+            data, present = frame_traces(i)
+            frames.append(go.Frame(
+                name=str(year),
+                data=data,
+                traces=present,
+                layout=dict(annotations=[dict(
+                    text=f"📅 {year}",
                     xref="paper", yref="paper",
-                    x=0.5, y=0.5, xanchor='center', yanchor='middle',
-                    font=dict(size=16, color="gray")
-                )
-            
-            final_df = pd.concat(animation_data, ignore_index=True)
-            all_age_groups = final_df['Age_Group'].unique()
-            ordered_age_groups = [age for age in desired_order if age in all_age_groups]
-            global_max = final_df['ASR'].max()
-            
-            # Create animated line chart
-            fig = px.line(
-                final_df,
-                x='Age_Group',
-                y='ASR',
-                animation_frame='Year',
-                category_orders={'Age_Group': ordered_age_groups},
-                range_y=[0, global_max * 1.1]
+                    x=0.02, y=0.98,
+                    showarrow=False,
+                    font=dict(size=20, color=accent, family="Arial Black"),
+                    bgcolor="rgba(255,255,255,0.9)",
+                    bordercolor=accent,
+                    borderwidth=2
+                )])
+            ))
+        
+        # One base trace per sex (each has rows in some year), holding the first year's data
+        fig = go.Figure(data=[sex_trace(0, j) for j in range(len(sexes))], frames=frames)
+        for trace, style in zip(fig.data, trace_styles):
+            sex_label = f"Sex={style['name']}<br>" if 'name' in style else ""
+            aapc_label = f"<br>AAPC {years[0]}-{years[-1]}=%{{customdata}}" if aapc is not None else ""
+            trace.update(
+                fill='tozeroy',
+                mode='lines+markers',
+                hovertemplate=sex_label + "Age_Group=%{x}<br>ASR=%{y}" + aapc_label + "<extra></extra>",
+                **style
             )
-            
-            # Update trace styling
-            for trace in fig.data:
-                trace.update(
-                    fill='tozeroy',
-                    fillcolor='rgba(31, 119, 180, 0.3)',
-                    line=dict(color='rgba(31, 119, 180, 1)', width=3, shape='spline'),
-                    mode='lines+markers',
-                    marker=dict(size=8, color='red', symbol='circle')
-                )
-            
-            # Update frames styling
-            for frame in fig.frames:
-                for trace in frame.data:
-                    trace.update(
-                        fill='tozeroy',
-                        fillcolor='rgba(31, 119, 180, 0.3)',
-                        line=dict(color='rgba(31, 119, 180, 1)', width=3, shape='spline'),
-                        mode='lines+markers',
-                        marker=dict(size=8, color='red', symbol='circle')
-                    )
-            
-            fig.update_layout(
-                title=dict(
-                    text=f'🎬 Age Distribution Animation: {selected_cancer}',
-                    font=dict(size=20),
-                    x=0.5,
-                    xanchor='center'
-                ),
-                xaxis_title="Age Group",
-                yaxis_title="Age-Standardized Rate (ASR)",
-                template='plotly_white',
-                autosize=True,
-                margin=dict(l=50, r=50, t=80, b=140),  # More space for lower slider
-                hovermode='x unified',
-                showlegend=False,
-                # Animation controls
-                updatemenus=[{
-                    'type': 'buttons',
-                    'showactive': False,
-                    'y': 1.02,  # Moved above the plot area
-                    'x': 0.02,  # Far left position
-                    'xanchor': 'left',
-                    'yanchor': 'bottom',
-                    'bgcolor': 'lightgreen',
-                    'borderwidth': 2,
-                    'font': {'size': 12, 'color': 'darkgreen'},  # Slightly smaller font
-                    'buttons': [
-                        {
-                            'label': '▶️ Play Animation',
-                            'method': 'animate',
-                            'args': [None, {
-                                'frame': {'duration': 3000, 'redraw': True},
-                                'fromcurrent': True,
-                                'transition': {'duration': 1500}
-                            }]
-                        },
-                        {
-                            'label': '⏸️ Pause',
-                            'method': 'animate',
-                            'args': [[None], {
-                                'frame': {'duration': 0, 'redraw': False},
-                                'mode': 'immediate',
-                                'transition': {'duration': 0}
-                            }]
-                        },
-                        {
-                            'label': '⏮️ Reset',
-                            'method': 'animate',
-                            'args': [[str(years[0])], {
-                                'frame': {'duration': 0, 'redraw': True},
-                                'mode': 'immediate',
-                                'transition': {'duration': 0}
-                            }]
-                        }
-                    ]
+        
+        # Year slider, one step per frame
+        slider_steps = [
+            {
+                'label': str(year),
+                'method': 'animate',
+                'args': [[str(year)], {
+                    'frame': {'duration': 0, 'redraw': False},
+                    'mode': 'immediate',
+                    'fromcurrent': True,
+                    'transition': {'duration': 0, 'easing': 'linear'}
                 }]
-            )
-            
-            # Customize slider
-            fig.layout.sliders[0].currentvalue.prefix = "📅 Year: "
-            fig.layout.sliders[0].currentvalue.font.size = 16
-            fig.layout.sliders[0].currentvalue.font.color = "darkgreen"
-            fig.layout.sliders[0].y = -0.25  # Move slider lower (no legend in single sex view)
-            fig.layout.sliders[0].len = 0.8  # Make slider shorter
-            fig.layout.sliders[0].x = 0.1    # Center the shorter slider
-            
-            # Add year annotations
-            for frame in fig.frames:
-                year = frame.name
-                frame.layout.annotations = [
-                    dict(
-                        text=f"📅 {year}",
-                        xref="paper", yref="paper",
-                        x=0.02, y=0.98,
-                        showarrow=False,
-                        font=dict(size=20, color="darkgreen", family="Arial Black"),
-                        bgcolor="rgba(255,255,255,0.9)",
-                        bordercolor="darkgreen",
-                        borderwidth=2
-                    )
+            }
+            for year in years
+        ]
+        
+        fig.update_layout(
+            title=dict(
+                text=title,
+                font=dict(size=20),
+                x=0.5,
+                xanchor='center'
+            ),
+            xaxis_title="Age Group",
+            yaxis_title="Age-Standardized Rate (ASR)",
+            xaxis=dict(categoryorder='array', categoryarray=ordered_age_groups),
+            yaxis=dict(range=[0, global_max * 1.1]),
+            template='plotly_white',
+            autosize=True,
+            margin=dict(l=50, r=50, t=80, b=150 if both_sexes else 140),  # More space for lower slider
+            hovermode='x unified',
+            showlegend=both_sexes,
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=-0.15,
+                xanchor="center",
+                x=0.5,
+                font=dict(size=12)
+            ),
+            # Animation controls
+            updatemenus=[{
+                'type': 'buttons',
+                'showactive': False,
+                'direction': 'left',
+                'pad': {'r': 10, 't': 70},
+                'y': 1.02,  # Moved above the plot area
+                'x': 0.02,  # Far left position
+                'xanchor': 'left',
+                'yanchor': 'bottom',
+                'bgcolor': 'lightblue' if both_sexes else 'lightgreen',
+                'borderwidth': 2,
+                'font': {'size': 12, 'color': accent},  # Slightly smaller font
+                'buttons': [
+                    {
+                        'label': '▶️ Play Animation',
+                        'method': 'animate',
+                        'args': [None, {
+                            'frame': {'duration': 3000, 'redraw': True},
+                            'fromcurrent': True,
+                            'transition': {'duration': 1500}
+                        }]
+                    },
+                    {
+                        'label': '⏸️ Pause',
+                        'method': 'animate',
+                        'args': [[None], {
+                            'frame': {'duration': 0, 'redraw': False},
+                            'mode': 'immediate',
+                            'transition': {'duration': 0}
+                        }]
+                    },
+                    {
+                        'label': '⏮️ Reset',
+                        'method': 'animate',
+                        'args': [[str(years[0])], {
+                            'frame': {'duration': 0, 'redraw': True},
+                            'mode': 'immediate',
+                            'transition': {'duration': 0}
+                        }]
+                    }
                 ]
+            }],
+            sliders=[{
+                'active': 0,
+                'steps': slider_steps,
+                'currentvalue': {'prefix': "📅 Year: ", 'font': {'size': 16, 'color': accent}},
+                'pad': {'b': 10, 't': 60},
+                'len': 0.8,  # Make slider shorter
+                'x': 0.1,    # Center the shorter slider
+                'xanchor': 'left',
+                'y': -0.35 if both_sexes else -0.25,  # Move slider lower to avoid legend
+                'yanchor': 'top'
+            }]
+        )
         
         # Common styling for both cases
         fig.update_xaxes(
@@ -615,7 +520,7 @@ def create_animated_age_distribution_graph(df, selected_cancer):
         
         for year in years:
             year_data = filtered_df[filtered_df['Year'] == year]
-            sex_data = year_data.groupby('Sex')['ASR'].mean().reset_index()
+            sex_data = year_data.groupby('Sex', observed=True)['ASR'].mean().reset_index()
             sex_data['Year'] = year
             animation_data.append(sex_data)
         
@@ -701,13 +606,16 @@ def create_animated_age_distribution_graph(df, selected_cancer):
 
 # %%
 # Updated function to show horizontal bar graph with top 10 cancer for male and female in subplots
-def create_top10_cancer_bar_graph(df, selected_year):
+def create_top10_cancer_bar_graph(df, selected_year, index=None, ranks=None, top_n=10):
     """
     Create horizontal bar graph showing top 10 cancers for male and female in separate subplots
     
     Args:
         df (DataFrame): Input dataframe
         selected_year (int): Selected year filter
+        index (SliceIndex): Optional index over df with a (Year, Sex) level
+        ranks (RankTable): Optional precomputed rankings of df by year and sex
+        top_n (int): Number of cancers to show per sex
         
     Returns:
         plotly.graph_objects.Figure: Horizontal bar graph with two subplots for top 10 cancers
@@ -717,23 +625,16 @@ def create_top10_cancer_bar_graph(df, selected_year):
     else:
         display_year = selected_year
     
-    # Filter data for selected year and exclude "All sites"
-    filtered_df = df[
-        (df['Year'] == display_year) & 
-        (df['Site'] != 'All sites')
-    ].copy()
-    
-    if filtered_df.empty:
-        return go.Figure().add_annotation(
-            text="No data available for selected year",
-            xref="paper", yref="paper",
-            x=0.5, y=0.5, xanchor='center', yanchor='middle',
-            font=dict(size=16, color="gray")
-        )
-    
-    # Get data for both genders
-    male_data = filtered_df[filtered_df['Sex'] == 'Male']
-    female_data = filtered_df[filtered_df['Sex'] == 'Female']
+    # Get data for both genders in the selected year and exclude "All sites"
+    if ranks is not None:
+        # Already ranked, "All sites" excluded: the top N is a slice
+        male_data = ranks.top(display_year, 'Male', top_n)
+        female_data = ranks.top(display_year, 'Female', top_n)
+    else:
+        male_data = select_rows(df, index, Year=display_year, Sex='Male')
+        male_data = male_data[male_data['Site'] != 'All sites']
+        female_data = select_rows(df, index, Year=display_year, Sex='Female')
+        female_data = female_data[female_data['Site'] != 'All sites']
 
     if len(male_data) == 0 and len(female_data) == 0:
         return go.Figure().add_annotation(
@@ -756,8 +657,8 @@ def create_top10_cancer_bar_graph(df, selected_year):
         # Use the correct column name based on your data structure
         asr_column = 'ASR World' if 'ASR World' in male_data.columns else 'ASR'
         
-        # Get top 10 cancers for males (excluding "All sites")
-        top_male_cancers = male_data.nlargest(10, asr_column)
+        # Get top N cancers for males (excluding "All sites")
+        top_male_cancers = male_data if ranks is not None else male_data.nlargest(top_n, asr_column)
         
         # Add male data to first subplot
         fig.add_trace(
@@ -771,7 +672,7 @@ def create_top10_cancer_bar_graph(df, selected_year):
                     line=dict(color='rgba(31, 119, 180, 1.0)', width=1)
                 ),
                 hovertemplate='<b>%{y}</b><br>ASR: %{x:.2f}<extra></extra>',
-                text=top_male_cancers[asr_column].round(2),
+                text=top_male_cancers[asr_column].astype(float).round(2),
                 textposition='outside',
                 textfont=dict(color='Black', size=10)
             ),
@@ -783,8 +684,8 @@ def create_top10_cancer_bar_graph(df, selected_year):
         # Use the correct column name based on your data structure
         asr_column = 'ASR World' if 'ASR World' in female_data.columns else 'ASR'
         
-        # Get top 10 cancers for females (excluding "All sites")
-        top_female_cancers = female_data.nlargest(10, asr_column)
+        # Get top N cancers for females (excluding "All sites")
+        top_female_cancers = female_data if ranks is not None else female_data.nlargest(top_n, asr_column)
         
         # Add female data to second subplot
         fig.add_trace(
@@ -798,7 +699,7 @@ def create_top10_cancer_bar_graph(df, selected_year):
                     line=dict(color='rgba(255, 127, 14, 1.0)', width=1)
                 ),
                 hovertemplate='<b>%{y}</b><br>ASR: %{x:.2f}<extra></extra>',
-                text=top_female_cancers[asr_column].round(2),
+                text=top_female_cancers[asr_column].astype(float).round(2),
                 textposition='outside',
                 textfont=dict(color='Black', size=10)
             ),
@@ -807,7 +708,7 @@ def create_top10_cancer_bar_graph(df, selected_year):
     
     # Update layout
     fig.update_layout(
-        title=f'Top 10 Cancers by ASR - Male vs Female ({display_year})',
+        title=f'Top {top_n} Cancers by ASR - Male vs Female ({display_year})',
         template='plotly_white',
         title_font_size=18,
         title_x=0.5,
@@ -845,25 +746,154 @@ def create_top10_cancer_bar_graph(df, selected_year):
     return fig
 
 
+# %%
+def create_rank_bump_chart(ranks, top_n=10):
+    """
+    Create a bump chart of how each cancer site's rank changed across volumes
+    
+    Args:
+        ranks (RankTable): Precomputed rankings by year and sex
+        top_n (int): Sites ranked in the top N in any year are drawn
+    
+    Returns:
+        plotly.graph_objects.Figure: Rank-over-time lines for male and female side by side
+    """
+    from plotly.colors import qualitative
+    
+    sexes = [sex for sex in ('Male', 'Female') if sex in ranks.sexes]
+    if not sexes or not ranks.years:
+        return go.Figure().add_annotation(
+            text="No ranking data available",
+            xref="paper", yref="paper",
+            x=0.5, y=0.5, xanchor='center', yanchor='middle',
+            font=dict(size=16, color="gray")
+        )
+    
+    fig = make_subplots(
+        rows=1, cols=len(sexes),
+        subplot_titles=sexes,
+        horizontal_spacing=0.22,
+        shared_yaxes=True
+    )
+    
+    # One color per site, shared by both panels
+    palette = qualitative.Dark24 + qualitative.Light24
+    colors = {}
+    
+    for col, sex in enumerate(sexes, start=1):
+        rank_table = ranks.ranks(sex)
+        values = ranks.values(sex)
+        # Sites that reach the top N in any year, ordered by their latest rank
+        shown = rank_table.columns[(rank_table <= top_n).any(axis=0).to_numpy()]
+        shown = sorted(shown, key=lambda site: (rank_table[site].iloc[::-1].fillna(np.inf).iloc[0], site))
+        
+        for site in shown:
+            color = colors.setdefault(site, palette[len(colors) % len(palette)])
+            site_ranks = rank_table[site]
+            labels = [''] * len(site_ranks)
+            labels[-1] = f" {site}" if site_ranks.iloc[-1] <= top_n else ''
+            fig.add_trace(
+                go.Scatter(
+                    x=rank_table.index,
+                    y=site_ranks,
+                    mode='lines+markers+text',
+                    name=site,
+                    legendgroup=site,
+                    showlegend=False,
+                    line=dict(color=color, width=3),
+                    marker=dict(size=10, color=color),
+                    text=labels,
+                    textposition='middle right',
+                    textfont=dict(size=10, color=color),
+                    cliponaxis=False,
+                    customdata=values[site].astype(float).round(2),
+                    hovertemplate=f'<b>{site}</b><br>Year: %{{x}}<br>Rank: %{{y}}<br>ASR: %{{customdata}}<extra></extra>'
+                ),
+                row=1, col=col
+            )
+    
+    fig.update_layout(
+        title=f'Cancer Site Rank by ASR Across Volumes - Top {top_n}',
+        template='plotly_white',
+        title_font_size=18,
+        title_x=0.5,
+        autosize=True,
+        showlegend=False,
+        hovermode='closest',
+        margin=dict(l=50, r=150, t=80, b=50),
+        font=dict(size=10)
+    )
+    fig.update_xaxes(tickmode='array', tickvals=ranks.years, title_text="Year", title_font=dict(size=12))
+    fig.update_yaxes(range=[top_n + 0.5, 0.5], dtick=1, title_font=dict(size=12))
+    fig.update_yaxes(title_text="Rank", row=1, col=1)
+    
+    return fig
+
 
 # %%
-def create_map_healthregion(df, prov_hr, site, sex):
-    df_filtered = df[(df['Site'] == site)].copy()
-    if sex != 'Both sex':
-        df_filtered = df_filtered[df_filtered['Sex'] == sex]
-        df_merged=pd.merge(prov_hr, df_filtered, left_on='health_region', right_on='healthregion', how='left')
+def create_map_healthregion(df, prov_hr, site, sex, index=None, cube=None, region_index=None, geojson=None, level='province'):
+    """
+    Create choropleth map of ASR by health region, drawn per province or per region
+    
+    Args:
+        df (DataFrame): Regional ASR dataframe
+        prov_hr (DataFrame): Province to health region table (load_prov_data)
+        site (str): Selected cancer type
+        sex (str): Selected sex; 'Both' (or 'Both sex') sums the sexes
+        index (SliceIndex): Optional index over df with Site and (Site, Sex) levels
+        cube (AggregationCube): Optional sum cube over df on Site, Sex and healthregion
+        region_index (numpy.ndarray): Optional precomputed dataloader.province_region_index(prov_hr)
+        geojson (dict): Boundaries, defaults to the full-resolution province file
+            (see geometry.load_geometry / geometry.load_region_geometry)
+        level (str): 'province' shades each province with its region's value;
+            'region' draws one dissolved shape per health region and needs a
+            region layer keyed by properties.health_region (defaults to the
+            full-resolution dissolved layer)
+    
+    Returns:
+        plotly.graph_objects.Figure: Choropleth map
+    """
+    import plotly.express as px
+
+    both_sexes = sex in ('Both', 'Both sex')
+    if cube is not None:
+        # Region values straight from the cube; 'Both' rolls the sexes up
+        filters = {'Site': site} if both_sexes else {'Site': site, 'Sex': sex}
+        region_asr = cube.lookup(by=('healthregion',), **filters)
+    elif not both_sexes:
+        region_asr = select_rows(df, index, Site=site, Sex=sex).set_index('healthregion')['ASR World']
     else:
-        df_filtered = df_filtered.groupby(['healthregion']).agg({'ASR World': 'sum'}).reset_index()
-        df_merged=pd.merge(prov_hr, df_filtered, left_on='health_region', right_on='healthregion', how='left')
+        df_filtered = select_rows(df, index, Site=site)
+        region_asr = df_filtered.groupby('healthregion', observed=True)['ASR World'].sum()
+
+    regions = dataloader.get_vocabulary('health_region').categories
+    if level == 'region':
+        # One row per region with data, matched to the dissolved region shapes
+        df_merged = pd.DataFrame({'health_region': np.asarray(regions, dtype=object),
+                                  'ASR World': region_asr.reindex(regions).to_numpy(dtype='float64')}).dropna()
+        locations, featureidkey = 'health_region', 'properties.health_region'
+        hover_data = {'health_region': True, 'ASR World': ':.2f'}
+        if geojson is None:
+            import geometry
+            geojson = geometry.load_region_geometry('full')
+    else:
+        # One value per region in vocabulary order plus a trailing NaN that
+        # provinces without a region (index -1) pick up; the province vector is a single take
+        if region_index is None:
+            region_index = dataloader.province_region_index(prov_hr)
+        region_values = np.append(region_asr.reindex(regions).to_numpy(dtype='float64'), np.nan)
+        df_merged = prov_hr.assign(**{'ASR World': np.take(region_values, region_index)})
+        locations, featureidkey = 'provine_code', 'properties.pro_code'
+        hover_data = {'health_region': True, 'ASR World': ':.2f', 'provine_code': False, 'province': True}
     fig = px.choropleth_map(
         df_merged,
-        geojson=thai_geojson,
-        locations='provine_code',
-        featureidkey='properties.pro_code',
+        geojson=geojson if geojson is not None else dataloader.load_geojson(),
+        locations=locations,
+        featureidkey=featureidkey,
         color='ASR World',
         color_continuous_scale='Blues',
         #hover_name='healthregion',
-        hover_data={'health_region': True, 'ASR World': ':.2f', 'provine_code': False, 'province': True},
+        hover_data=hover_data,
         #hover_data={'ASR World': ':.2f'},
         center={"lat": 13.4, "lon": 100.523186},
         map_style="carto-voyager-nolabels", zoom=5,
@@ -885,7 +915,7 @@ def create_map_healthregion(df, prov_hr, site, sex):
 
 
 # %%
-def create_survival_line_plot(df, selected_regions, selected_cancer, selected_stages):
+def create_survival_line_plot(df, selected_regions, selected_cancer, selected_stages, index=None):
     """
     Create survival line plot with time on x-axis and survival time on y-axis
     
@@ -894,6 +924,7 @@ def create_survival_line_plot(df, selected_regions, selected_cancer, selected_st
         selected_regions (list): List of selected regions (max 3)
         selected_cancer (str): Selected cancer type
         selected_stages (list): List of selected stages
+        index (SliceIndex): Optional index over df with a (cancer, region, stage) level
     
     Returns:
         plotly.graph_objects.Figure: Line plot showing survival curves
@@ -913,12 +944,13 @@ def create_survival_line_plot(df, selected_regions, selected_cancer, selected_st
         selected_regions = selected_regions[:3]
         print(f"⚠️ Maximum 3 regions allowed. Using first 3: {selected_regions}")
     
-    # Filter data based on selections
-    filtered_df = df[
-        (df['region'].isin(selected_regions)) &
-        (df['cancer'] == selected_cancer) &
-        (df['stage'].isin(selected_stages))
-    ].copy()
+    # Filter data based on selections, one slice per region-stage combination
+    subsets = {
+        (region, stage): select_rows(df, index, cancer=selected_cancer, region=region, stage=stage)
+        for region in selected_regions
+        for stage in selected_stages
+    }
+    filtered_df = pd.concat(subsets.values())
     
     if filtered_df.empty:
         return go.Figure().add_annotation(
@@ -966,10 +998,7 @@ def create_survival_line_plot(df, selected_regions, selected_cancer, selected_st
     for region_idx, region in enumerate(selected_regions):
         for stage in selected_stages:
             # Filter for specific region and stage
-            subset = filtered_df[
-                (filtered_df['region'] == region) & 
-                (filtered_df['stage'] == stage)
-            ].copy()
+            subset = subsets[(region, stage)].copy()
             
             if not subset.empty:
                 # Sort by time
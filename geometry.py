@@ -0,0 +1,534 @@
+# %%
+# geometry.py - Simplified, quantized multi-resolution province boundaries
+#
+# Usage: python geometry.py [--zoom Z]   (prints the payload size report)
+#
+# Province rings are cut into arcs at the points where neighbouring provinces
+# meet, every shared arc is simplified once (Douglas-Peucker) and reused by
+# both provinces, so simplified borders never open gaps or overlaps. The
+# coordinates of each resolution are rounded to a grid matched to its
+# tolerance, which shortens the JSON as well.
+import argparse
+import functools
+import json
+import math
+import os
+
+import numpy as np
+
+import dataloader
+
+# Simplification tolerance of each resolution, in degrees (None keeps every vertex)
+RESOLUTIONS = {
+    'full': None,
+    'high': 0.001,
+    'medium': 0.005,
+    'low': 0.02,
+}
+
+# Grid the source coordinates are snapped to before arcs are detected
+BASE_GRID = 1e-6
+
+# Feature properties kept in the simplified layers
+KEEP_PROPERTIES = ('pro_code',)
+
+# Property the province features are dissolved by for region-level maps
+REGION_KEY = 'health_region'
+
+# Part of the cache file names; bump when the prepared layers change
+LAYER_FORMAT = 2
+
+
+# %%
+def _douglas_peucker(points, tolerance):
+    """
+    Indices of the vertices of an open polyline kept by Douglas-Peucker
+
+    The endpoints are always kept and so is the vertex farthest from the
+    chord, so every arc keeps at least three points and a ring built from
+    two arcs cannot collapse.
+
+    Args:
+        points (numpy.ndarray): (n, 2) coordinates
+        tolerance (float): Maximum distance of a dropped vertex from the result
+
+    Returns:
+        numpy.ndarray: Sorted indices of the kept vertices
+    """
+    n = len(points)
+    if n <= 2:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1, True)]
+    while stack:
+        start, end, force = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[start + 1:end]
+        chord = points[end] - points[start]
+        length = math.hypot(chord[0], chord[1])
+        offsets = segment - points[start]
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(chord[0] * offsets[:, 1] - chord[1] * offsets[:, 0]) / length
+        i = int(np.argmax(distances))
+        if force or distances[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split, False))
+            stack.append((split, end, False))
+    return np.flatnonzero(keep)
+
+
+def _simplify_arc(points, tolerance):
+    """Simplify one arc; closed arcs (first == last) are split at their farthest point"""
+    if len(points) > 3 and (points[0] == points[-1]).all():
+        offsets = points - points[0]
+        far = int(np.argmax(np.hypot(offsets[:, 0], offsets[:, 1])))
+        first = _douglas_peucker(points[:far + 1], tolerance)
+        second = _douglas_peucker(points[far:], tolerance) + far
+        return points[np.concatenate([first, second[1:]])]
+    return points[_douglas_peucker(points, tolerance)]
+
+
+def _rings(geometry):
+    """Yield (polygon index, ring index, coordinates) of a Polygon or MultiPolygon"""
+    polygons = geometry['coordinates'] if geometry['type'] == 'MultiPolygon' else [geometry['coordinates']]
+    for p, polygon in enumerate(polygons):
+        for r, ring in enumerate(polygon):
+            yield p, r, ring
+
+
+def _split_arcs(rings):
+    """
+    Cut every ring into arcs at topology junctions
+
+    A vertex is a junction when the set of rings sharing it changes at that
+    vertex in any ring. Junctions are global, so a border shared by two
+    provinces is cut at the same vertices in both.
+
+    Args:
+        rings (list): (n, 2) int64 arrays of snapped coordinates, open (no repeated last vertex)
+
+    Returns:
+        tuple: (arcs, ring_arcs) - the unique arcs as int64 arrays and, for
+        each ring, a list of (arc index, reversed) making up the ring
+    """
+    points = np.concatenate(rings)
+    ring_of = np.concatenate([np.full(len(ring), i) for i, ring in enumerate(rings)])
+    _, point_id = np.unique(points, axis=0, return_inverse=True)
+    point_id = point_id.ravel()
+
+    # Rings sharing each vertex, as a sorted tuple per point id
+    sharing = {}
+    for pid, ring in set(zip(point_id.tolist(), ring_of.tolist())):
+        sharing.setdefault(pid, []).append(ring)
+    signature = {pid: tuple(sorted(members)) for pid, members in sharing.items()}
+
+    junction = set()
+    offset = 0
+    ids_per_ring = []
+    for ring in rings:
+        ids = point_id[offset:offset + len(ring)].tolist()
+        offset += len(ring)
+        ids_per_ring.append(ids)
+        for k, pid in enumerate(ids):
+            if signature[pid] != signature[ids[k - 1]] or signature[pid] != signature[ids[(k + 1) % len(ids)]]:
+                junction.add(pid)
+            elif len(signature[pid]) > 2:
+                junction.add(pid)
+
+    arcs, arc_index, ring_arcs = [], {}, []
+    coordinates = {}
+    for ring, ids in zip(rings, ids_per_ring):
+        for pid, xy in zip(ids, ring):
+            coordinates.setdefault(pid, xy)
+        cuts = [k for k, pid in enumerate(ids) if pid in junction]
+        if not cuts:
+            # Closed arc: canonical rotation and direction so shared rings match
+            start = ids.index(min(ids))
+            rotated = ids[start:] + ids[:start]
+            backward = [rotated[0]] + rotated[1:][::-1]
+            pieces = [(rotated + [rotated[0]], backward + [backward[0]])]
+        else:
+            pieces = []
+            for a, b in zip(cuts, cuts[1:] + [cuts[0] + len(ids)]):
+                piece = [ids[k % len(ids)] for k in range(a, b + 1)]
+                pieces.append((piece, piece[::-1]))
+        members = []
+        for forward, backward in pieces:
+            key, reverse = (tuple(forward), False) if forward <= backward else (tuple(backward), True)
+            if key not in arc_index:
+                arc_index[key] = len(arcs)
+                arcs.append(np.array([coordinates[pid] for pid in key], dtype='int64'))
+            members.append((arc_index[key], reverse))
+        ring_arcs.append(members)
+    return arcs, ring_arcs
+
+
+def _default_decimals(tolerance):
+    """Decimal places of a grid ten times finer than the tolerance"""
+    return 6 if not tolerance else max(0, min(6, math.ceil(-math.log10(tolerance)) + 1))
+
+
+def _snap_rings(features, tolerance):
+    """
+    Snap the rings of every feature to the base grid
+
+    Returns:
+        tuple: (layout, rings) - (feature, polygon, ring) indices and the open
+        int64 rings; rings smaller than the tolerance are left out
+    """
+    layout, rings = [], []
+    for f, feature in enumerate(features):
+        for p, r, ring in _rings(feature['geometry']):
+            snapped = np.round(np.asarray(ring, dtype='float64')[:, :2] / BASE_GRID).astype('int64')
+            if len(snapped) > 1 and (snapped[0] == snapped[-1]).all():
+                snapped = snapped[:-1]
+            # Drop consecutive duplicates left by snapping
+            snapped = snapped[np.r_[True, (np.diff(snapped, axis=0) != 0).any(axis=1)]]
+            # Islands and holes smaller than the tolerance are not visible at this resolution
+            extent = snapped.max(axis=0) - snapped.min(axis=0) if len(snapped) else np.zeros(2)
+            if tolerance and (extent * BASE_GRID < tolerance).all():
+                continue
+            layout.append((f, p, r))
+            rings.append(snapped)
+    return layout, rings
+
+
+def _simplify_arcs(arcs, tolerance, decimals):
+    """Simplify every arc and quantize it to ``decimals`` (in units of that grid)"""
+    step = 10.0 ** -decimals / BASE_GRID
+    simplified = []
+    for arc in arcs:
+        if tolerance:
+            arc = _simplify_arc(arc, tolerance / BASE_GRID)
+        arc = np.round(arc / step).astype('int64')
+        simplified.append(arc[np.r_[True, (np.diff(arc, axis=0) != 0).any(axis=1)]])
+    return simplified
+
+
+def _close_ring(parts):
+    """Join arc pieces into a closed ring, None when it collapsed below a triangle"""
+    ring = np.concatenate([part if i == 0 else part[1:] for i, part in enumerate(parts)])
+    ring = ring[np.r_[True, (np.diff(ring, axis=0) != 0).any(axis=1)]]
+    if not (ring[0] == ring[-1]).all():
+        ring = np.vstack([ring, ring[:1]])
+    return ring if len(ring) >= 4 else None
+
+
+def _keep_properties(feature, properties):
+    props = feature.get('properties', {})
+    if properties is not None:
+        props = {key: props[key] for key in properties if key in props}
+    return props
+
+
+def simplify_geojson(geojson, tolerance, decimals=None, properties=KEEP_PROPERTIES):
+    """
+    Topology-preserving simplification of a polygon FeatureCollection
+
+    Args:
+        geojson (dict): FeatureCollection of Polygon / MultiPolygon features
+        tolerance (float): Douglas-Peucker tolerance in degrees (None: no simplification)
+        decimals (int): Decimal places kept, defaults to a grid ten times finer than the tolerance
+        properties (tuple): Feature properties to keep (None keeps all)
+
+    Returns:
+        dict: New FeatureCollection
+    """
+    if decimals is None:
+        decimals = _default_decimals(tolerance)
+    grid = 10.0 ** -decimals
+
+    layout, rings = _snap_rings(geojson['features'], tolerance)
+    arcs, ring_arcs = _split_arcs(rings)
+    simplified = _simplify_arcs(arcs, tolerance, decimals)
+
+    # Rebuild the rings from their (shared) arcs
+    polygons = {}
+    for (f, p, r), members in zip(layout, ring_arcs):
+        ring = _close_ring([simplified[arc_id][::-1] if reverse else simplified[arc_id]
+                            for arc_id, reverse in members])
+        if ring is None:
+            # Collapsed ring: a speck of an island or hole, dropped with its holes
+            continue
+        coords = np.round(ring * grid, decimals).tolist()
+        polygons.setdefault(f, {}).setdefault(p, []).append((r, coords))
+
+    features = []
+    for f, feature in enumerate(geojson['features']):
+        parts = [[coords for _, coords in sorted(polygon)] for _, polygon in sorted(polygons.get(f, {}).items())
+                 if polygon and polygon[0][0] == 0]
+        if not parts:
+            # Every polygon collapsed: keep the feature at the rounded source resolution
+            parts = [[np.round(np.asarray(ring, dtype='float64')[:, :2], decimals).tolist() for ring in polygon]
+                     for polygon in feature['geometry']['coordinates']] \
+                if feature['geometry']['type'] == 'MultiPolygon' else \
+                [[np.round(np.asarray(ring, dtype='float64')[:, :2], decimals).tolist()
+                  for ring in feature['geometry']['coordinates']]]
+        features.append({
+            'type': 'Feature',
+            'properties': _keep_properties(feature, properties),
+            'geometry': {'type': 'MultiPolygon', 'coordinates': parts},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def _signed_area(ring):
+    x, y = ring[:, 0].astype('float64'), ring[:, 1].astype('float64')
+    return 0.5 * float((x[:-1] * y[1:] - x[1:] * y[:-1]).sum())
+
+
+def _contains(ring, point):
+    """Even-odd point-in-polygon test of a closed ring"""
+    x, y = ring[:, 0].astype('float64'), ring[:, 1].astype('float64')
+    px, py = float(point[0]), float(point[1])
+    x0, y0, x1, y1 = x[:-1], y[:-1], x[1:], y[1:]
+    crosses = (y0 > py) != (y1 > py)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        at = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+    return bool((crosses & (px < at)).sum() % 2)
+
+
+def _chain_arcs(pieces):
+    """Link directed arcs end to start into closed rings"""
+    outgoing = {}
+    for i, piece in enumerate(pieces):
+        outgoing.setdefault(tuple(piece[0]), []).append(i)
+    used = np.zeros(len(pieces), dtype=bool)
+    rings = []
+    for first in range(len(pieces)):
+        if used[first]:
+            continue
+        used[first] = True
+        parts, start, current = [pieces[first]], tuple(pieces[first][0]), first
+        while tuple(pieces[current][-1]) != start:
+            candidates = [i for i in outgoing.get(tuple(pieces[current][-1]), []) if not used[i]]
+            if not candidates:
+                break
+            current = candidates[0]
+            used[current] = True
+            parts.append(pieces[current])
+        rings.append(parts)
+    return rings
+
+
+def dissolve_geojson(geojson, key, tolerance=None, decimals=None):
+    """
+    Merge polygon features sharing a property value into one feature each
+
+    Rings are cut into arcs as in simplify_geojson; arcs used twice within a
+    group are inner borders and are removed, and the remaining arcs are chained
+    into the group's outline. Rings are first oriented like the first outer
+    ring of the source (holes the other way), so neighbours drawn with
+    opposite winding still chain; holes are assigned to the outer ring
+    containing them.
+
+    Args:
+        geojson (dict): FeatureCollection of Polygon / MultiPolygon features
+        key (str): Feature property to group by
+        tolerance (float): Douglas-Peucker tolerance in degrees (None: no simplification)
+        decimals (int): Decimal places kept, defaults to a grid ten times finer than the tolerance
+
+    Returns:
+        dict: FeatureCollection with one MultiPolygon per value of ``key``, in
+        order of first appearance
+    """
+    if decimals is None:
+        decimals = _default_decimals(tolerance)
+    grid = 10.0 ** -decimals
+
+    features = geojson['features']
+    layout, rings = _snap_rings(features, tolerance)
+    winding = [np.sign(_signed_area(np.vstack([ring, ring[:1]]))) for ring in rings]
+    outers = [i for i, (_, _, r) in enumerate(layout) if r == 0]
+    if outers:
+        # Outer rings wound like the first one, holes the other way
+        for i, (_, _, r) in enumerate(layout):
+            wanted = winding[outers[0]] if r == 0 else -winding[outers[0]]
+            if winding[i] == -wanted:
+                rings[i] = rings[i][::-1]
+    arcs, ring_arcs = _split_arcs(rings)
+    simplified = _simplify_arcs(arcs, tolerance, decimals)
+
+    groups = {}
+    for feature in features:
+        groups.setdefault(feature['properties'].get(key), [])
+    for (f, _, _), members in zip(layout, ring_arcs):
+        groups[features[f]['properties'].get(key)].extend(members)
+
+    dissolved = []
+    for value, members in groups.items():
+        counts = {}
+        for arc_id, _ in members:
+            counts[arc_id] = counts.get(arc_id, 0) + 1
+        pieces = [simplified[arc_id][::-1] if reverse else simplified[arc_id]
+                  for arc_id, reverse in members if counts[arc_id] == 1]
+        outline = [ring for ring in (_close_ring(parts) for parts in _chain_arcs(pieces)) if ring is not None]
+        if not outline:
+            continue
+        areas = [_signed_area(ring) for ring in outline]
+        outer_sign = np.sign(areas[int(np.argmax(np.abs(areas)))])
+        outers = [i for i, area in enumerate(areas) if np.sign(area) == outer_sign]
+        polygons = {i: [outline[i]] for i in outers}
+        for i, area in enumerate(areas):
+            if i in polygons:
+                continue
+            owner = next((j for j in outers if _contains(outline[j], outline[i][0])), outers[0])
+            polygons[owner].append(outline[i])
+        parts = [[np.round(ring * grid, decimals).tolist() for ring in polygon]
+                 for _, polygon in sorted(polygons.items(), key=lambda item: -abs(areas[item[0]]))]
+        dissolved.append({
+            'type': 'Feature',
+            'properties': {key: value},
+            'geometry': {'type': 'MultiPolygon', 'coordinates': parts},
+        })
+    return {'type': 'FeatureCollection', 'features': dissolved}
+
+
+def _cache_path(layer, resolution, source):
+    if not dataloader.cache_dir:
+        return None
+    return os.path.join(dataloader.cache_dir,
+                        f'{layer}-{resolution}-v{LAYER_FORMAT}-{dataloader.dataset_version([source])}.json')
+
+
+@functools.lru_cache(maxsize=None)
+def load_geometry(resolution='low', source=None):
+    """
+    Return the province boundaries at one resolution (memoized)
+
+    Prepared layers are stored in the columnar cache directory under the
+    source file's content hash, so they are built once per file version.
+
+    Args:
+        resolution (str): One of RESOLUTIONS
+        source (str): GeoJSON file, defaults to dataloader.geojson_file
+
+    Returns:
+        dict: GeoJSON FeatureCollection (shared; do not modify)
+    """
+    source = source or dataloader.geojson_file
+    return _load_layer('geometry', resolution, source,
+                       lambda: simplify_geojson(dataloader.load_geojson(source), RESOLUTIONS[resolution]))
+
+
+@functools.lru_cache(maxsize=None)
+def load_region_geometry(resolution='low', source=None, key=REGION_KEY):
+    """
+    Return the health-region outlines at one resolution (memoized)
+
+    The provinces of each health region are dissolved into a single feature,
+    so a region-level map sends 13 features instead of 77. Cached like
+    load_geometry.
+
+    Args:
+        resolution (str): One of RESOLUTIONS
+        source (str): GeoJSON file with the region property, defaults to
+            dataloader.region_geojson_file
+        key (str): Feature property holding the region
+
+    Returns:
+        dict: GeoJSON FeatureCollection keyed by ``properties.<key>`` (shared; do not modify)
+    """
+    source = source or dataloader.region_geojson_file
+    return _load_layer(f'regions-{key}', resolution, source,
+                       lambda: dissolve_geojson(dataloader.load_geojson(source), key, RESOLUTIONS[resolution]))
+
+
+def _load_layer(name, resolution, source, build):
+    """Read a prepared layer from the cache, building and storing it when absent"""
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution {resolution!r}, expected one of {list(RESOLUTIONS)}")
+    path = _cache_path(name, resolution, source)
+    if path and os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading geometry cache {path}: {e}")
+
+    layer = build()
+    if path:
+        try:
+            os.makedirs(dataloader.cache_dir, exist_ok=True)
+            dataloader._write_atomic(path, lambda tmp: _dump(layer, tmp))
+        except OSError as e:
+            print(f"Error writing geometry cache {path}: {e}")
+    return layer
+
+
+def _dump(geojson, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(geojson, f, separators=(',', ':'))
+
+
+def degrees_per_pixel(zoom, tile_size=512):
+    """Longitude degrees covered by one screen pixel at a web-map zoom level"""
+    return 360.0 / (tile_size * 2.0 ** zoom)
+
+
+def pick_resolution(zoom, viewport_width=None, pixel_tolerance=1.0):
+    """
+    Choose the coarsest resolution whose simplification stays under a pixel
+
+    Args:
+        zoom (float): Map zoom level
+        viewport_width (int): Optional map width in pixels; narrow viewports
+            are fitted at a lower zoom by the browser, so they tolerate more
+        pixel_tolerance (float): Allowed simplification error in pixels
+
+    Returns:
+        str: Resolution name
+    """
+    allowed = degrees_per_pixel(zoom) * pixel_tolerance
+    if viewport_width:
+        # The map is laid out for ~800 px; narrower views show the same area in fewer pixels
+        allowed *= max(1.0, 800.0 / viewport_width)
+    candidates = [(tolerance, name) for name, tolerance in RESOLUTIONS.items()
+                  if tolerance is not None and tolerance <= allowed]
+    return max(candidates)[1] if candidates else 'full'
+
+
+def size_report(zoom=5, source=None):
+    """
+    Compare the payload of every resolution with the source file
+
+    Args:
+        zoom (float): Zoom level to report the chosen resolution for
+        source (str): GeoJSON file, defaults to dataloader.geojson_file
+
+    Returns:
+        list: dicts with resolution, tolerance, features, points and bytes
+    """
+    source = source or dataloader.geojson_file
+    source_bytes = len(json.dumps(dataloader.load_geojson(source), separators=(',', ':')))
+    rows = [{'resolution': 'source', 'tolerance': None,
+             'features': len(dataloader.load_geojson(source)['features']),
+             'points': _count_points(dataloader.load_geojson(source)), 'bytes': source_bytes}]
+    for name, tolerance in RESOLUTIONS.items():
+        layer = load_geometry(name, source)
+        rows.append({'resolution': name, 'tolerance': tolerance, 'features': len(layer['features']),
+                     'points': _count_points(layer),
+                     'bytes': len(json.dumps(layer, separators=(',', ':')))})
+    print(f"{'resolution':<10} {'tolerance':>10} {'features':>9} {'points':>8} {'bytes':>10} {'ratio':>7}")
+    for row in rows:
+        tolerance = '-' if row['tolerance'] is None else f"{row['tolerance']:g}"
+        print(f"{row['resolution']:<10} {tolerance:>10} {row['features']:>9} {row['points']:>8} "
+              f"{row['bytes']:>10} {source_bytes / row['bytes']:>6.1f}x")
+    print(f"zoom {zoom}: {pick_resolution(zoom)}")
+    return rows
+
+
+def _count_points(geojson):
+    return sum(len(ring) for feature in geojson['features'] for _, _, ring in _rings(feature['geometry']))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report payload sizes of the simplified province layers")
+    parser.add_argument('--zoom', type=float, default=5, help="map zoom level to pick a resolution for")
+    args = parser.parse_args()
+    size_report(args.zoom)
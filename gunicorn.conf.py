@@ -0,0 +1,25 @@
+# %%
+# gunicorn.conf.py - Production server settings
+#
+# Usage: gunicorn -c gunicorn.conf.py wsgi:server
+#
+# Settings come from NCIVIZ_* environment variables. The app is preloaded in
+# the master (wsgi.py) so the workers share its data copy-on-write.
+import multiprocessing
+import os
+
+bind = os.environ.get('NCIVIZ_BIND', '0.0.0.0:8051')
+workers = int(os.environ.get('NCIVIZ_WORKERS', str(multiprocessing.cpu_count())))
+threads = int(os.environ.get('NCIVIZ_THREADS', '4'))
+worker_class = 'gthread'
+timeout = int(os.environ.get('NCIVIZ_TIMEOUT', '120'))
+preload_app = True
+pidfile = os.environ.get('NCIVIZ_PIDFILE', 'gunicorn.pid')
+
+
+def post_fork(server, worker):
+    # Each worker forks its own render pool (if NCIVIZ_FIGURE_PROCESSES is set)
+    # from the preloaded data before it starts serving
+    import app
+    if app.figure_pool is not None:
+        app.figure_pool.start()
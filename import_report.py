@@ -0,0 +1,70 @@
+# %%
+# import_report.py - Import-time report for the dashboard modules
+#
+# Usage: python import_report.py [--top N] [module ...]
+#
+# Imports each module in a fresh interpreter with ``-X importtime`` and lists
+# the slowest imports, then times the first data load (app.get_data()).
+import argparse
+import subprocess
+import sys
+import time
+
+
+# %%
+def import_profile(module):
+    """
+    Import a module in a fresh interpreter and collect its import timings
+
+    Args:
+        module (str): Module name
+
+    Returns:
+        tuple: (wall seconds, list of (cumulative us, self us, imported module))
+    """
+    start = time.time()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True)
+    elapsed = time.time() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    return elapsed, rows
+
+
+def data_load_time():
+    """Seconds taken by the first app.get_data() call in a fresh interpreter"""
+    code = ('import time, app; start = time.time(); app.get_data(); '
+            'print(time.time() - start)')
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"data load failed:\n{result.stderr.strip()}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def report(modules, top=15):
+    """Print the import-time report for ``modules``"""
+    for module in modules:
+        elapsed, rows = import_profile(module)
+        total = max((row[0] for row in rows if row[2] == module), default=0)
+        print(f"\n== import {module}: {total / 1e6:.3f}s in imports, {elapsed:.3f}s wall (incl. interpreter start)")
+        print(f"{'cumulative':>12} {'self':>10}  module")
+        for cumulative_us, self_us, name in sorted(rows, reverse=True)[:top]:
+            print(f"{cumulative_us / 1e6:>11.3f}s {self_us / 1e6:>9.3f}s  {name}")
+    if 'app' in modules:
+        print(f"\n== first app.get_data(): {data_load_time():.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report import time of the dashboard modules")
+    parser.add_argument('modules', nargs='*', default=['dataloader', 'gen_graph', 'app'],
+                        help="modules to import (default: dataloader gen_graph app)")
+    parser.add_argument('--top', type=int, default=15, help="slowest imports to list per module")
+    args = parser.parse_args()
+    report(args.modules, args.top)
@@ -0,0 +1,237 @@
+# %%
+# jobs.py
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+
+# %%
+class Job:
+    """State of one background job (see JobQueue)"""
+
+    def __init__(self, job_id, store=None):
+        self.id = job_id
+        self.store = store
+        self.future = None
+        self.progress = 0.0
+        self.message = 'Queued'
+        self.cancelled = False
+        self.finished = None
+
+    def report(self, progress, message=None):
+        """Progress hook handed to the job's build function"""
+        self.progress = float(progress)
+        if message is not None:
+            self.message = message
+        if self.store is not None:
+            self.store.save(self.id, {'status': 'running', 'progress': self.progress, 'message': self.message})
+
+
+class JobStore:
+    """
+    Job records shared by every worker process on a node
+
+    Records are small JSON documents in the ``job`` namespace of a
+    figure_cache.DiskCache, so a poll or a cancellation reaching any worker
+    sees the job wherever it runs. Records older than ``keep_seconds`` read as
+    expired (None). Writes read, merge and write a record in one transaction,
+    so progress from the running worker never undoes a cancellation.
+
+    Args:
+        disk (figure_cache.DiskCache): Shared SQLite cache
+        keep_seconds (float): How long records stay readable
+    """
+
+    def __init__(self, disk, keep_seconds=300):
+        self.disk = disk
+        self.keep_seconds = keep_seconds
+
+    def load(self, job_id):
+        """Return the record of a job, or None when unknown or expired"""
+        try:
+            value = self.disk.get(job_id, namespace='job')
+        except Exception as e:
+            print(f"Error reading job {job_id}: {e}")
+            return None
+        return self._parse(value)
+
+    def save(self, job_id, record):
+        """Write a job record, keeping a cancellation made elsewhere"""
+        record = dict(record, updated=time.time())
+
+        def merge(value):
+            previous = self._parse(value)
+            if previous is not None and previous.get('cancelled'):
+                record['cancelled'] = True
+            return json.dumps(record)
+
+        self._update(job_id, merge)
+
+    def cancel(self, job_id):
+        """Flag a running job as cancelled; returns False when it is unknown or finished"""
+
+        def flag(value):
+            record = self._parse(value)
+            if record is None or record['status'] != 'running':
+                return None
+            return json.dumps(dict(record, cancelled=True, message='Cancelled', updated=time.time()))
+
+        return self._update(job_id, flag) is not None
+
+    def _update(self, job_id, function):
+        try:
+            return self.disk.update(job_id, function, namespace='job')
+        except Exception as e:
+            print(f"Error writing job {job_id}: {e}")
+            return None
+
+    def _parse(self, value):
+        if value is None:
+            return None
+        record = json.loads(value)
+        if time.time() - record.get('updated', 0) > self.keep_seconds:
+            return None
+        return record
+
+
+class JobQueue:
+    """
+    Background execution of slow figure builds
+
+    Jobs run on a pool so the request that submits one returns at once; the
+    browser polls ``status`` for progress and the result. A superseded job is
+    cancelled: it is dropped if it has not started yet, and its result is
+    discarded (though still cached by the build) if it has. Finished jobs are
+    forgotten after ``keep_seconds``.
+
+    The pool threads only wait when the build itself runs elsewhere (the
+    figure_pool processes); otherwise they share the worker's GIL with request
+    handling. With a ``store`` the job records are shared between worker
+    processes, so status and cancellation work from any worker; without one
+    a job is only known to the process that runs it.
+
+    Args:
+        max_workers (int): Jobs run at the same time
+        keep_seconds (float): How long finished jobs stay queryable
+        executor (concurrent.futures.Executor): Optional executor to run jobs on
+        store (JobStore): Optional job records shared between processes
+    """
+
+    def __init__(self, max_workers=2, keep_seconds=300, executor=None, store=None):
+        self.keep_seconds = keep_seconds
+        self.store = store
+        self._executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='figure-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, build):
+        """
+        Start a job
+
+        Args:
+            build (callable): ``build(progress)`` returning the result (a
+                string when jobs are shared through a store);
+                ``progress(fraction, message)`` reports how far it got
+
+        Returns:
+            str: Job id
+        """
+        job = Job(uuid.uuid4().hex, self.store)
+
+        def run():
+            if job.cancelled or self._cancelled_elsewhere(job.id):
+                job.cancelled = True
+                raise CancelledError()
+            job.report(0.05, 'Running')
+            try:
+                result = build(job.report)
+            except BaseException as e:
+                self._save(job, {'status': 'error', 'progress': job.progress, 'message': 'Failed', 'error': str(e)})
+                raise
+            finally:
+                job.finished = time.time()
+            self._save(job, {'status': 'done', 'progress': 1.0, 'message': 'Done', 'result': result})
+            return result
+
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+            self._save(job, {'status': 'running', 'progress': 0.0, 'message': 'Queued'})
+            job.future = self._executor.submit(run)
+        return job.id
+
+    def cancel(self, job_id):
+        """Cancel a job; returns False when it is unknown or already finished"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            # Running in another worker: flag it in the shared record
+            return self.store is not None and self.store.cancel(job_id)
+        if job.future.done():
+            return False
+        job.cancelled = True
+        job.message = 'Cancelled'
+        self._save(job, {'status': 'running', 'progress': job.progress, 'message': 'Cancelled', 'cancelled': True})
+        if job.future.cancel():
+            job.finished = time.time()
+        return True
+
+    def status(self, job_id):
+        """
+        Report on a job
+
+        Returns:
+            dict or None: ``status`` ('running', 'done', 'error' or
+            'cancelled'), ``progress`` (0-1) and ``message``, plus ``result``
+            when done or ``error`` on failure; None for a job that is unknown
+            or has expired
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            record = self.store.load(job_id) if self.store is not None else None
+            if record is None:
+                return None
+            if record.get('cancelled'):
+                return {'status': 'cancelled', 'progress': record['progress'], 'message': 'Cancelled'}
+            return {key: value for key, value in record.items() if key not in ('updated', 'cancelled')}
+        if job.cancelled or job.future.cancelled():
+            return {'status': 'cancelled', 'progress': job.progress, 'message': 'Cancelled'}
+        if not job.future.done():
+            return {'status': 'running', 'progress': job.progress, 'message': job.message}
+        error = job.future.exception()
+        if error is not None:
+            return {'status': 'error', 'progress': job.progress, 'message': 'Failed', 'error': str(error)}
+        return {'status': 'done', 'progress': 1.0, 'message': 'Done', 'result': job.future.result()}
+
+    def stats(self):
+        """Return the number of jobs known to this process by status"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {'running': 0, 'finished': 0, 'cancelled': 0}
+        for job in jobs:
+            if job.cancelled:
+                counts['cancelled'] += 1
+            elif job.future.done():
+                counts['finished'] += 1
+            else:
+                counts['running'] += 1
+        return counts
+
+    def _save(self, job, record):
+        if self.store is not None:
+            self.store.save(job.id, record)
+
+    def _cancelled_elsewhere(self, job_id):
+        if self.store is None:
+            return False
+        record = self.store.load(job_id)
+        return bool(record and record.get('cancelled'))
+
+    def _prune(self):
+        # Called with the lock held
+        cutoff = time.time() - self.keep_seconds
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished < cutoff]:
+            del self._jobs[job_id]
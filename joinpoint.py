@@ -0,0 +1,390 @@
+# %%
+# joinpoint.py
+#
+# Log-linear joinpoint trend models for every site/sex ASR series and every
+# site/sex/age-group series, fitted once per dataset version across a process
+# pool and cached on disk, together with the closed-form linear fits the trend
+# graph falls back to.
+#
+# Short series: following the NCI Joinpoint defaults, a series of fewer than
+# 7 observations is fitted with 0 joinpoints, i.e. as one log-linear segment
+# whose APC equals its AAPC. The registry volumes loaded today have 6 (or
+# fewer) observations per series, so every model is currently a single
+# segment; joinpoints are searched for once the series grow longer.
+import itertools
+import multiprocessing
+import os
+import pickle
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import dataloader
+from slice_index import plain_value
+from trend_engine import TrendModel, fit_lines
+
+# Part of the cache file names; bump when the cached models change
+CACHE_FORMAT = 3
+
+
+# %%
+class JoinpointResult(namedtuple('JoinpointResult', [
+        'years', 'joinpoints', 'coef', 'cov', 'sigma2', 'dof', 'segments', 'aapc'])):
+    """
+    Selected joinpoint model for one series
+
+    ``log(ASR) = b0 + b1 * (year - first year) + sum_k d_k * max(year - joinpoint_k, 0)``
+
+    Attributes:
+        years (tuple): Observed years
+        joinpoints (tuple): Selected joinpoint years (may be empty)
+        coef (numpy.ndarray): Regression coefficients on the log scale
+        cov (numpy.ndarray): Unscaled covariance (X'X)^-1 of the coefficients
+        sigma2 (float): Residual variance on the log scale
+        dof (int): Residual degrees of freedom
+        segments (tuple): (start year, end year, APC %) for each segment
+        aapc (float): Average annual percent change over the whole range
+    """
+
+    def _design(self, years):
+        years = np.asarray(years, dtype='float64')
+        columns = [np.ones_like(years), years - self.years[0]] + [np.maximum(years - tau, 0.0) for tau in self.joinpoints]
+        return np.column_stack(columns)
+
+    def fitted(self, years=None):
+        """Fitted ASR at the given years (defaults to the observed years)"""
+        years = self.years if years is None else years
+        return np.exp(self._design(years) @ self.coef)
+
+    def predict(self, years, level=0.95):
+        """
+        Project the model to new years with a prediction interval
+
+        Args:
+            years (list): Years to predict
+            level (float): Coverage of the prediction interval
+
+        Returns:
+            tuple: (prediction, lower, upper) arrays on the ASR scale
+        """
+        X = self._design(years)
+        mean = X @ self.coef
+        if self.dof > 0 and np.isfinite(self.sigma2):
+            from scipy.stats import t
+            se = np.sqrt(self.sigma2 * (1.0 + np.einsum('ij,jk,ik->i', X, self.cov, X)))
+            half_width = t.ppf(0.5 + level / 2.0, self.dof) * se
+        else:
+            half_width = np.full_like(mean, np.nan)
+        return np.exp(mean), np.exp(mean - half_width), np.exp(mean + half_width)
+
+
+def max_joinpoints_for(n_obs):
+    """
+    Recommended maximum number of joinpoints for a series length (NCI Joinpoint defaults)
+
+    0 below 7 observations (a single log-linear segment), then one more
+    joinpoint per 5 observations, up to 5.
+    """
+    if n_obs < 7:
+        return 0
+    return min((n_obs - 2) // 5, 5)
+
+
+def _candidate_sets(n_obs, k, min_obs_end=2, min_obs_between=2):
+    """Index tuples of admissible joinpoint positions among the observations"""
+    positions = range(min_obs_end, n_obs - min_obs_end)
+    for combo in itertools.combinations(positions, k):
+        if all(b - a >= min_obs_between for a, b in zip(combo, combo[1:])):
+            yield combo
+
+
+def _best_placement(years, y, k, min_obs_end, min_obs_between, block=4096):
+    """
+    Least-squares fit of every admissible placement of ``k`` joinpoints
+
+    Placements are solved in blocks through batched normal equations, so the
+    grid search stays in numpy even for long series.
+
+    Returns:
+        tuple or None: (sse, joinpoint years, design matrix, coefficients) of
+        the placement with the smallest error
+    """
+    combos = np.array(list(_candidate_sets(len(years), k, min_obs_end, min_obs_between)), dtype='int64')
+    if len(combos) == 0:
+        return None
+    combos = combos.reshape(len(combos), k)
+    best = None
+    for start in range(0, len(combos), block):
+        taus = years[combos[start:start + block]]
+        hinges = np.maximum(years[None, :, None] - taus[:, None, :], 0.0)
+        base = np.broadcast_to(np.column_stack([np.ones_like(years), years]), (len(taus), len(years), 2))
+        X = np.concatenate([base, hinges], axis=2)
+        try:
+            coef = np.linalg.solve(np.einsum('mij,mik->mjk', X, X), np.einsum('mij,i->mj', X, y)[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            coef = np.stack([np.linalg.lstsq(x, y, rcond=None)[0] for x in X])
+        sse = ((y[None, :] - np.einsum('mij,mj->mi', X, coef)) ** 2).sum(axis=1)
+        i = int(np.argmin(sse))
+        if best is None or sse[i] < best[0]:
+            best = (float(sse[i]), tuple(taus[i]), X[i], coef[i])
+    return best
+
+
+def fit_joinpoint(years, values, max_joinpoints=None, min_obs_end=2, min_obs_between=2):
+    """
+    Fit a log-linear joinpoint model by grid search and pick the number of joinpoints by BIC
+
+    Args:
+        years (array-like): Observed years
+        values (array-like): ASR values (must be positive)
+        max_joinpoints (int): Upper bound on joinpoints, default from the series length
+        min_obs_end (int): Minimum observations between a joinpoint and either end
+        min_obs_between (int): Minimum observations between two joinpoints
+
+    Returns:
+        JoinpointResult or None: None when the series is too short or has
+        non-positive values (log-linear models are undefined there)
+    """
+    years = np.asarray(years, dtype='float64')
+    values = np.asarray(values, dtype='float64')
+    keep = np.isfinite(values)
+    years, values = years[keep], values[keep]
+    n = len(years)
+    if n < 3 or (values <= 0).any():
+        return None
+
+    y = np.log(values)
+    if max_joinpoints is None:
+        max_joinpoints = max_joinpoints_for(n)
+
+    # Years are measured from the first observation to keep the system well conditioned
+    origin = years[0]
+    best = None
+    for k in range(max_joinpoints + 1):
+        best_k = _best_placement(years - origin, y, k, min_obs_end, min_obs_between)
+        if best_k is None:
+            continue
+        sse, taus, X, coef = best_k
+        taus = tuple(tau + origin for tau in taus)
+        n_params = 2 * (k + 1)
+        bic = np.log(max(sse, 1e-300) / n) + n_params * np.log(n) / n
+        if best is None or bic < best[0]:
+            best = (bic, sse, taus, X, coef)
+
+    _, sse, taus, X, coef = best
+    dof = n - X.shape[1]
+    sigma2 = sse / dof if dof > 0 else np.nan
+    cov = np.linalg.inv(X.T @ X)
+
+    # Segment slopes are cumulative sums of the slope and hinge coefficients
+    bounds = [years[0]] + list(taus) + [years[-1]]
+    slopes = np.cumsum(coef[1:])
+    segments = tuple(
+        (int(start), int(end), float(100.0 * (np.exp(slope) - 1.0)))
+        for start, end, slope in zip(bounds[:-1], bounds[1:], slopes)
+    )
+    widths = np.diff(bounds)
+    mean_slope = float((slopes * widths).sum() / widths.sum()) if widths.sum() > 0 else float(slopes[0])
+    aapc = 100.0 * (np.exp(mean_slope) - 1.0)
+
+    return JoinpointResult(
+        years=tuple(int(year) for year in years),
+        joinpoints=tuple(int(tau) for tau in taus),
+        coef=coef, cov=cov, sigma2=sigma2, dof=dof,
+        segments=segments, aapc=float(aapc),
+    )
+
+
+def _fit_chunk(chunk):
+    """Fit a list of (key, years, values) series (runs in a worker process)"""
+    return [(key, fit_joinpoint(years, values)) for key, years, values in chunk]
+
+
+def series_matrix(asr_df):
+    """
+    Collect every site/sex trend series as (key, years, values)
+
+    Keys are (site, sex), including a 'Both' series per site with the sexes
+    summed as in the trend graph. Values are rounded to 3 decimals like the
+    displayed data.
+
+    Args:
+        asr_df (pandas.DataFrame): ASR frame (Site, Sex, Year, ASR World)
+
+    Returns:
+        list: (key, years, values) tuples
+    """
+    by_sex = asr_df.pivot_table(index='Year', columns=['Site', 'Sex'], values='ASR World',
+                                aggfunc='mean', observed=True)
+    both = asr_df.groupby(['Year', 'Site'], observed=True)['ASR World'].sum().unstack('Site')
+    both.columns = pd.MultiIndex.from_arrays([both.columns, ['Both'] * len(both.columns)])
+    matrix = pd.concat([by_sex, both], axis=1).sort_index().astype('float64').round(3)
+
+    return _matrix_series(matrix)
+
+
+def age_series_matrix(age_df):
+    """
+    Collect every site/sex/age-group series as (key, years, values)
+
+    Keys are (site, sex, age group). Values are the mean ASR per year rounded
+    to 3 decimals, as in the age distribution graph.
+
+    Args:
+        age_df (pandas.DataFrame): Age-group frame (Site, Sex, Year, Age_Group, ASR)
+
+    Returns:
+        list: (key, years, values) tuples
+    """
+    matrix = age_df.pivot_table(index='Year', columns=['Site', 'Sex', 'Age_Group'], values='ASR',
+                                aggfunc='mean', observed=True)
+    return _matrix_series(matrix.sort_index().astype('float64').round(3))
+
+
+def _matrix_series(matrix):
+    """(key, years, values) of every column of a Year x series matrix"""
+    years = matrix.index.to_numpy()
+    return [
+        (tuple(plain_value(label) for label in column), years, values)
+        for column, values in zip(matrix.columns, matrix.to_numpy().T)
+    ]
+
+
+def fit_all(series, processes=None, chunk_size=64):
+    """
+    Fit joinpoint models for many series across a process pool
+
+    Args:
+        series (list): (key, years, values) tuples
+        processes (int): Worker processes, defaults to the number of cores;
+            1 fits in the current process
+        chunk_size (int): Series per task
+
+    Returns:
+        dict: key -> JoinpointResult (or None when the series cannot be fitted)
+    """
+    chunks = [series[i:i + chunk_size] for i in range(0, len(series), chunk_size)]
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(chunks) <= 1:
+        results = [_fit_chunk(chunk) for chunk in chunks]
+    else:
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=min(processes, len(chunks)), mp_context=context) as pool:
+            results = list(pool.map(_fit_chunk, chunks))
+    return dict(item for chunk in results for item in chunk)
+
+
+def fit_linear(series):
+    """
+    Closed-form linear fits of many series in one vectorized solve
+
+    Args:
+        series (list): (key, years, values) tuples sharing the same years
+
+    Returns:
+        dict: key -> TrendModel (series with fewer than 2 values are left out)
+    """
+    if not series:
+        return {}
+    years = series[0][1]
+    fit = fit_lines(years, np.column_stack([values for _, _, values in series]))
+    return {
+        key: TrendModel(*(plain_value(fit[name][i]) for name in TrendModel._fields))
+        for i, (key, _, _) in enumerate(series)
+        if fit['n'][i] >= 2
+    }
+
+
+class JoinpointEngine:
+    """
+    Joinpoint models for every site/sex series, including 'Both', and every
+    site/sex/age-group series
+
+    Results are cached in ``dataloader.cache_dir`` under the dataset version,
+    so the model search runs once per data release rather than per worker or
+    per request. Series with zero or negative values have no model (None);
+    the trend graph falls back to their linear fit, which is stored for every
+    series alongside.
+
+    Args:
+        results (dict): key -> JoinpointResult, as returned by fit_all
+        linear (dict): key -> TrendModel, as returned by fit_linear
+    """
+
+    def __init__(self, results, linear=None):
+        self._results = results
+        self._linear = linear or {}
+
+    @classmethod
+    def build(cls, asr_df, version, age_df=None, processes=None):
+        """
+        Load the models for ``version`` from the cache, fitting them if absent
+
+        Args:
+            asr_df (pandas.DataFrame): National ASR frame
+            version (str): Dataset version (see dataloader.dataset_version)
+            age_df (pandas.DataFrame): Optional age-group ASR frame
+            processes (int): Worker processes for fitting
+
+        Returns:
+            JoinpointEngine
+        """
+        path = (os.path.join(dataloader.cache_dir, f'joinpoints-v{CACHE_FORMAT}-{version}.pkl')
+                if dataloader.cache_dir else None)
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    cached = pickle.load(f)
+                return cls(cached['joinpoints'], cached['linear'])
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError, TypeError) as e:
+                print(f"Error reading joinpoint cache {path}: {e}")
+
+        series = series_matrix(asr_df)
+        age_series = age_series_matrix(age_df) if age_df is not None else []
+        results = fit_all(series + age_series, processes=processes)
+        linear = fit_linear(series)
+        if path:
+            try:
+                os.makedirs(dataloader.cache_dir, exist_ok=True)
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump({'joinpoints': results, 'linear': linear}, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Error writing joinpoint cache {path}: {e}")
+        return cls(results, linear)
+
+    def get(self, site, sex, age_group=None):
+        """
+        Return the joinpoint model of a series
+
+        Args:
+            site (str): Cancer site
+            sex (str): 'Male' or 'Female', or 'Both' for the national series
+            age_group (str): Age group, None for the national (all ages) series
+
+        Returns:
+            JoinpointResult or None: None if the series is unknown or has no model
+        """
+        key = (site, sex) if age_group is None else (site, sex, age_group)
+        return self._results.get(key)
+
+    def linear(self, site, sex):
+        """Return the linear TrendModel of a national (Site, Sex) series, or None"""
+        return self._linear.get((site, sex))
+
+    def table(self):
+        """Return APC/AAPC summaries of every fitted series as a DataFrame"""
+        rows = []
+        for key, result in self._results.items():
+            if result is None:
+                continue
+            rows.append({
+                'series': key,
+                'joinpoints': result.joinpoints,
+                'aapc': result.aapc,
+                'last_apc': result.segments[-1][2],
+            })
+        return pd.DataFrame(rows)
@@ -0,0 +1,111 @@
+# %%
+# memory_report.py - Shared vs unique memory of the gunicorn master and workers
+#
+# Usage: python memory_report.py [--pidfile gunicorn.pid | --pid PID]
+#
+# Reads /proc/<pid>/smaps_rollup (Linux) for the master and every descendant
+# process. "Shared" is resident memory also mapped by another process (the
+# preloaded data, as long as no worker writes to it); "Unique" is memory only
+# that process holds. PSS splits shared pages evenly, so the PSS total is the
+# real footprint of the whole tree. Elsewhere (macOS, Windows, kernels
+# before 4.14) the report says so and exits.
+import argparse
+import os
+import sys
+
+SMAPS_AVAILABLE = os.path.exists('/proc/self/smaps_rollup')
+
+
+# %%
+def smaps_rollup(pid):
+    """
+    Memory counters of one process in kB
+
+    Returns:
+        dict: Rss, Pss, Shared_Clean, Shared_Dirty, Private_Clean, Private_Dirty, ...
+    """
+    counters = {}
+    with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                counters[parts[0][:-1]] = int(parts[1])
+    return counters
+
+
+def process_tree(pid):
+    """Return ``pid`` followed by all of its descendants (empty if it is gone)"""
+    try:
+        tasks = os.listdir(f'/proc/{pid}/task')
+    except OSError:
+        return []
+    pids = [pid]
+    for task in tasks:
+        try:
+            with open(f'/proc/{pid}/task/{task}/children', 'r') as f:
+                children = [int(child) for child in f.read().split()]
+        except OSError:
+            continue
+        for child in children:
+            pids.extend(process_tree(child))
+    return pids
+
+
+def memory_rows(pid):
+    """
+    Per-process memory of a process tree
+
+    Args:
+        pid (int): Root process (the gunicorn master)
+
+    Returns:
+        list: dicts with pid, role and rss, pss, shared, unique in kB
+    """
+    rows = []
+    for process in process_tree(pid):
+        try:
+            counters = smaps_rollup(process)
+        except OSError:
+            continue
+        rows.append({
+            'pid': process,
+            'role': 'master' if process == pid else 'worker',
+            'rss': counters.get('Rss', 0),
+            'pss': counters.get('Pss', 0),
+            'shared': counters.get('Shared_Clean', 0) + counters.get('Shared_Dirty', 0),
+            'unique': counters.get('Private_Clean', 0) + counters.get('Private_Dirty', 0),
+        })
+    return rows
+
+
+def report(pid):
+    """Print the memory table of a process tree"""
+    if not SMAPS_AVAILABLE:
+        print("Per-process memory needs /proc/<pid>/smaps_rollup (Linux 4.14 or later), "
+              "which this system does not provide")
+        return []
+    rows = memory_rows(pid)
+    if not rows:
+        print(f"No process {pid} (or no permission to read its memory counters)")
+        return rows
+    print(f"{'pid':>8} {'role':<7} {'RSS MB':>9} {'PSS MB':>9} {'shared MB':>10} {'unique MB':>10}")
+    for row in rows:
+        print(f"{row['pid']:>8} {row['role']:<7} {row['rss'] / 1024:>9.1f} {row['pss'] / 1024:>9.1f} "
+              f"{row['shared'] / 1024:>10.1f} {row['unique'] / 1024:>10.1f}")
+    total_rss = sum(row['rss'] for row in rows)
+    total_pss = sum(row['pss'] for row in rows)
+    print(f"{'total':>8} {'':<7} {total_rss / 1024:>9.1f} {total_pss / 1024:>9.1f}   "
+          f"(RSS counts shared pages once per process; PSS is the actual footprint)")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report shared vs unique memory of the server processes")
+    parser.add_argument('--pidfile', default=os.environ.get('NCIVIZ_PIDFILE', 'gunicorn.pid'),
+                        help="gunicorn pid file (see gunicorn.conf.py)")
+    parser.add_argument('--pid', type=int, help="master pid, instead of the pid file")
+    args = parser.parse_args()
+    if args.pid is None:
+        with open(args.pidfile, 'r') as f:
+            args.pid = int(f.read().strip())
+    sys.exit(0 if report(args.pid) else 1)
@@ -0,0 +1,101 @@
+# %%
+# olap_cube.py
+from itertools import combinations, product
+import pandas as pd
+from slice_index import plain_value
+
+
+# %%
+class AggregationCube:
+    """
+    Pre-aggregated measure over every roll-up of a set of dimensions
+
+    All 2^n combinations of the dimensions are aggregated once when the cube
+    is built. Any dimension left out of a lookup is rolled up ("all sexes",
+    "all regions", ...), so every filter combination is answered by dictionary
+    lookups instead of a per-request group-by. Adding a dimension only means
+    passing one more column name.
+
+    Args:
+        df (pandas.DataFrame): Source dataframe
+        dimensions (list): Label columns to aggregate over
+        measure (str): Numeric column to aggregate
+        agg (str): Aggregation used for roll-ups, e.g. 'sum' or 'mean'
+    """
+
+    def __init__(self, df, dimensions, measure, agg='sum'):
+        self.dimensions = tuple(dimensions)
+        self.measure = measure
+        self.agg = agg
+        self.members = {dim: _members(df[dim]) for dim in self.dimensions}
+
+        values = df[measure].astype('float64')
+        self._cells = {}
+        for size in range(len(self.dimensions) + 1):
+            for kept in combinations(self.dimensions, size):
+                if kept:
+                    grouped = values.groupby([df[dim] for dim in kept], observed=True).agg(agg)
+                    cells = {
+                        (key if isinstance(key, tuple) else (key,)): value
+                        for key, value in grouped.items()
+                    }
+                else:
+                    cells = {(): values.agg(agg)}
+                self._cells[kept] = {
+                    tuple(plain_value(label) for label in key): float(value)
+                    for key, value in cells.items()
+                    if pd.notna(value)
+                }
+
+    def lookup(self, by=(), **filters):
+        """
+        Return the aggregated measure for a filter combination
+
+        Args:
+            by (tuple or dict): Dimensions to break the result down by. A dict
+                maps each dimension to the members to return, in that order;
+                a tuple returns all members of each dimension.
+            **filters: Dimension -> label to fix; every other dimension not in
+                ``by`` is rolled up
+
+        Returns:
+            float or pandas.Series: A scalar (None if the cell is empty) when
+            ``by`` is empty, otherwise a Series indexed by the ``by`` members
+            that have data
+        """
+        if not isinstance(by, dict):
+            by = {dim: self.members[dim] for dim in by}
+        unknown = (set(by) | set(filters)) - set(self.dimensions)
+        if unknown:
+            raise KeyError(f"Unknown cube dimensions: {sorted(unknown)}")
+
+        kept = tuple(dim for dim in self.dimensions if dim in by or dim in filters)
+        cells = self._cells[kept]
+        fixed = {dim: plain_value(label) for dim, label in filters.items()}
+
+        if not by:
+            return cells.get(tuple(fixed[dim] for dim in kept))
+
+        by_dims = list(by)
+        labels, data = [], []
+        for combo in product(*(by[dim] for dim in by_dims)):
+            fixed.update(zip(by_dims, (plain_value(label) for label in combo)))
+            value = cells.get(tuple(fixed[dim] for dim in kept))
+            if value is not None:
+                labels.append(combo)
+                data.append(value)
+
+        if len(by_dims) == 1:
+            index = pd.Index([combo[0] for combo in labels], name=by_dims[0])
+        else:
+            index = pd.MultiIndex.from_tuples(labels, names=by_dims) if labels else \
+                pd.MultiIndex.from_arrays([[] for _ in by_dims], names=by_dims)
+        return pd.Series(data, index=index, name=self.measure, dtype='float64')
+
+
+def _members(series):
+    """Observed labels of a column, in category order for categoricals"""
+    observed = set(series.dropna().unique().tolist())
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return [plain_value(label) for label in series.cat.categories if label in observed]
+    return sorted(plain_value(label) for label in observed)
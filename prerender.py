@@ -0,0 +1,141 @@
+# %%
+# prerender.py - Build-time pre-render of every figure combination
+#
+# Usage: python prerender.py [--jobs N] [--survival-regions N] [--out prerendered]
+#
+# Walks every filter combination the dashboard exposes, renders the figures
+# in parallel and writes them as a bundle that app.py serves directly.
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import app
+import figure_encoding
+from figure_cache import make_figure_key, key_filename
+
+
+# %%
+def figure_combinations(max_survival_regions=1):
+    """
+    Enumerate the filter combinations of every cacheable visualization
+
+    Survival selections are ordered (line style follows selection order), so
+    all ordered region choices up to ``max_survival_regions`` are generated,
+    plus the dashboard's default selection, combined with every non-empty set
+    of stages.
+
+    Args:
+        max_survival_regions (int): Longest region selection to enumerate (max 3)
+
+    Returns:
+        list: dicts with button_id, year, site, sex, regions and stages (and
+        resolution for the maps)
+    """
+    data = app.get_data()
+    combos = []
+    sexes = ['Both'] + list(data.fig1_option.get('sex_options', []))
+    for button_id in ('btn-trend', 'btn-map', 'map-region'):
+        for site, sex in itertools.product(data.fig1_option.get('cancer_types', []), sexes):
+            combo = dict(button_id=button_id, year=None, site=site, sex=sex, regions=None, stages=None)
+            if button_id != 'btn-trend':
+                # Maps at the resolution they open with; zoomed-in layers are built on demand
+                combo['resolution'] = app.map_resolution()
+            combos.append(combo)
+
+    for site in data.fig2_option.get('cancer_types', []):
+        combos.append(dict(button_id='btn-age', year=None, site=site, sex=None, regions=None, stages=None))
+
+    for year in data.fig3_option.get('years', []):
+        combos.append(dict(button_id='btn-top10', year=int(year), site=None, sex=None, regions=None, stages=None))
+    combos.append(dict(button_id='btn-rank', year=None, site=None, sex=None, regions=None, stages=None))
+
+    regions = list(data.fig5_option.get('health_regions', []))
+    stages = list(data.fig5_option.get('stages', []))
+    region_choices = [['all', '2']]
+    for size in range(1, min(max_survival_regions, 3) + 1):
+        region_choices += [list(choice) for choice in itertools.permutations(regions, size)]
+    stage_choices = [list(choice) for size in range(1, len(stages) + 1)
+                     for choice in itertools.combinations(stages, size)]
+    seen = set()
+    for cancer in data.fig5_option.get('cancer_types', []):
+        for selected_regions, selected_stages in itertools.product(region_choices, stage_choices):
+            marker = (cancer, tuple(selected_regions), tuple(selected_stages))
+            if marker in seen:
+                continue
+            seen.add(marker)
+            combos.append(dict(button_id='btn-stats', year=None, site=cancer, sex=None,
+                               regions=selected_regions, stages=selected_stages))
+    return combos
+
+
+def _render(args):
+    """Render one combination into the bundle directory (runs in a worker)"""
+    combo, out_dir = args
+    key = make_figure_key(combo['button_id'], app.get_data().dataset_version, **{k: v for k, v in combo.items() if k != 'button_id'})
+    filename = key_filename(key)
+    try:
+        figure_json = figure_encoding.figure_to_json(app.render_figure(**combo))
+    except Exception as e:
+        print(f"Error rendering {combo}: {e}")
+        return None, 0
+    tmp_path = os.path.join(out_dir, f'{filename}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(figure_json)
+    os.replace(tmp_path, os.path.join(out_dir, filename))
+    return filename, len(figure_json)
+
+
+def build_bundle(out_root='prerendered', jobs=None, max_survival_regions=1):
+    """
+    Render every combination and write the bundle for the current dataset version
+
+    Args:
+        out_root (str): Bundle root directory
+        jobs (int): Worker processes, defaults to the number of cores
+        max_survival_regions (int): Longest survival region selection to render
+
+    Returns:
+        str: Path of the written bundle
+    """
+    # Load the datasets before forking so the workers inherit them
+    data = app.get_data()
+    out_dir = os.path.join(out_root, data.dataset_version)
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+
+    combos = figure_combinations(max_survival_regions)
+    jobs = jobs or os.cpu_count() or 1
+    print(f"Rendering {len(combos)} figures with {jobs} processes into {out_dir}")
+
+    start = time.time()
+    files, total_bytes = [], 0
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+        tasks = ((combo, out_dir) for combo in combos)
+        for filename, size in pool.map(_render, tasks, chunksize=16):
+            if filename is not None:
+                files.append(filename)
+                total_bytes += size
+
+    manifest = {'version': data.dataset_version, 'created': time.time(), 'files': files}
+    with open(os.path.join(out_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    print(f"Wrote {len(files)} figures ({total_bytes / 1e6:.1f} MB) in {time.time() - start:.1f}s")
+    return out_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-render every dashboard figure to static JSON")
+    parser.add_argument('--out', default=os.environ.get('NCIVIZ_PRERENDER_DIR', 'prerendered'),
+                        help="bundle root directory")
+    parser.add_argument('--jobs', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--survival-regions', type=int, default=1,
+                        help="longest ordered survival region selection to render (1-3)")
+    args = parser.parse_args()
+    build_bundle(args.out, args.jobs, args.survival_regions)
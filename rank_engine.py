@@ -0,0 +1,95 @@
+# %%
+# rank_engine.py
+import numpy as np
+import pandas as pd
+from slice_index import plain_value
+
+
+# %%
+class RankTable:
+    """
+    Site rankings for every year and sex, computed once at load time
+
+    For each sex the values are laid out as a Year x Site matrix and every row
+    is sorted in one vectorized pass (descending, missing values last, ties in
+    row order like ``nlargest``). The result is kept as a compact table of
+    site positions per rank, so a top-N query for any year and any N is a
+    slice, and the rank of every site in every year is available for
+    rank-over-time views.
+
+    Args:
+        df (pandas.DataFrame): ASR frame with Year, Sex, Site and the value column
+        value (str): Column to rank by
+        exclude (tuple): Sites left out of the ranking
+    """
+
+    def __init__(self, df, value='ASR World', exclude=('All sites',)):
+        self.value = value
+        df = df[~df['Site'].isin(exclude)]
+        self.years = [plain_value(year) for year in sorted(df['Year'].unique())]
+        self.sexes = [plain_value(sex) for sex in df['Sex'].dropna().unique()]
+        self._tables = {}
+        for sex in self.sexes:
+            matrix = (df[df['Sex'] == sex].set_index(['Year', 'Site'])[value]
+                      .unstack('Site').reindex(self.years))
+            matrix = matrix.loc[:, matrix.notna().any(axis=0)]
+            values = matrix.to_numpy()
+            missing = np.isnan(values)
+            # Descending stable sort with missing values pushed to the end
+            order = np.argsort(np.where(missing, np.inf, -values), axis=1, kind='stable')
+            ranks = np.empty_like(order)
+            np.put_along_axis(ranks, order, np.arange(1, values.shape[1] + 1)[None, :], axis=1)
+            self._tables[sex] = {
+                'sites': np.array([plain_value(site) for site in matrix.columns], dtype=object),
+                'order': order.astype('int16'),
+                'sorted': np.take_along_axis(values, order, axis=1),
+                'count': (~missing).sum(axis=1),
+                'ranks': np.where(missing, 0, ranks).astype('int16'),
+                'values': values,
+            }
+
+    def top(self, year, sex, n=10):
+        """
+        Return the top ``n`` sites of a year and sex
+
+        Args:
+            year (int): Year
+            sex (str): 'Male' or 'Female'
+            n (int): Number of sites; None for all ranked sites
+
+        Returns:
+            pandas.DataFrame: Site and value columns in rank order (empty if
+            the year or sex is unknown)
+        """
+        table = self._tables.get(sex)
+        year = plain_value(year)
+        if table is None or year not in self.years:
+            return pd.DataFrame({'Site': pd.Series(dtype=object), self.value: pd.Series(dtype='float64')})
+        row = self.years.index(year)
+        n = table['count'][row] if n is None else min(n, table['count'][row])
+        return pd.DataFrame({
+            'Site': table['sites'][table['order'][row, :n]],
+            self.value: table['sorted'][row, :n],
+        })
+
+    def ranks(self, sex):
+        """
+        Return the rank of every site in every year for one sex
+
+        Args:
+            sex (str): 'Male' or 'Female'
+
+        Returns:
+            pandas.DataFrame: Year x Site ranks (1 = highest), NaN where the
+            site has no value that year
+        """
+        table = self._tables[sex]
+        ranks = pd.DataFrame(table['ranks'], index=pd.Index(self.years, name='Year'),
+                             columns=pd.Index(table['sites'], name='Site'))
+        return ranks.where(ranks > 0)
+
+    def values(self, sex):
+        """Return the ranked values of one sex as a Year x Site DataFrame"""
+        table = self._tables[sex]
+        return pd.DataFrame(table['values'], index=pd.Index(self.years, name='Year'),
+                            columns=pd.Index(table['sites'], name='Site'))
@@ -0,0 +1,84 @@
+# %%
+# slice_index.py
+import pandas as pd
+
+
+# %%
+class SliceIndex:
+    """
+    Precomputed sub-frames of a dataframe keyed by label values
+
+    The index is built once at load time for a fixed set of key levels, e.g.
+    ``[('Site',), ('Site', 'Sex'), ('Year', 'Sex')]``. A lookup on any of those
+    column combinations is a dictionary access, independent of the number of
+    rows in the source frame.
+
+    Args:
+        df (pandas.DataFrame): Source dataframe
+        levels (list): Tuples of column names to index on
+    """
+
+    def __init__(self, df, levels):
+        self.columns = list(df.columns)
+        self._empty = df.iloc[:0]
+        self._levels = {}
+        for level in levels:
+            level = tuple(level)
+            groups = df.groupby(list(level), observed=True, sort=False).indices
+            slices = {}
+            for key, rows in groups.items():
+                key = key if isinstance(key, tuple) else (key,)
+                key = tuple(plain_value(value) for value in key)
+                slices[key] = df.take(rows)
+            self._levels[frozenset(level)] = (level, slices)
+
+    def has_level(self, *columns):
+        """Return True if lookups on exactly ``columns`` are indexed"""
+        return frozenset(columns) in self._levels
+
+    def get(self, **labels):
+        """
+        Return the rows matching all given labels
+
+        Args:
+            **labels: Column name -> label, covering exactly one indexed level
+
+        Returns:
+            pandas.DataFrame: Matching rows (empty if the key is absent)
+        """
+        try:
+            level, slices = self._levels[frozenset(labels)]
+        except KeyError:
+            raise KeyError(f"No slice level indexed for columns {sorted(labels)}") from None
+        key = tuple(plain_value(labels[column]) for column in level)
+        return slices.get(key, self._empty)
+
+    def keys(self, *columns):
+        """Return the keys present for an indexed level"""
+        level, slices = self._levels[frozenset(columns)]
+        return [dict(zip(level, key)) for key in slices]
+
+
+def plain_value(value):
+    """Convert numpy scalars to plain Python values so keys hash consistently"""
+    return value.item() if hasattr(value, 'item') else value
+
+
+def select_rows(df, index=None, **labels):
+    """
+    Select rows by label, through a SliceIndex when one covers the labels
+
+    Args:
+        df (pandas.DataFrame): Source dataframe (used when no index applies)
+        index (SliceIndex): Optional prebuilt index over ``df``
+        **labels: Column name -> label
+
+    Returns:
+        pandas.DataFrame: Matching rows
+    """
+    if index is not None and index.has_level(*labels):
+        return index.get(**labels)
+    mask = pd.Series(True, index=df.index)
+    for column, label in labels.items():
+        mask &= df[column] == label
+    return df[mask]
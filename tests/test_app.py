@@ -0,0 +1,119 @@
+# %%
+# test_app.py
+import threading
+import time
+
+import pytest
+
+app = pytest.importorskip('app')
+
+
+def test_concurrent_first_requests_load_once():
+    app._load_data.cache_clear()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(app.get_data())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(data) for data in results}) == 1
+    assert app._load_data.cache_info().misses == 1
+
+
+def test_layout_lists_loaded_filter_options():
+    data = app.get_data()
+    layout = str(app.serve_layout())
+    assert data.fig1_option['cancer_types'][0] in layout
+
+
+def test_age_animation_is_streamed_with_controls():
+    figure = app.get_figure('btn-age', None, 'Breast', None, None, None)
+    assert len(figure['frames']) >= app.STREAM_MIN_FRAMES
+    content = str(app.render_content('btn-age', None, 'Breast', None, None, None)[0])
+    for component_id in ('age-stream-graph', 'age-stream-year', 'age-stream-play',
+                         'age-stream-pause', 'age-stream-reset', 'age-stream-timer'):
+        assert component_id in content
+
+
+def test_split_animation_starts_at_the_last_year():
+    figure = app.get_figure('btn-age', None, 'Breast', None, None, None)
+    initial, frames = app.split_animation(figure)
+    last = figure['frames'][-1]
+    assert 'frames' not in initial and 'sliders' not in initial['layout']
+    assert list(frames) == [frame['name'] for frame in figure['frames']]
+    assert initial['layout']['annotations'] == last['layout']['annotations']
+
+
+def test_stream_batch_fetches_nearest_unloaded_years():
+    years = ['2005', '2008', '2011', '2014', '2017', '2020']
+    assert app.stream_batch(years, 1, {'2020'}, size=3) == ['2008', '2005', '2011']
+    assert app.stream_batch(years, 5, set(years)) == []
+
+
+def test_stream_controls():
+    assert app.stream_controls('age-stream-play', 5, 5) == (0, False)
+    assert app.stream_controls('age-stream-play', 2, 5) == (3, False)
+    assert app.stream_controls('age-stream-timer', 4, 5) == (5, True)
+    assert app.stream_controls('age-stream-pause', 3, 5) == (3, True)
+    assert app.stream_controls('age-stream-reset', 3, 5) == (0, True)
+
+
+def test_poll_of_an_unknown_job_never_rebuilds():
+    before = app.job_queue.stats()
+    job = {'id': 'unknown', 'viz': 'btn-stats', 'filters': [None, 'no such site', None, ['all'], ['stage1']]}
+    content, _, view_state, _, label, stop = app.poll_job(1, job, {'viz': 'btn-stats', 'job': 'unknown'}, None)
+    assert 'unknown or has expired' in str(content)
+    assert label == 'Expired' and stop and view_state == {'viz': 'btn-stats'}
+    assert app.job_queue.stats() == before
+
+
+def test_poll_swaps_in_the_finished_figure():
+    filters = list(app.figure_filters('btn-stats', None, 'breast', None, None, None))
+    job_id = app.job_queue.submit(lambda progress: app.get_figure_json('btn-stats', *filters, progress=progress))
+    job = {'id': job_id, 'viz': 'btn-stats', 'filters': filters}
+    for _ in range(500):
+        content, _, _, value, label, stop = app.poll_job(1, job, {'viz': 'btn-stats', 'job': job_id}, None)
+        if stop:
+            break
+        time.sleep(0.01)
+    assert label == 'Done' and value == 100
+    assert 'Graph' in str(content)
+
+
+def test_map_filter_change_is_one_action_and_one_build():
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+
+    site = app.get_data().fig1_option['cancer_types'][1]
+    _, map_state = app.render_content('btn-map', None, 'Breast', 'Female', None, None, {'level': 'province'})
+    before = app.build_counter.stats()
+    # The site dropdown changes while the map is shown: the dispatcher leaves it
+    # to update_map, which recolours the map
+    context_value.set(AttributeDict(triggered_inputs=[{'prop_id': 'filter-site.value', 'value': site}]))
+    outputs = app.dispatch(*[None] * 8, None, site, 'Female', None, None, map_state, {'viz': 'btn-map'})
+    assert outputs[-3:] == (app.dash.no_update,) * 3
+    context_value.set(AttributeDict(triggered_inputs=[{'prop_id': 'filter-site.value', 'value': site}]))
+    app.update_map('province', site, 'Female', None, map_state)
+    after = app.build_counter.stats()
+    assert after['actions'] - before['actions'] == 1
+    assert after['requests'] - before['requests'] == 1
+
+
+def test_map_resolution_follows_the_view():
+    assert app.map_resolution() == app.map_resolution({'zoom': app.MAP_ZOOM}) == 'low'
+    assert app.map_resolution({'zoom': 8, 'width': 900}) == 'high'
+    assert app.map_resolution({'zoom': 12, 'width': 900}) == 'full'
+    # A narrow map tolerates a coarser layer at the same zoom
+    assert app.map_resolution({'zoom': 6, 'width': 300}) == 'low'
+
+
+def test_zooming_in_redraws_the_map_at_a_finer_resolution():
+    shown = {'level': 'province', 'site': 'Breast', 'sex': 'Female', 'resolution': 'low'}
+    with pytest.raises(app.dash.exceptions.PreventUpdate):
+        app.update_map('province', 'Breast', 'Female', {'zoom': 5.1, 'width': 900}, shown)
+    figure, state = app.update_map('province', 'Breast', 'Female', {'zoom': 8, 'width': 900}, shown)
+    assert state['resolution'] == 'high'
+    assert figure['layout']['uirevision'] == 'map'
+    coarse = app.get_figure('btn-map', None, 'Breast', 'Female', None, None, 'low')
+    points = lambda fig: len(str(fig['data'][0]['geojson']))
+    assert points(figure) > points(coarse)
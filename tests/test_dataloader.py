@@ -0,0 +1,34 @@
+# %%
+# test_dataloader.py
+import pandas as pd
+import pytest
+
+import dataloader
+
+pytest.importorskip('pyarrow')
+pytest.importorskip('openpyxl')
+
+
+@pytest.fixture
+def workbook(tmp_path, monkeypatch):
+    path = tmp_path / 'book.xlsx'
+    pd.DataFrame({'a': [1, 'x', 2.5], 'b': [1, 2, 3]}).to_excel(path, index=False)
+    monkeypatch.setattr(dataloader, 'cache_dir', str(tmp_path / 'cache'))
+    return str(path)
+
+
+def test_read_columnar_caches_and_rereads(workbook):
+    first = dataloader.read_columnar(workbook, ['b'])
+    second = dataloader.read_columnar(workbook, ['b'])
+    assert first['b'].tolist() == second['b'].tolist() == [1, 2, 3]
+
+
+def test_read_columnar_survives_cache_write_failure(workbook, monkeypatch):
+    import pyarrow
+
+    def fail(self, *args, **kwargs):
+        raise pyarrow.ArrowTypeError('mixed column')
+
+    monkeypatch.setattr(pd.DataFrame, 'to_parquet', fail)
+    df = dataloader.read_columnar(workbook, ['b'])
+    assert df['b'].tolist() == [1, 2, 3]
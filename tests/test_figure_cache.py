@@ -0,0 +1,95 @@
+# %%
+# test_figure_cache.py
+import sqlite3
+import threading
+import time
+
+from figure_cache import DiskCache, FigureCache, make_figure_key
+
+
+def test_make_figure_key_ignores_unused_filters():
+    a = make_figure_key('btn-top10', 'v1', year=2019, site='Lung', sex='Male')
+    b = make_figure_key('btn-top10', 'v1', year=2019, site='Liver', sex='Female')
+    assert a == b
+    assert a != make_figure_key('btn-top10', 'v2', year=2019)
+
+
+def test_lru_bound_counts_utf8_bytes():
+    cache = FigureCache(max_bytes=10)
+    cache.put('a', 'ก' * 3)   # 9 bytes, 3 characters
+    cache.put('b', 'xx')      # pushes the total over 10 bytes
+    assert cache.get('a') is None
+    assert cache.get('b') == 'xx'
+    stats = cache.stats()
+    assert stats['bytes'] == 2 and stats['evictions'] == 1
+
+
+def test_get_or_build_builds_once_for_concurrent_callers():
+    cache = FigureCache()
+    calls = []
+
+    def build():
+        calls.append(1)
+        time.sleep(0.05)
+        return '{}'
+
+    threads = [threading.Thread(target=cache.get_or_build, args=('k', build)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert cache.get('k') == '{}'
+
+
+def test_disk_cache_namespaces_and_size(tmp_path):
+    disk = DiskCache(str(tmp_path / 'cache.db'), max_bytes=12)
+    disk.put('k', 'figure')
+    disk.put('k', 'job', namespace='job')
+    assert disk.get('k') == 'figure'
+    assert disk.get('k', namespace='job') == 'job'
+    disk.put('big', 'ก' * 5)  # 15 bytes: over the bound, not stored
+    assert disk.get('big') is None
+    stats = disk.stats()
+    assert stats['hits'] == 2 and stats['misses'] == 1
+
+
+def test_disk_level_is_shared_between_caches(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first = FigureCache(disk=DiskCache(path))
+    second = FigureCache(disk=DiskCache(path))
+    first.get_or_build(('btn-rank', 'v1'), lambda: '{"data": []}')
+    assert second.get_or_build(('btn-rank', 'v1'), lambda: 1 / 0) == '{"data": []}'
+
+
+def test_disk_errors_are_misses_and_skipped_writes(tmp_path, monkeypatch):
+    disk = DiskCache(str(tmp_path / 'cache.db'))
+    cache = FigureCache(disk=disk)
+
+    def locked():
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(disk, '_connect', locked)
+    assert cache.get_or_build(('btn-rank', 'v1'), lambda: '{"data": []}') == '{"data": []}'
+    stats = disk.stats()
+    assert stats['errors'] >= 2 and stats['entries'] is None
+    monkeypatch.undo()
+    assert disk.get(('btn-rank', 'v1')) is None
+
+
+def test_hits_only_touch_stale_access_times(tmp_path):
+    disk = DiskCache(str(tmp_path / 'cache.db'), touch_seconds=60)
+    disk.put('k', 'v')
+    accessed = lambda: disk._connect().execute('SELECT accessed FROM cache').fetchone()[0]
+    first = accessed()
+    assert disk.get('k') == 'v' and accessed() == first
+    disk._connect().execute('UPDATE cache SET accessed = accessed - 120')
+    assert disk.get('k') == 'v' and accessed() > first - 120
+
+
+def test_update_reads_and_writes_in_one_step(tmp_path):
+    disk = DiskCache(str(tmp_path / 'cache.db'))
+    assert disk.update('k', lambda value: (value or '') + 'a', namespace='job') == 'a'
+    assert disk.update('k', lambda value: value + 'b', namespace='job') == 'ab'
+    assert disk.update('k', lambda value: None, namespace='job') is None
+    assert disk.get('k', namespace='job') == 'ab' and disk.get('k') is None
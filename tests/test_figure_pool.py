@@ -0,0 +1,46 @@
+# %%
+# test_figure_pool.py
+import os
+import signal
+
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+
+import app
+import figure_encoding
+from figure_pool import FigurePool
+
+FILTERS = (None, 'Breast', 'Female', None, None)
+
+
+@pytest.fixture
+def pool():
+    pool = FigurePool(app.render_figure_json, processes=1, max_queue=2, prepare=app.get_data)
+    yield pool.start()
+    pool.shutdown()
+
+
+def test_render_matches_in_process_json(pool):
+    for button_id in ('btn-trend', 'btn-top10'):
+        expected = figure_encoding.figure_to_json(app.render_figure(button_id, *FILTERS))
+        assert pool.render(button_id, *FILTERS, timeout=120) == expected
+    stats = pool.stats()
+    assert stats['started'] and stats['completed'] == 2 and stats['pending'] == 0
+    assert stats['max_queue'] == 2
+
+
+def test_render_needs_an_explicit_start():
+    pool = FigurePool(app.render_figure_json, processes=1)
+    with pytest.raises(RuntimeError):
+        pool.render('btn-trend', *FILTERS)
+    assert not pool.stats()['started']
+
+
+def test_pool_restarts_after_a_worker_dies(pool):
+    worker = pool._executor.submit(os.getpid).result()
+    os.kill(worker, signal.SIGKILL)
+    with pytest.raises(BrokenProcessPool):
+        pool.render('btn-trend', *FILTERS, timeout=120)
+    assert pool.render('btn-trend', *FILTERS, timeout=120)
+    stats = pool.stats()
+    assert stats['failures'] == 1 and stats['restarts'] == 1 and stats['completed'] == 1
@@ -0,0 +1,60 @@
+# %%
+# test_gen_graph.py
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataloader
+import gen_graph
+from olap_cube import AggregationCube
+
+
+@pytest.fixture
+def age_frame():
+    # Female rows every year, Male rows (zeros) only in the last year, as the
+    # registry workbooks have for sex-specific sites
+    rows = []
+    for year in (2014, 2017, 2020):
+        for i, age in enumerate(dataloader.AGE_GROUPS):
+            rows.append(('Cervix uteri', 'Female', year, age, 1.0 + i + year % 10))
+            if year == 2020:
+                rows.append(('Cervix uteri', 'Male', year, age, 0.0))
+    return pd.DataFrame(rows, columns=['Site', 'Sex', 'Year', 'Age_Group', 'ASR'])
+
+
+def test_age_frames_skip_sexes_without_rows(age_frame):
+    fig = gen_graph.create_animated_age_distribution_graph(age_frame, 'Cervix uteri')
+    assert [trace.name for trace in fig.data] == ['Male', 'Female']
+    assert [frame.traces for frame in fig.frames] == [(1,), (1,), (0, 1)]
+    assert all(len(trace.x) == len(dataloader.AGE_GROUPS) for frame in fig.frames for trace in frame.data)
+
+
+def test_age_frames_match_with_and_without_cube(age_frame):
+    cube = AggregationCube(age_frame, ['Site', 'Sex', 'Year', 'Age_Group'], 'ASR', agg='mean')
+    plain = gen_graph.create_animated_age_distribution_graph(age_frame, 'Cervix uteri')
+    cubed = gen_graph.create_animated_age_distribution_graph(age_frame, 'Cervix uteri', cube=cube)
+    for a, b in zip(plain.frames, cubed.frames):
+        assert a.traces == b.traces
+        for trace_a, trace_b in zip(a.data, b.data):
+            assert np.allclose(trace_a.y, trace_b.y)
+
+
+def test_single_sex_site_has_one_trace(age_frame):
+    female = age_frame[age_frame['Sex'] == 'Female']
+    fig = gen_graph.create_animated_age_distribution_graph(female, 'Cervix uteri')
+    assert len(fig.data) == 1
+    assert all(frame.traces == (0,) for frame in fig.frames)
+
+
+def test_age_hover_shows_the_age_group_aapc(age_frame, tmp_path, monkeypatch):
+    from joinpoint import JoinpointEngine
+    monkeypatch.setattr(dataloader, 'cache_dir', str(tmp_path))
+    national = age_frame.rename(columns={'ASR': 'ASR World'})
+    engine = JoinpointEngine.build(national, 'v1', age_df=age_frame, processes=1)
+    fig = gen_graph.create_animated_age_distribution_graph(age_frame, 'Cervix uteri', joinpoints=engine)
+    female = next(trace for trace in fig.data if trace.name == 'Female')
+    expected = f"{engine.get('Cervix uteri', 'Female', dataloader.AGE_GROUPS[0]).aapc:.2f}%"
+    assert female.customdata[0] == expected
+    assert 'AAPC' in female.hovertemplate
+    # Male rows are all zero: no log-linear model
+    assert set(fig.frames[-1].data[0].customdata) == {'n/a'}
@@ -0,0 +1,126 @@
+# %%
+# test_geometry.py
+import collections
+import itertools
+import os
+
+import numpy as np
+import pytest
+
+import dataloader
+import geometry
+
+
+def _area(geom):
+    """Area of a MultiPolygon: outer rings minus holes"""
+    total = 0.0
+    for polygon in geom['coordinates']:
+        for i, ring in enumerate(polygon):
+            area = abs(geometry._signed_area(np.asarray(ring)))
+            total += area if i == 0 else -area
+    return total
+
+
+def _rings(geojson):
+    for feature in geojson['features']:
+        geom = feature['geometry']
+        for polygon in geom['coordinates'] if geom['type'] == 'MultiPolygon' else [geom['coordinates']]:
+            yield from polygon
+
+
+def _edge_owners(geojson):
+    owners = collections.defaultdict(set)
+    for i, feature in enumerate(geojson['features']):
+        for polygon in feature['geometry']['coordinates']:
+            for ring in polygon:
+                for a, b in zip(ring, ring[1:]):
+                    owners[frozenset((tuple(a), tuple(b)))].add(i)
+    return owners
+
+
+def _adjacency(geojson):
+    return {pair for owners in _edge_owners(geojson).values()
+            for pair in itertools.combinations(sorted(owners), 2)}
+
+
+@pytest.fixture
+def two_provinces():
+    # Two unit squares sharing a wiggly border at x = 1, plus a speck of an island
+    border = [[1.0 + 0.001 * np.sin(k), k / 50.0] for k in range(51)]
+    west = [[0.0, 0.0]] + border + [[0.0, 1.0], [0.0, 0.0]]
+    east = [border[0], [2.0, 0.0], [2.0, 1.0]] + border[::-1]
+    island = [[3.0, 3.0], [3.0001, 3.0], [3.0001, 3.0001], [3.0, 3.0]]
+    return {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'pro_code': 1, 'health_region': 'A'},
+         'geometry': {'type': 'MultiPolygon', 'coordinates': [[west], [island]]}},
+        {'type': 'Feature', 'properties': {'pro_code': 2, 'health_region': 'A'},
+         'geometry': {'type': 'Polygon', 'coordinates': [east]}},
+    ]}
+
+
+def test_shared_border_stays_shared(two_provinces):
+    simplified = geometry.simplify_geojson(two_provinces, 0.01)
+    shared = [edge for edge, owners in _edge_owners(simplified).items() if owners == {0, 1}]
+    assert shared
+    # No gap or overlap: the parts add up to their dissolved union
+    union = geometry.dissolve_geojson(two_provinces, 'health_region', 0.01)
+    assert len(union['features']) == 1
+    total = sum(_area(feature['geometry']) for feature in simplified['features'])
+    assert total == pytest.approx(_area(union['features'][0]['geometry']))
+
+
+def test_dissolve_handles_mixed_winding(two_provinces):
+    # Reverse the east province so the two are wound in opposite directions
+    east = two_provinces['features'][1]['geometry']
+    east['coordinates'] = [east['coordinates'][0][::-1]]
+    union = geometry.dissolve_geojson(two_provinces, 'health_region', 0.01)
+    simplified = geometry.simplify_geojson(two_provinces, 0.01)
+    total = sum(_area(feature['geometry']) for feature in simplified['features'])
+    assert _area(union['features'][0]['geometry']) == pytest.approx(total)
+
+
+def test_rings_stay_closed_with_at_least_four_points(two_provinces):
+    simplified = geometry.simplify_geojson(two_provinces, 0.01)
+    for ring in _rings(simplified):
+        assert len(ring) >= 4 and ring[0] == ring[-1]
+    # The island is smaller than the tolerance and is dropped
+    assert len(simplified['features'][0]['geometry']['coordinates']) == 1
+
+
+def test_no_simplification_keeps_every_vertex(two_provinces):
+    full = geometry.simplify_geojson(two_provinces, None)
+    assert sum(len(ring) for ring in _rings(full)) == sum(len(ring) for ring in _rings(two_provinces))
+
+
+def test_pick_resolution_gets_coarser_when_zoomed_out():
+    order = list(geometry.RESOLUTIONS)
+    levels = [order.index(geometry.pick_resolution(zoom)) for zoom in (12, 8, 5, 3)]
+    assert levels == sorted(levels) and levels[0] < levels[-1]
+
+
+@pytest.fixture(scope='module')
+def provinces():
+    if not os.path.exists(dataloader.region_geojson_file):
+        pytest.skip('province boundaries not available')
+    return dataloader.load_geojson(dataloader.region_geojson_file)
+
+
+@pytest.mark.parametrize('resolution', ['high', 'medium', 'low'])
+def test_provinces_keep_their_borders_and_regions(provinces, resolution):
+    tolerance = geometry.RESOLUTIONS[resolution]
+    simplified = geometry.simplify_geojson(provinces, tolerance, properties=None)
+    regions = geometry.dissolve_geojson(provinces, geometry.REGION_KEY, tolerance)
+
+    # Every province keeps its neighbours, and no edge is used by more than two provinces
+    assert _adjacency(simplified) == _adjacency(geometry.simplify_geojson(provinces, None, properties=None))
+    assert max(len(owners) for owners in _edge_owners(simplified).values()) == 2
+    assert min(len(ring) for ring in _rings(simplified)) >= 4
+
+    # Each dissolved region covers exactly its provinces
+    province_area = collections.defaultdict(float)
+    for feature in simplified['features']:
+        province_area[feature['properties'][geometry.REGION_KEY]] += _area(feature['geometry'])
+    assert {feature['properties'][geometry.REGION_KEY] for feature in regions['features']} == set(province_area)
+    for feature in regions['features']:
+        region = feature['properties'][geometry.REGION_KEY]
+        assert _area(feature['geometry']) == pytest.approx(province_area[region], rel=1e-9)
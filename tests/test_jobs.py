@@ -0,0 +1,120 @@
+# %%
+# test_jobs.py
+import threading
+import time
+
+import pytest
+
+from figure_cache import DiskCache
+from jobs import JobQueue, JobStore
+
+
+def wait_for(queue, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = queue.status(job_id)
+        if status is None or status['status'] != 'running':
+            return status
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} still running")
+
+
+def blocked_queue(store=None):
+    """Queue with one pool thread, held by a first job until the event is set"""
+    release = threading.Event()
+    queue = JobQueue(max_workers=1, store=store)
+    queue.submit(lambda progress: release.wait(5) and 'first')
+    return queue, release
+
+
+def test_status_reports_progress_and_result():
+    queue = JobQueue(max_workers=1)
+    started, release = threading.Event(), threading.Event()
+
+    def build(progress):
+        progress(0.5, 'Halfway')
+        started.set()
+        release.wait(5)
+        return '{}'
+
+    job_id = queue.submit(build)
+    started.wait(5)
+    assert queue.status(job_id) == {'status': 'running', 'progress': 0.5, 'message': 'Halfway'}
+    release.set()
+    assert wait_for(queue, job_id) == {'status': 'done', 'progress': 1.0, 'message': 'Done', 'result': '{}'}
+
+
+def test_failed_job_reports_the_error():
+    queue = JobQueue(max_workers=1)
+    status = wait_for(queue, queue.submit(lambda progress: 1 / 0))
+    assert status['status'] == 'error' and 'division' in status['error']
+
+
+def test_cancel_drops_a_queued_job():
+    queue, release = blocked_queue()
+    ran = []
+    job_id = queue.submit(lambda progress: ran.append(1))
+    assert queue.cancel(job_id)
+    release.set()
+    assert wait_for(queue, job_id)['status'] == 'cancelled'
+    assert not ran
+    assert not queue.cancel(job_id)
+
+
+def test_unknown_job_has_no_status():
+    queue = JobQueue(max_workers=1)
+    assert queue.status('missing') is None
+    assert not queue.cancel('missing')
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(DiskCache(str(tmp_path / 'cache.db')))
+
+
+def test_shared_store_reports_jobs_of_other_workers(store):
+    owner, other = JobQueue(max_workers=1, store=store), JobQueue(max_workers=1, store=JobStore(store.disk))
+    job_id = owner.submit(lambda progress: '{"data": []}')
+    wait_for(owner, job_id)
+    assert other.status(job_id) == {'status': 'done', 'progress': 1.0, 'message': 'Done', 'result': '{"data": []}'}
+
+
+def test_shared_store_cancels_jobs_of_other_workers(store):
+    owner, release = blocked_queue(store)
+    other = JobQueue(max_workers=1, store=JobStore(store.disk))
+    ran = []
+    job_id = owner.submit(lambda progress: ran.append(1) or 'late')
+    assert other.cancel(job_id)
+    release.set()
+    assert wait_for(owner, job_id)['status'] == 'cancelled'
+    assert other.status(job_id)['status'] == 'cancelled'
+    assert not ran
+
+
+def test_expired_records_read_as_unknown(store):
+    queue = JobQueue(max_workers=1, store=store)
+    job_id = queue.submit(lambda progress: 'x')
+    wait_for(queue, job_id)
+    assert JobQueue(store=JobStore(store.disk, keep_seconds=-1)).status(job_id) is None
+
+
+def test_progress_racing_a_cancel_keeps_it(store, monkeypatch):
+    job_id = 'raced'
+    store.save(job_id, {'status': 'running', 'progress': 0.1, 'message': 'Running'})
+    read, parse = threading.Event(), store._parse
+
+    def slow_parse(value):
+        # Hold the progress write between its read and its write
+        read.set()
+        time.sleep(0.2)
+        return parse(value)
+
+    monkeypatch.setattr(store, '_parse', slow_parse)
+    writer = threading.Thread(target=store.save,
+                              args=(job_id, {'status': 'running', 'progress': 0.5, 'message': 'Halfway'}))
+    writer.start()
+    read.wait(5)
+    assert JobStore(store.disk).cancel(job_id)
+    writer.join()
+    record = JobStore(store.disk).load(job_id)
+    assert record['cancelled'] and record['progress'] == 0.5
@@ -0,0 +1,101 @@
+# %%
+# test_joinpoint.py
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataloader
+from joinpoint import JoinpointEngine, age_series_matrix, fit_joinpoint, fit_linear, max_joinpoints_for, series_matrix
+from trend_engine import fit_series
+
+
+def test_max_joinpoints_follows_series_length():
+    assert [max_joinpoints_for(n) for n in (3, 6, 7, 12, 17, 40)] == [0, 0, 1, 2, 3, 5]
+
+
+def test_short_series_is_one_log_linear_segment():
+    years = np.array([2005, 2008, 2011, 2014, 2017, 2020])
+    values = np.array([26.0, 26.8, 29.03, 31.76, 34.67, 35.2])
+    result = fit_joinpoint(years, values)
+    assert result.joinpoints == ()
+    assert len(result.segments) == 1
+    slope = np.polyfit(years, np.log(values), 1)[0]
+    assert result.aapc == pytest.approx(100.0 * (np.exp(slope) - 1.0))
+    assert result.segments[0][2] == pytest.approx(result.aapc)
+    assert result.fitted() == pytest.approx(np.exp(np.polyval(np.polyfit(years, np.log(values), 1), years)))
+
+
+def test_long_series_finds_the_joinpoint():
+    years = np.arange(2000, 2020)
+    log_values = np.where(years < 2010, 3.0 + 0.05 * (years - 2000), 3.5 - 0.03 * (years - 2010))
+    result = fit_joinpoint(years, np.exp(log_values))
+    assert result.joinpoints == (2010,)
+    assert result.segments[0][2] == pytest.approx(100.0 * (np.exp(0.05) - 1.0))
+    assert result.segments[1][2] == pytest.approx(100.0 * (np.exp(-0.03) - 1.0))
+
+
+def test_non_positive_series_has_no_model():
+    assert fit_joinpoint([2005, 2008, 2011, 2014], [1.0, 0.0, 2.0, 3.0]) is None
+
+
+def test_prediction_interval_contains_the_projection():
+    years = np.array([2005, 2008, 2011, 2014, 2017, 2020])
+    result = fit_joinpoint(years, [10.0, 10.9, 12.2, 13.1, 14.6, 15.8])
+    prediction, lower, upper = result.predict([2023, 2026])
+    assert (lower < prediction).all() and (prediction < upper).all()
+
+
+@pytest.fixture
+def asr_frame():
+    years = [2005, 2008, 2011, 2014, 2017, 2020]
+    return pd.DataFrame({
+        'Site': ['Liver'] * 12,
+        'Sex': ['Male'] * 6 + ['Female'] * 6,
+        'Year': years * 2,
+        'ASR World': [30.0, 31.0, 32.5, 33.0, 34.8, 36.0, 10.0, 10.5, 11.1, 11.4, 12.0, 12.6],
+    })
+
+
+def test_series_matrix_adds_both_as_the_sum_of_sexes(asr_frame):
+    series = {key: values for key, years, values in series_matrix(asr_frame)}
+    assert set(series) == {('Liver', 'Male'), ('Liver', 'Female'), ('Liver', 'Both')}
+    assert series[('Liver', 'Both')] == pytest.approx(series[('Liver', 'Male')] + series[('Liver', 'Female')])
+
+
+def test_engine_is_cached_per_dataset_version(asr_frame, tmp_path, monkeypatch):
+    monkeypatch.setattr(dataloader, 'cache_dir', str(tmp_path))
+    engine = JoinpointEngine.build(asr_frame, 'v1', processes=1)
+    assert (tmp_path / 'joinpoints-v3-v1.pkl').exists()
+    cached = JoinpointEngine.build(asr_frame.iloc[:0], 'v1', processes=1)
+    assert cached.get('Liver', 'Both').aapc == pytest.approx(engine.get('Liver', 'Both').aapc)
+    assert cached.get('Liver', 'Unknown') is None
+
+
+def test_linear_fits_match_single_series_fits(asr_frame):
+    series = series_matrix(asr_frame)
+    linear = fit_linear(series)
+    for key, years, values in series:
+        assert linear[key] == pytest.approx(fit_series(years, values))
+
+
+def test_engine_stores_the_linear_fallback(asr_frame, tmp_path, monkeypatch):
+    monkeypatch.setattr(dataloader, 'cache_dir', str(tmp_path))
+    frame = asr_frame.assign(**{'ASR World': asr_frame['ASR World'].where(asr_frame['Sex'] == 'Male', 0.0)})
+    engine = JoinpointEngine.build(frame, 'v1', processes=1)
+    cached = JoinpointEngine.build(frame.iloc[:0], 'v1', processes=1)
+    # Zero values: no log-linear model, but a stored line
+    assert engine.get('Liver', 'Female') is None
+    assert cached.linear('Liver', 'Female').slope == pytest.approx(0.0)
+    assert cached.linear('Liver', 'Male') == pytest.approx(engine.linear('Liver', 'Male'))
+
+
+def test_age_group_series_have_their_own_models(asr_frame, tmp_path, monkeypatch):
+    monkeypatch.setattr(dataloader, 'cache_dir', str(tmp_path))
+    age_frame = pd.concat([asr_frame.assign(Age_Group=age, ASR=asr_frame['ASR World'] * factor)
+                           for age, factor in (('40-', 0.5), ('45-', 2.0))])
+    assert {key for key, _, _ in age_series_matrix(age_frame)} == {
+        ('Liver', sex, age) for sex in ('Male', 'Female') for age in ('40-', '45-')}
+    engine = JoinpointEngine.build(asr_frame, 'v1', age_df=age_frame, processes=1)
+    # Scaling a series leaves its APC unchanged
+    assert engine.get('Liver', 'Male', '45-').aapc == pytest.approx(engine.get('Liver', 'Male').aapc)
+    assert engine.get('Liver', 'Both', '45-') is None
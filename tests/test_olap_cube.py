@@ -0,0 +1,58 @@
+# %%
+# test_olap_cube.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from olap_cube import AggregationCube
+
+
+@pytest.fixture
+def asr_frame():
+    rng = np.random.default_rng(1)
+    rows = [(site, sex, year) for site in ('Liver', 'Colon', 'Cervix uteri')
+            for sex in ('Male', 'Female') for year in (2014, 2017, 2020)
+            if not (site == 'Cervix uteri' and sex == 'Male')]
+    df = pd.DataFrame(rows, columns=['Site', 'Sex', 'Year'])
+    df['ASR World'] = rng.uniform(1.0, 40.0, len(df)).astype('float32')
+    df['Sex'] = pd.Categorical(df['Sex'], categories=['Male', 'Female'])
+    return df
+
+
+@pytest.mark.parametrize('agg', ['sum', 'mean'])
+def test_roll_ups_match_groupby(asr_frame, agg):
+    cube = AggregationCube(asr_frame, ['Site', 'Sex', 'Year'], 'ASR World', agg=agg)
+    values = asr_frame['ASR World'].astype('float64')
+    assert cube.lookup() == pytest.approx(values.agg(agg))
+    for (site, year), expected in values.groupby([asr_frame['Site'], asr_frame['Year']]).agg(agg).items():
+        # Sex left out of the lookup is rolled up
+        assert cube.lookup(Site=site, Year=np.int64(year)) == pytest.approx(expected)
+
+
+def test_breakdown_matches_groupby(asr_frame):
+    cube = AggregationCube(asr_frame, ['Site', 'Sex', 'Year'], 'ASR World')
+    liver = asr_frame[asr_frame['Site'] == 'Liver']
+    expected = liver.groupby('Year')['ASR World'].sum().astype('float64')
+    pd.testing.assert_series_equal(cube.lookup(by=('Year',), Site='Liver'), expected, check_names=False)
+    assert cube.lookup(by=('Year',), Site='Liver').index.name == 'Year'
+
+    by_sex_year = cube.lookup(by=('Sex', 'Year'), Site='Colon')
+    colon = asr_frame[asr_frame['Site'] == 'Colon']
+    expected = colon.groupby(['Sex', 'Year'], observed=True)['ASR World'].sum().astype('float64')
+    assert by_sex_year.to_dict() == pytest.approx(expected.to_dict())
+
+
+def test_members_and_empty_cells(asr_frame):
+    cube = AggregationCube(asr_frame, ['Site', 'Sex', 'Year'], 'ASR World')
+    # Category order for categoricals, sorted otherwise
+    assert cube.members['Sex'] == ['Male', 'Female']
+    assert cube.members['Site'] == ['Cervix uteri', 'Colon', 'Liver']
+    assert cube.lookup(Site='Cervix uteri', Sex='Male') is None
+    by_sex = cube.lookup(by={'Sex': ['Female', 'Male']}, Site='Cervix uteri')
+    assert list(by_sex.index) == ['Female']
+
+
+def test_unknown_dimension_raises(asr_frame):
+    cube = AggregationCube(asr_frame, ['Site', 'Sex'], 'ASR World')
+    with pytest.raises(KeyError):
+        cube.lookup(Year=2020)
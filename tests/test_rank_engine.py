@@ -0,0 +1,49 @@
+# %%
+# test_rank_engine.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from rank_engine import RankTable
+
+
+@pytest.fixture
+def asr_frame():
+    rng = np.random.default_rng(3)
+    sites = ['All sites', 'Liver', 'Colon', 'Stomach', 'Lung', 'Rectum', 'Bladder']
+    rows = [(site, sex, year) for site in sites for sex in ('Male', 'Female') for year in (2014, 2017, 2020)]
+    df = pd.DataFrame(rows, columns=['Site', 'Sex', 'Year'])
+    df['ASR World'] = rng.uniform(1.0, 40.0, len(df)).round(1)
+    # A tie, and a site missing in one year
+    df.loc[(df['Sex'] == 'Male') & (df['Year'] == 2017) & df['Site'].isin(['Colon', 'Lung']), 'ASR World'] = 12.5
+    return df[~((df['Site'] == 'Bladder') & (df['Sex'] == 'Female') & (df['Year'] == 2020))]
+
+
+def _sorted_top(df, year, sex, n):
+    rows = df[(df['Year'] == year) & (df['Sex'] == sex) & (df['Site'] != 'All sites')]
+    return rows.nlargest(n, 'ASR World')[['Site', 'ASR World']].reset_index(drop=True)
+
+
+@pytest.mark.parametrize('n', [3, 10])
+def test_top_matches_nlargest(asr_frame, n):
+    ranks = RankTable(asr_frame)
+    for year in (2014, 2017, 2020):
+        for sex in ('Male', 'Female'):
+            pd.testing.assert_frame_equal(ranks.top(year, sex, n), _sorted_top(asr_frame, year, sex, n))
+
+
+def test_top_all_and_unknown(asr_frame):
+    ranks = RankTable(asr_frame)
+    assert len(ranks.top(2020, 'Female', None)) == 5
+    assert ranks.top(1999, 'Male').empty
+    assert ranks.top(2020, 'Other').empty
+
+
+def test_ranks_follow_values(asr_frame):
+    table = RankTable(asr_frame)
+    ranks = table.ranks('Female')
+    values = table.values('Female')
+    expected = values.rank(axis=1, ascending=False, method='first')
+    pd.testing.assert_frame_equal(ranks.astype('float64'), expected)
+    assert np.isnan(ranks.loc[2020, 'Bladder'])
+    assert 'All sites' not in ranks.columns
@@ -0,0 +1,60 @@
+# %%
+# test_slice_index.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from slice_index import SliceIndex, select_rows
+
+
+@pytest.fixture
+def asr_frame():
+    rng = np.random.default_rng(0)
+    rows = [(site, sex, year) for site in ('Liver', 'Colon', 'Cervix uteri')
+            for sex in ('Male', 'Female') for year in (2014, 2017, 2020)
+            if not (site == 'Cervix uteri' and sex == 'Male')]
+    df = pd.DataFrame(rows, columns=['Site', 'Sex', 'Year'])
+    df['ASR World'] = rng.uniform(1.0, 40.0, len(df))
+    for column in ('Site', 'Sex'):
+        df[column] = df[column].astype('category')
+    return df.sample(frac=1.0, random_state=0)
+
+
+@pytest.fixture
+def index(asr_frame):
+    return SliceIndex(asr_frame, [('Site',), ('Site', 'Sex'), ('Year', 'Sex')])
+
+
+def test_get_matches_groupby(asr_frame, index):
+    for (site, sex), expected in asr_frame.groupby(['Site', 'Sex'], observed=True):
+        pd.testing.assert_frame_equal(index.get(Sex=sex, Site=site), expected)
+    for (year, sex), expected in asr_frame.groupby(['Year', 'Sex'], observed=True):
+        # numpy scalars and plain values find the same slice
+        pd.testing.assert_frame_equal(index.get(Year=np.int64(year), Sex=sex), expected)
+
+
+def test_missing_key_is_an_empty_frame(asr_frame, index):
+    empty = index.get(Site='Cervix uteri', Sex='Male')
+    assert empty.empty
+    assert list(empty.columns) == list(asr_frame.columns)
+
+
+def test_unindexed_level_raises(index):
+    assert not index.has_level('Year')
+    with pytest.raises(KeyError):
+        index.get(Year=2020)
+
+
+def test_keys_cover_observed_combinations(asr_frame, index):
+    keys = {(key['Site'], key['Sex']) for key in index.keys('Site', 'Sex')}
+    assert keys == set(asr_frame.groupby(['Site', 'Sex'], observed=True).groups)
+
+
+def test_select_rows_matches_boolean_mask(asr_frame, index):
+    for labels in ({'Site': 'Liver'}, {'Site': 'Colon', 'Sex': 'Female'}, {'Year': 2017},
+                   {'Site': 'Liver', 'Year': 2014}):
+        mask = np.logical_and.reduce([asr_frame[column] == label for column, label in labels.items()])
+        expected = asr_frame[mask]
+        # Through the index where a level covers the labels, by mask otherwise
+        pd.testing.assert_frame_equal(select_rows(asr_frame, index, **labels), expected)
+        pd.testing.assert_frame_equal(select_rows(asr_frame, **labels), expected)
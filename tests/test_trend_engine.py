@@ -0,0 +1,45 @@
+# %%
+# test_trend_engine.py
+import numpy as np
+import pytest
+
+from trend_engine import fit_lines, fit_series, r_squared
+
+
+def test_fit_lines_matches_polyfit():
+    rng = np.random.default_rng(2)
+    years = np.array([2005, 2008, 2011, 2014, 2017, 2020])
+    values = rng.uniform(5.0, 40.0, (len(years), 4))
+    values[1, 2] = np.nan
+    fit = fit_lines(years, values)
+    for column in range(values.shape[1]):
+        observed = ~np.isnan(values[:, column])
+        x, y = years[observed], values[observed, column]
+        slope, intercept = np.polyfit(x, y, 1)
+        predicted = np.polyval([slope, intercept], x)
+        assert fit['n'][column] == observed.sum()
+        assert fit['slope'][column] == pytest.approx(slope)
+        assert fit['intercept'][column] == pytest.approx(intercept)
+        assert fit['resid_var'][column] == pytest.approx(((y - predicted) ** 2).sum() / (len(x) - 2))
+        assert fit['r2'][column] == pytest.approx(r_squared(y, predicted))
+
+
+def test_series_with_one_observation_has_no_line():
+    fit = fit_lines([2014, 2017, 2020], np.array([[np.nan], [3.0], [np.nan]]))
+    assert fit['n'][0] == 1
+    assert np.isnan(fit['slope'][0]) and np.isnan(fit['r2'][0])
+
+
+def test_fit_series_predicts_the_line():
+    model = fit_series([2014, 2017, 2020], [10.0, 11.5, 13.0])
+    assert model.slope == pytest.approx(0.5)
+    assert model.r2 == pytest.approx(1.0)
+    assert model.n == 3
+    assert model.predict([2023]) == pytest.approx([14.5])
+
+
+def test_r_squared_constant_series_convention():
+    assert r_squared([2.0, 2.0, 2.0], [2.0, 2.0, 2.0]) == 1.0
+    assert r_squared([2.0, 2.0, 2.0], [1.0, 2.0, 3.0]) == 0.0
+    assert r_squared([1.0, 2.0, 3.0], [1.0, 2.0, 3.0]) == pytest.approx(1.0)
+    assert r_squared([1.0, 2.0, 3.0], [2.0, 2.0, 2.0]) == pytest.approx(0.0)
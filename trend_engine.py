@@ -0,0 +1,83 @@
+# %%
+# trend_engine.py
+#
+# Closed-form least-squares lines, used by the trend graph for series that
+# have no log-linear joinpoint model (see joinpoint.py).
+from collections import namedtuple
+import numpy as np
+from slice_index import plain_value
+
+
+# %%
+class TrendModel(namedtuple('TrendModel', ['slope', 'intercept', 'resid_var', 'r2', 'n'])):
+    """Least-squares line ``ASR = intercept + slope * year`` for one series"""
+
+    def predict(self, years):
+        """Evaluate the fitted line at the given years"""
+        return self.intercept + self.slope * np.asarray(years, dtype='float64')
+
+
+def fit_lines(x, y):
+    """
+    Closed-form least-squares fit of many series at once
+
+    Args:
+        x (numpy.ndarray): Years, shape (n_years,)
+        y (numpy.ndarray): Values, shape (n_years, n_series); NaN marks a
+            missing observation
+
+    Returns:
+        dict: Arrays of slope, intercept, resid_var, r2 and n, one entry per
+        series (NaN where fewer than 2 observations)
+    """
+    x = np.asarray(x, dtype='float64')[:, None]
+    y = np.asarray(y, dtype='float64')
+    observed = ~np.isnan(y)
+    y0 = np.where(observed, y, 0.0)
+    n = observed.sum(axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = (observed * x).sum(axis=0) / n
+        y_mean = y0.sum(axis=0) / n
+        dx = np.where(observed, x - x_mean, 0.0)
+        dy = np.where(observed, y0 - y_mean, 0.0)
+        slope = (dx * dy).sum(axis=0) / (dx * dx).sum(axis=0)
+        intercept = y_mean - slope * x_mean
+
+        residuals = np.where(observed, y0 - (intercept + slope * x), 0.0)
+        sse = (residuals * residuals).sum(axis=0)
+        sst = (dy * dy).sum(axis=0)
+        resid_var = np.where(n > 2, sse / (n - 2), np.nan)
+        # Same convention as sklearn's r2_score for constant series
+        r2 = np.where(sst > 0, 1.0 - sse / sst, np.where(sse > 0, 0.0, 1.0))
+
+    invalid = n < 2
+    for values in (slope, intercept, resid_var, r2):
+        values[invalid] = np.nan
+    return {'slope': slope, 'intercept': intercept, 'resid_var': resid_var, 'r2': r2, 'n': n}
+
+
+def r_squared(actual, predicted):
+    """Coefficient of determination, with sklearn's convention for constant series"""
+    actual = np.asarray(actual, dtype='float64')
+    predicted = np.asarray(predicted, dtype='float64')
+    sse = ((actual - predicted) ** 2).sum()
+    sst = ((actual - actual.mean()) ** 2).sum()
+    if sst > 0:
+        return float(1.0 - sse / sst)
+    return 0.0 if sse > 0 else 1.0
+
+
+def fit_series(years, values):
+    """
+    Fit a single series
+
+    Args:
+        years (array-like): Years
+        values (array-like): ASR values
+
+    Returns:
+        TrendModel: Fitted line
+    """
+    fit = fit_lines(years, np.asarray(values, dtype='float64')[:, None])
+    return TrendModel(*(plain_value(fit[name][0]) for name in TrendModel._fields))
@@ -0,0 +1,125 @@
+# %%
+# wsgi.py - Production entry point
+#
+# Usage: gunicorn -c gunicorn.conf.py wsgi:server
+#
+# With preload_app (gunicorn.conf.py) this module is imported once by the
+# gunicorn master: every dataset, index, model and map layer is built here,
+# the NumPy arrays behind them are made read-only and the objects are moved
+# out of the garbage collector's reach (gc.freeze) before the workers are
+# forked. Workers then share those pages copy-on-write instead of each
+# loading its own copy; see memory_report.py for the per-worker breakdown.
+#
+# Only numeric arrays (including the codes of categoricals) stay fully shared.
+# Object columns and the labels of categoricals are Python objects: every
+# access updates their reference counts, which writes to their pages and
+# copies those into the worker even though gc.freeze keeps the collector away.
+import gc
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+import app
+import dataloader
+import geometry
+
+
+# %%
+def _frame_arrays(obj):
+    """Non-object NumPy arrays holding the values of a DataFrame or Series, one per column"""
+    # iloc, unlike items(), does not keep the column Series in the frame's cache
+    columns = [obj] if isinstance(obj, pd.Series) else [obj.iloc[:, i] for i in range(obj.shape[1])]
+    arrays = []
+    for column in columns:
+        values = column.values
+        if isinstance(values, pd.Categorical):
+            # Read-only view of the codes; the labels are Python objects
+            arrays.append(values.codes)
+        elif isinstance(values, np.ndarray) and values.dtype != object:
+            arrays.append(values)
+    return arrays
+
+
+def _set_read_only(array):
+    """Mark an array and the arrays it is a view of read-only"""
+    # Column values are views: lock the base owning the memory as well, so
+    # new views pandas hands out later are read-only too
+    while isinstance(array, np.ndarray):
+        array.flags.writeable = False
+        array = array.base
+
+
+def freeze_arrays(obj, seen=None):
+    """
+    Mark every NumPy array reachable from ``obj`` read-only
+
+    Walks namespaces, containers, DataFrames/Series and the attributes of
+    plain objects (indexes, cubes, engines). A read-only array cannot be
+    written by accident after the fork, which would copy its pages into the
+    writing worker. Object arrays are walked, not locked: their items'
+    reference counts change on every read, so those pages are copied anyway.
+
+    DataFrames are reached through their public column values. That locks
+    every array pandas hands out (``.values``, ``to_numpy()``, categorical
+    codes) and the memory behind them, but not the views pandas keeps
+    internally: an in-place ``.loc`` assignment to a preloaded frame still
+    succeeds and copies the pages it touches into that worker.
+
+    Args:
+        obj: Root object, e.g. app.get_data()
+        seen (set): Ids already visited (internal)
+
+    Returns:
+        int: Bytes of array data frozen
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        if obj.dtype != object:
+            _set_read_only(obj)
+            return obj.nbytes
+        return sum(freeze_arrays(item, seen) for item in obj.ravel())
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        # The column views are temporaries, so they are not tracked in ``seen``
+        arrays = _frame_arrays(obj)
+        for array in arrays:
+            _set_read_only(array)
+        return sum(array.nbytes for array in arrays)
+    if isinstance(obj, dict):
+        return sum(freeze_arrays(value, seen) for value in obj.values())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sum(freeze_arrays(item, seen) for item in obj)
+    if isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        return 0
+    if isinstance(obj, SimpleNamespace) or type(obj).__module__ not in ('builtins', 'pandas', 'numpy'):
+        return sum(freeze_arrays(value, seen) for value in getattr(obj, '__dict__', {}).values())
+    return 0
+
+
+def preload():
+    """
+    Build everything the workers serve from and freeze it
+
+    Returns:
+        int: Bytes of array data frozen
+    """
+    data = app.get_data()
+    dataloader.load_geojson()
+    # Every boundary layer a map view can pick (see app.map_resolution)
+    for resolution in [app.MAP_RESOLUTION] if app.MAP_RESOLUTION else geometry.RESOLUTIONS:
+        geometry.load_geometry(resolution)
+        geometry.load_region_geometry(resolution)
+    frozen = freeze_arrays(data)
+    # Objects created so far are never scanned (or touched) by the collector again
+    gc.collect()
+    gc.freeze()
+    print(f"Preloaded dataset {data.dataset_version}: {frozen / 1e6:.1f} MB of arrays frozen, "
+          f"{gc.get_freeze_count()} objects frozen")
+    return frozen
+
+
+frozen_bytes = preload()
+server = app.server